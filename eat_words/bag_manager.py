@@ -1,9 +1,13 @@
 
 from __future__ import division, print_function, unicode_literals
 
-import random
+import os
+import struct
+import hashlib
 import collections
 
+import numpy as np
+
 import data_io as io
 
 # Static variables.
@@ -15,87 +19,272 @@ alphabet = ['a', 'b', 'c', 'd', 'e',
             'z', '_']
 
 
+##################################################
+#
+# Random number streams.  A seed is a tuple of integers, e.g. (1234,) for a top-level run.  Child
+# streams append their index, e.g. (1234, 0), (1234, 1), ... for each worker, then (1234, 0, 17) for
+# a rollout within worker 0.  The tuple is hashed into the generator's initial state, so streams
+# are reproducible from their seed alone and unrelated to each other, whatever process they end
+# up in.
+#
+
+def make_seed(seed=None):
+    """
+    Normalize seed to a tuple of integers.  Fresh entropy from the OS if None.
+    """
+    if seed is None:
+        seed = struct.unpack('<Q', os.urandom(8))[0]
+
+    if isinstance(seed, (tuple, list)):
+        return tuple(int(v) for v in seed)
+
+    return (int(seed),)
+
+
+
+def spawn_seeds(seed, count, start=0):
+    """
+    List of independent child seeds.
+    """
+    seed = make_seed(seed)
+    return [seed + (k,) for k in range(start, start + count)]
+
+
+
+def make_rng(seed=None):
+    """
+    Random generator for the supplied seed.  An existing generator is passed through unchanged.
+    """
+    if isinstance(seed, np.random.RandomState):
+        return seed
+
+    seed = make_seed(seed)
+    key = ','.join('%d' % v for v in seed).encode('ascii')
+    state = np.frombuffer(hashlib.sha256(key).digest(), dtype=np.uint32)
+
+    return np.random.RandomState(state)
+
+
 ##################################################
 
 class Bag(object):
     """
     A bag of scrabble letters.
-        
-    http://www.doughellmann.com/PyMOTW/collections/counter.html
-    
+
+    The whole state of the bag is one small list: a Fenwick tree over the letter counts, ordered as
+    the alphabet above, with the number of letters inside kept in its unused first slot.  Drawing a
+    random letter and putting one back both cost O(log alphabet), the count properties are O(1),
+    and snapshot() / restore() copy just that list.
+
+    http://en.wikipedia.org/wiki/Fenwick_tree
     """
 
-    def __init__(self, fname_definition):
+    def __init__(self, fname_definition, seed=None):
         """
         Create a new Bag instance.
         Definition file includes letter frequency and points.
+        Random draws come from the bag's own stream, given by seed, see make_rng().
         """
 
+        if isinstance(seed, np.random.RandomState):
+            self.seed = None
+        else:
+            self.seed = make_seed(seed)
+
+        self.rng = make_rng(seed if self.seed is None else self.seed)
+        self._num_spawned = 0
+
         # Load definition.
         definition = io.read(fname_definition)
 
-        self.letters_inside = collections.Counter()
-        self.letters_removed = collections.Counter()
         self.letter_points = {}
-
         for L in alphabet:
-            self.letters_inside[L] = definition['frequency'][L]
-            self.letters_removed[L] = 0
-            # self.point_value[L] = definition['points'][L]
+            self.letter_points[L] = definition['points'][L]
+
+        self._index = dict((L, k) for k, L in enumerate(alphabet))
+        self._frequency = [definition['frequency'][L] for L in alphabet]
+
+        self._count_total = sum(self._frequency)
+
+        self._set_counts(self._frequency)
+
+
+    def spawn(self, count=1):
+        """
+        Seeds for independent child streams, e.g. one per worker process or rollout.  Each call
+        returns new children.
+        """
+        if self.seed is None:
+            raise Exception('Bag built from an existing generator cannot spawn seeds.')
+
+        seeds = spawn_seeds(self.seed, count, self._num_spawned)
+        self._num_spawned += count
+
+        return seeds
+
+
+    def _set_counts(self, counts):
+        """
+        Set letters inside the bag and rebuild the Fenwick tree.
+        """
+        num = len(alphabet)
+
+        # Tree is 1-indexed, tree[k] holds the sum of a power-of-two range of counts ending at k.
+        self._tree = [sum(counts)] + list(counts)
+        for k in range(1, num+1):
+            parent = k + (k & -k)
+            if parent <= num:
+                self._tree[parent] += self._tree[k]
+
+        self._step = 1
+        while self._step*2 <= num:
+            self._step *= 2
+
+
+    def _update(self, ix, delta):
+        """
+        Add delta to count of letter at index ix.
+        """
+        tree = self._tree
+        tree[0] += delta
+
+        num = len(tree) - 1
+        k = ix + 1
+        while k <= num:
+            tree[k] += delta
+            k += k & -k
+
+
+    def _count(self, ix):
+        """
+        Count of letter at index ix.
+        """
+        tree = self._tree
+
+        k = ix + 1
+        count = tree[k]
+
+        parent = k - (k & -k)
+        k -= 1
+        while k > parent:
+            count -= tree[k]
+            k -= k & -k
+
+        return count
+
+
+    def _find(self, rank):
+        """
+        Index of letter holding the given rank, 0 <= rank < count_inside, among letters in the bag
+        laid out in alphabet order.
+        """
+        tree = self._tree
+        num = len(tree) - 1
+
+        pos = 0
+        step = self._step
+        while step:
+            k = pos + step
+            if k <= num and tree[k] <= rank:
+                pos = k
+                rank -= tree[k]
+            step //= 2
+
+        return pos
 
-            
-        self._count_total = sum(self.letters_inside.values())
 
-        
     @property
     def count_total(self):
         """
         Total number of letters, inside the bag plus any removed.
         """
         return self._count_total
-        
+
 
     @property
     def count_inside(self):
         """
         Number of letters remaining inside the bag.
-        """            
-        return sum(self.letters_inside.values())
-        
-        
+        """
+        return self._tree[0]
+
+
     @property
     def count_outside(self):
         """
         Number of letters removed from the bag.
-        """            
-        return sum(self.letters_removed.values())
+        """
+        return self._count_total - self._tree[0]
+
+
+    @property
+    def counts_inside(self):
+        """
+        Array of letter counts inside the bag, ordered as the alphabet.  Index is the letter code.
+        """
+        return np.asarray([self._count(ix) for ix in range(len(alphabet))], dtype=np.int32)
+
+
+    @property
+    def letters_inside(self):
+        """
+        Counter of letters remaining inside the bag.  A new Counter each time: changing it leaves
+        the bag alone, assign one back to set the bag's contents.
+        """
+        return collections.Counter(dict(zip(alphabet, self.counts_inside.tolist())))
+
+
+    @letters_inside.setter
+    def letters_inside(self, letters):
+        self._set_letters(dict((L, letters.get(L, 0)) for L in alphabet))
+
+
+    @property
+    def letters_removed(self):
+        """
+        Counter of letters removed from the bag.  A new Counter each time, as for letters_inside.
+        """
+        removed = [f - c for f, c in zip(self._frequency, self.counts_inside.tolist())]
+        return collections.Counter(dict(zip(alphabet, removed)))
+
+
+    @letters_removed.setter
+    def letters_removed(self, letters):
+        self._set_letters(dict((L, f - letters.get(L, 0)) for L, f in zip(alphabet, self._frequency)))
+
+
+    def _set_letters(self, letters_inside):
+        """
+        Set letters inside the bag from a mapping of letter counts.
+        """
+        counts = [letters_inside[L] for L in alphabet]
+        for L, c, f in zip(alphabet, counts, self._frequency):
+            if not 0 <= c <= f:
+                raise Exception('Accounting error.  Bag holds 0 to %d letters of type "%s", not %d.' %
+                                (f, L, c))
+
+        self._set_counts(counts)
 
 
     ####################################
-    
+
     def pick_letters(self, number=1):
         """
         Remove letters at random from among those remaining in the bag.
         Count them as "removed from the bag".
         """
 
-        if self.count_inside == 0:
-            return []
-
-        if number > self.count_inside:
-            number = self.count_inside
+        tree = self._tree
+        if number > tree[0]:
+            number = tree[0]
 
         letters = []
         for k in range(number):
-            L = self._random_letter()
-            
-            if not L:
-                break
-                
-            letters.append(L)
-            self.letters_inside[L] -= 1
-            self.letters_removed[L] += 1
-            
+            ix = self._find(self.rng.randint(tree[0]))
+            self._update(ix, -1)
+
+            letters.append(alphabet[ix])
+
         # Done.
         return letters
 
@@ -106,25 +295,53 @@ class Bag(object):
         Select random letter from those available.
         """
 
-        if self.count_inside == 0:
+        if self._tree[0] == 0:
             return None
-            
-        num_rand = random.randint(1, self.count_inside)
 
-        count = 0
-        for L in self.letters_inside.elements():
-            count += 1
-            if count >= num_rand:
-                return L
+        ix = self._find(self.rng.randint(self._tree[0]))
+
+        # Done.
+        return alphabet[ix]
+
+
+    def sample_racks(self, num_samples, number=7):
+        """
+        Draw num_samples independent sets of letters without replacement from the letters
+        currently in the bag.  Return array shaped (num_samples, number) of letter codes, indices
+        into the alphabet.  The bag itself is left untouched.
+
+        Each row is the first letters of an independent random shuffle of the bag contents: one
+        array of random keys, partially sorted along each row.
+        """
+        pool = np.repeat(np.arange(len(alphabet), dtype=np.int8), self.counts_inside)
+
+        number = min(number, len(pool))
+        if number == 0:
+            return np.zeros((num_samples, 0), dtype=np.int8)
+
+        keys = self.rng.random_sample( (num_samples, len(pool)) )
+        ix = np.argpartition(keys, number-1, axis=1)[:, :number]
 
-        # Should never get here??
-        raise Exception('Shound never get here?')
-        
         # Done.
+        return pool[ix]
 
 
     ###########################################
-    
+
+    def snapshot(self):
+        """
+        Copy of the bag's state, for restore().  The random stream is not included.
+        """
+        return list(self._tree)
+
+
+    def restore(self, state):
+        """
+        Return bag to a state from snapshot().  The same state may be restored any number of times.
+        """
+        self._tree[:] = state
+
+
     def replace_letters(self, letters):
         """
         Replace one or more previously-removed letters back to the bag.
@@ -133,13 +350,13 @@ class Bag(object):
 
         count = 0
         for L in letters:
+            ix = self._index[L]
+
             # Sanity check.
-            if self.letters_removed[L] == 0:
+            if self._count(ix) == self._frequency[ix]:
                 raise Exception('Accounting error.  All letters of type "%s" should already be in the bag.' % L)
 
-            # Decrement removal count.
-            self.letters_inside[L] += 1
-            self.letters_removed[L] -= 1
+            self._update(ix, 1)
             count += 1
 
 
@@ -176,3 +393,22 @@ if __name__ == '__main__':
     print(bag.pick_letters(5))
     print('count_inside: %d' % bag.count_inside)
 
+    bag = Bag(f)
+    racks = bag.sample_racks(10000)
+    print(racks.shape)
+    print(''.join(alphabet[c] for c in racks[0]))
+    print('count_inside: %d' % bag.count_inside)
+
+    # Reproducible streams.
+    seeds = Bag(f, seed=1234).spawn(3)
+    print(seeds)
+    print([Bag(f, seed=s).pick_letters(7) for s in seeds])
+    print([Bag(f, seed=s).pick_letters(7) for s in seeds])
+
+    # Rollouts from a saved state.
+    bag = Bag(f, seed=seeds[0])
+    state = bag.snapshot()
+    for k in range(3):
+        print(''.join(bag.pick_letters(30)), bag.count_inside)
+        bag.restore(state)
+
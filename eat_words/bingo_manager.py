@@ -0,0 +1,235 @@
+from __future__ import division, print_function, unicode_literals
+
+import os
+import collections
+
+import numpy as np
+
+import unseen_manager
+
+from board_manager import letters_mask
+
+
+#
+# Bingo lines.  Every seven letter word is a rack to aim for.  Every eight letter word gives one rack
+# per distinct letter that could already be on the board, the "through" letter.  Anagrams share a
+# rack, so the index holds one entry per distinct rack (and through letter) with its words.
+#
+# Drawing probabilities are exact multivariate hypergeometric sums, blanks in the leave or drawn
+# from the pool standing in for any letter.
+#
+
+class BingoIndex(object):
+    """
+    Letter counts of every bingo rack, shaped (num, 26) in letters_mask order, with through letters
+    (index into letters_mask, -1 for seven letter words), the words themselves and the probability of
+    drawing each rack from a full bag.
+    """
+
+    def __init__(self, counts, through, words, prob_full=None):
+        self.counts = np.asarray(counts, dtype=np.uint8)
+        self.through = np.asarray(through, dtype=np.int8)
+        self.words = np.asarray(words)
+        self.prob_full = prob_full
+
+        self._index = dict((L, k) for k, L in enumerate(letters_mask))
+
+        # Each rack's distinct letters and their counts, at most rack_size of them.
+        num_slots = int(self.counts.astype(bool).sum(axis=1).max()) if len(self.counts) else 0
+        order = np.argsort(-self.counts.astype(np.int16), axis=1, kind='mergesort')[:, :num_slots]
+
+        self._slot_letters = order
+        self._slot_counts = np.take_along_axis(self.counts, order, axis=1).astype(np.int16)
+
+
+    @classmethod
+    def from_words(cls, words, frequency=None, rack_size=7):
+        """
+        Build index from a word list.  If frequency (counts ordered as the bag's alphabet, blanks last)
+        is supplied, also compute probability of drawing each rack from a full bag.
+        """
+        groups = collections.defaultdict(list)
+        for w in words:
+            w = w.strip().lower()
+            if not w.isalpha() or len(w) not in (rack_size, rack_size+1):
+                continue
+
+            if len(w) == rack_size:
+                groups[(''.join(sorted(w)), -1)].append(w)
+            else:
+                for L in set(w):
+                    rack = ''.join(sorted(w.replace(L, '', 1)))
+                    groups[(rack, letters_mask.index(L))].append(w)
+
+        keys = sorted(groups)
+
+        counts = np.zeros((len(keys), len(letters_mask)), dtype=np.uint8)
+        for n, (rack, t) in enumerate(keys):
+            for L in rack:
+                counts[n, letters_mask.index(L)] += 1
+
+        through = [t for rack, t in keys]
+        words = [' '.join(groups[key]) for key in keys]
+
+        index = cls(counts, through, words)
+
+        if frequency is not None:
+            frequency = np.asarray(frequency)
+            index.prob_full = index.probabilities('', frequency, rack_size)[1]
+
+        # Done.
+        return index
+
+
+    def save(self, fname):
+        data = {'counts': self.counts, 'through': self.through, 'words': self.words}
+        if self.prob_full is not None:
+            data['prob_full'] = self.prob_full
+
+        np.savez(fname, **data)
+
+
+    @classmethod
+    def load(cls, fname):
+        with np.load(fname) as data:
+            prob_full = data['prob_full'] if 'prob_full' in data.files else None
+            return cls(data['counts'], data['through'], data['words'], prob_full)
+
+
+    ###########################################
+
+    def probabilities(self, letters_leave, pool, rack_size=7):
+        """
+        Probability of completing each bingo rack from the leave by drawing rack_size - len(leave)
+        tiles from the pool.  Pool is unseen letter counts ordered as the bag's alphabet, blanks
+        last, e.g. Unseen.counts.
+
+        Return (ix, prob): indices of entries reachable from the leave and their probabilities.
+        """
+        pool = np.asarray(pool, dtype=np.int64)
+        total = int(pool.sum())
+
+        leave = np.zeros(len(letters_mask), dtype=np.int16)
+        for L in letters_leave:
+            if L != '_':
+                leave[self._index[L]] += 1
+
+        num_draw = rack_size - len(letters_leave)
+        if num_draw < 0 or num_draw > total:
+            return np.zeros(0, dtype=np.int64), np.zeros(0)
+
+        # Leave letters must all be used in the rack, blanks fill the rest.
+        reachable = np.ones(len(self.counts), dtype=bool)
+        for k in np.flatnonzero(leave):
+            reachable &= self.counts[:, k] >= leave[k]
+
+        ix = np.flatnonzero(reachable)
+        letters = self._slot_letters[ix]
+        need = self._slot_counts[ix] - leave[letters]
+
+        # Coefficient m of prod over letters of sum_s C(pool[L], s) x**s, for s up to the number of L
+        # still needed, counts the ways of drawing m tiles that all go towards the rack.
+        comb = np.exp(unseen_manager.log_comb(pool[:-1, np.newaxis], np.arange(num_draw+1)))
+
+        ways = np.zeros((len(ix), num_draw+1))
+        ways[:, 0] = 1.
+        for k in range(need.shape[1]):
+            n = need[:, k]
+            if not n.any():
+                continue
+
+            ways_new = ways.copy()
+            for s in range(1, min(n.max(), num_draw) + 1):
+                weight = np.where(n >= s, comb[letters[:, k], s], 0.)
+                ways_new[:, s:] += weight[:, np.newaxis] * ways[:, :num_draw+1-s]
+            ways = ways_new
+
+        # The rest of the draw are blanks.
+        num_blank_pool = pool[-1]
+        prob = np.zeros(len(ix))
+        for j in range(min(num_draw, num_blank_pool) + 1):
+            prob += np.exp(unseen_manager.log_comb(num_blank_pool, j)) * ways[:, num_draw - j]
+
+        prob /= np.exp(unseen_manager.log_comb(total, num_draw))
+
+        # Done.
+        return ix, prob
+
+
+    def top_bingos(self, letters_leave, pool, number=10, letters_board=None, rack_size=7):
+        """
+        Most likely bingo lines for a leave.  Eight letter words are included only through letters
+        in letters_board, if supplied.
+
+        Return list of (probability, words, through letter or '').
+        """
+        ix, prob = self.probabilities(letters_leave, pool, rack_size)
+
+        if letters_board is not None:
+            allowed = np.zeros(len(letters_mask) + 1, dtype=bool)
+            allowed[-1] = True
+            for L in letters_board:
+                allowed[self._index[L.lower()]] = True
+
+            keep = allowed[self.through[ix]]
+            ix, prob = ix[keep], prob[keep]
+
+        order = np.argsort(-prob, kind='mergesort')[:number]
+
+        results = []
+        for k in order:
+            t = self.through[ix[k]]
+            results.append( (float(prob[k]), self.words[ix[k]], letters_mask[t] if t >= 0 else '') )
+
+        # Done.
+        return results
+
+
+
+def load_bingo_index(fname_words, fname_letters=None):
+    """
+    Bingo index for supplied word list.  Built and saved alongside on first use.
+    """
+    fname_index = os.path.splitext(fname_words)[0] + '.bingo.npz'
+
+    if os.path.isfile(fname_index):
+        return BingoIndex.load(fname_index)
+
+    with open(fname_words) as fo:
+        words = [w.decode('ascii') if isinstance(w, bytes) else w for w in fo.readlines()]
+
+    frequency = None
+    if fname_letters is not None:
+        frequency = unseen_manager.Unseen(fname_letters).frequency
+
+    index = BingoIndex.from_words(words, frequency)
+    index.save(fname_index)
+
+    # Done.
+    return index
+
+
+
+if __name__ == '__main__':
+
+    from timer import Timer
+
+    path_module = os.path.dirname(os.path.abspath(__file__))
+    path_words = os.path.join(path_module, 'data', 'words and letters')
+
+    fname_letters = os.path.join(path_words, 'letters_zynga.yml')
+
+    with Timer('Load index'):
+        index = load_bingo_index(os.path.join(path_words, 'words_zynga.txt'), fname_letters)
+
+    print('Entries: %d' % len(index.counts))
+
+    unseen = unseen_manager.Unseen(fname_letters)
+    unseen.set_rack('aeinrsq')
+
+    for leave in ['aeinrs', 'eirst', 'ers_', '']:
+        with Timer('Leave "%s"' % leave):
+            results = index.top_bingos(leave, unseen.counts, 5, letters_board='dgt')
+
+        for prob, words, through in results:
+            print('    %.5f %s %s' % (prob, through or '-', words))
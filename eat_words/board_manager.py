@@ -3,20 +3,93 @@ from __future__ import division, print_function, unicode_literals
 
 import numpy as np
 
+import layout_manager
+from layout_manager import ACROSS, DOWN
+
+
+# Letter bitmasks.  Bit k is set for the k-th letter of the alphabet.
+letters_mask = 'abcdefghijklmnopqrstuvwxyz'
+mask_all = np.uint32((1 << len(letters_mask)) - 1)
+
+_bits = dict((L, 1 << k) for k, L in enumerate(letters_mask))
+
+
+def letter_mask(letters):
+    """Return bitmask for supplied letters.  A blank '_' stands for every letter.
+    """
+    mask = 0
+    for L in letters:
+        if L == '_':
+            return mask_all
+        mask |= _bits[L.lower()]
+
+    return np.uint32(mask)
+
+
+def mask_letters(mask):
+    """Return string of letters set in supplied bitmask.
+    """
+    mask = int(mask)
+    return ''.join(L for L in letters_mask if mask & _bits[L])
+
+
+def points_table(letter_points):
+    """Lookup table of letter points indexed by character code.
+    Uppercase letters are played from a blank and score zero.
+    """
+    table = np.zeros(256, dtype=np.int32)
+    for L, p in letter_points.items():
+        if L in _bits:
+            table[ord(L)] = p
+
+    return table
+
+
+
+class IllegalMove(Exception):
+    """A proposed move breaks the rules of the game.
+    """
+    pass
+
+
+
+class LineSummary(object):
+    """Facts about one row or column used by move generation.
+    Positions are indices along the line, moat included.
+    """
+
+    def __init__(self, direction, index, letters, anchors, left_limits):
+        self.direction = direction
+        self.index = index
+
+        # Letters along the line.
+        self.letters = letters
+
+        # Anchor positions and, for each, how many empty non-anchor squares to its left a left
+        # part may use.  Zero when the anchor's left neighbor is a letter, since then the left part
+        # is that run of existing letters.
+        self.anchors = anchors
+        self.left_limits = left_limits
+
 
 
 class Board():
     """A scrabble board
     """
 
-    def __init__(self):
+    def __init__(self, layout='wwf', letter_points=None):
         """Instantiate a new board class.
-        Set multipliers.
+        Set multipliers from named board layout, e.g. 'wwf' or 'scrabble', or a compiled Layout.
+        Letter points used for scoring, e.g. Bag.letter_points.  Scores are zero if not supplied.
         No letters on the board.
         """
 
+        if not isinstance(layout, layout_manager.Layout):
+            layout = layout_manager.load_layout(layout)
+        self.layout = layout
+
         # Component boards
-        self.width = 15 + 2   # includes moat
+        self.width = self.layout.width   # includes moat
         shape = (self.width, self.width)
 
         self.letters = np.zeros(shape, dtype='|S1')
@@ -27,7 +100,16 @@ class Board():
 
         self.blank = '.'
 
-        self.playables = np.zeros(shape, dtype='|S7')
+        if letter_points is None:
+            letter_points = {}
+        self.points = points_table(letter_points)
+
+        # Cross-check bitmasks, indexed by [direction, i, j].  Letters allowed on a square by the
+        # words formed in the perpendicular direction, for a move played along given direction.
+        self.cross_checks = np.zeros((2,) + shape, dtype=np.uint32)
+
+        # Sum of letter points of the perpendicular word through each square, -1 if there is none.
+        self.cross_sums = np.zeros((2,) + shape, dtype=np.int32)
 
         self.reset()
 
@@ -39,7 +121,18 @@ class Board():
         """
 
         self.letters[:] = self.blank
+        self.cross_checks[:] = 0
+        self.cross_checks[:, 1:-1, 1:-1] = mask_all
+        self.cross_sums[:] = -1
         self._anchors = None
+
+        # Per-line summaries, indexed by [direction][line].  Lines needing a refresh of their
+        # summary or of the cross checks along them are kept as (direction, line) pairs.
+        self._summaries = [[None]*self.width, [None]*self.width]
+
+        lines = [(d, k) for d in [ACROSS, DOWN] for k in range(1, self.width-1)]
+        self._dirty_summaries = set(lines)
+        self._dirty_checks = set(lines)
         self._clear_tiles = None
 
         self._player_moves = []
@@ -77,68 +170,10 @@ class Board():
 
     def initialize_multipliers(self):
         """Set default values for letter and word multipliers.
+        Copied from the board layout's precompiled template, moat included.
         """
-
-        # First quadrant.
-        ij_DL = [[3, 2],
-                 [2, 3],
-                 [5, 3],
-                 [3, 5],
-                 [7, 5],
-                 [5, 7]]
-
-        ij_TL = [[7, 1],
-                 [4, 4],
-                 [6, 6],
-                 [1, 7]]
-
-        ij_DW = [[6, 2],
-                 [8, 4],
-                 [2, 6],
-                 [4, 8]]
-
-        ij_TW = [[4, 1],
-                 [1, 4]]
-
-        # DL.
-        for i,j in ij_DL:
-            self.xL[i, j] = 2                             # Q1
-            self.xL[self.width-i-1, j] = 2                # Q2
-            self.xL[self.width-i-1, self.width-j-1] = 2   # Q3
-            self.xL[i, self.width-j-1] = 2                # Q4
-
-        # TL.
-        for i,j in ij_TL:
-            self.xL[i, j] = 3                             # Q1
-            self.xL[self.width-i-1, j] = 3                # Q2
-            self.xL[self.width-i-1, self.width-j-1] = 3   # Q3
-            self.xL[i, self.width-j-1] = 3                # Q4
-
-        # DW.
-        for i,j in ij_DW:
-            self.xW[i, j] = 2                             # Q1
-            self.xW[self.width-i-1, j] = 2                # Q2
-            self.xW[self.width-i-1, self.width-j-1] = 2   # Q3
-            self.xW[i, self.width-j-1] = 2                # Q4
-
-        # TW.
-        for i,j in ij_TW:
-            self.xW[i, j] = 3                             # Q1
-            self.xW[self.width-i-1, j] = 3                # Q2
-            self.xW[self.width-i-1, self.width-j-1] = 3   # Q3
-            self.xW[i, self.width-j-1] = 3                # Q4
-
-
-        # Moat around the edges.
-        self.xL[ 0, :] = 0
-        self.xL[-1, :] = 0
-        self.xL[:,  0] = 0
-        self.xL[:, -1] = 0
-
-        self.xW[ 0, :] = 0
-        self.xW[-1, :] = 0
-        self.xW[:,  0] = 0
-        self.xW[:, -1] = 0
+        self.xL[:] = self.layout.xL
+        self.xW[:] = self.layout.xW
 
         # Done.
 
@@ -146,9 +181,12 @@ class Board():
     #########################################
     # Line stuff.
     def get_line(self, j):
+        """Letters along row j, with anchor points marked as '+'.
+        Also return cross-check bitmasks for a move played along the row.
+        """
 
         # Get the board letters
-        line = self.letters[:, j]
+        line = self.letters[:, j].copy()
 
         # Identify anchor points
         for i in range(self.width):
@@ -156,16 +194,187 @@ class Board():
                 line[i] = '+'
 
         # Playable letters
-        playable = np.zeros(self.width, dtype='|S7')
-
-        # Update
-        for i in range(self.width):
-            if line[i] == '+':
-                playable[i] = self.playables[i, j]
+        playable = self.cross_checks[ACROSS, :, j].copy()
 
         # Done.
         return line, playable
 
+    def line(self, arr, direction, k):
+        """View of board array along line k: row k for ACROSS, column k for DOWN.
+        """
+        if direction == ACROSS:
+            return arr[:, k]
+        else:
+            return arr[k, :]
+
+
+    def line_summary(self, direction, k):
+        """Summary of line k in given direction, refreshed only if letters nearby have changed.
+        """
+        if (direction, k) in self._dirty_summaries:
+            self._summaries[direction][k] = self._summarize_line(direction, k)
+            self._dirty_summaries.discard( (direction, k) )
+
+        return self._summaries[direction][k]
+
+
+    def _summarize_line(self, direction, k):
+        """Build summary for one line from the board letters.
+        """
+        letters = self.line(self.letters, direction, k).copy()
+        occupied = letters != self.blank
+
+        # Anchors: empty squares next to a letter along this line or either neighbor line.
+        neighbor = np.zeros(self.width, dtype=bool)
+        neighbor[1:] |= occupied[:-1]
+        neighbor[:-1] |= occupied[1:]
+        neighbor |= self.line(self.letters, direction, k-1) != self.blank
+        neighbor |= self.line(self.letters, direction, k+1) != self.blank
+
+        is_anchor = ~occupied & neighbor
+        is_anchor[0] = False
+        is_anchor[-1] = False
+
+        if self.is_empty:
+            # First move is anchored on the start square.
+            i, j = self.layout.start
+            a, b = (j, i) if direction == ACROSS else (i, j)
+            if a == k:
+                is_anchor[b] = True
+
+        anchors = np.flatnonzero(is_anchor)
+
+        # Left part limits.
+        limit_max = self.layout.rack_size - 1
+        left_limits = np.zeros(len(anchors), dtype=int)
+        for n, a in enumerate(anchors):
+            q = a - 1
+            while q >= 1 and not occupied[q] and not is_anchor[q] and left_limits[n] < limit_max:
+                left_limits[n] += 1
+                q -= 1
+
+        # Done.
+        return LineSummary(direction, k, letters, anchors, left_limits)
+
+
+    @property
+    def is_empty(self):
+        """True if there are no letters on the board.
+        """
+        return not np.any(self.letters != self.blank)
+
+
+    def _touch(self, ij_letters):
+        """Mark lines affected by letters changed at given squares.
+        Summaries of each square's row and column and of their neighbor lines (anchors move), and
+        cross checks along each square's row and column.
+        """
+        for ij, L in ij_letters:
+            i, j = ij
+
+            for k in [j-1, j, j+1]:
+                if 1 <= k <= self.width-2:
+                    self._dirty_summaries.add( (ACROSS, k) )
+
+            for k in [i-1, i, i+1]:
+                if 1 <= k <= self.width-2:
+                    self._dirty_summaries.add( (DOWN, k) )
+
+            self._dirty_checks.add( (ACROSS, j) )
+            self._dirty_checks.add( (DOWN, i) )
+
+        # Start square anchor comes and goes with an empty board.
+        i, j = self.layout.start
+        self._dirty_summaries.add( (ACROSS, j) )
+        self._dirty_summaries.add( (DOWN, i) )
+
+    #########################################
+    # Cross checks.
+    def update_cross_checks(self, dawg):
+        """Bring cross-check bitmasks and cross sums up to date from the supplied dictionary.
+        Only lines whose letters changed since the last update are recomputed.
+        Empty squares with no perpendicular neighbors accept any letter.  Occupied squares and
+        the moat accept none.
+        """
+        for direction, k in self._dirty_checks:
+            self._check_line(dawg, direction, k)
+
+        self._dirty_checks = set()
+
+        # Done.
+
+
+    def _check_line(self, dawg, direction, k):
+        """Cross checks for squares along line k, for moves played across it.
+        These depend only on the letters of this line.
+        """
+        other = DOWN if direction == ACROSS else ACROSS
+
+        letters = self.line(self.letters, direction, k)
+        masks = self.line(self.cross_checks[other], direction, k)
+        sums = self.line(self.cross_sums[other], direction, k)
+
+        occupied = letters != self.blank
+
+        masks[1:-1] = mask_all
+        masks[occupied] = 0
+        sums[:] = -1
+
+        # Empty squares next to a run of letters along this line.
+        touching = np.zeros(self.width, dtype=bool)
+        touching[1:] |= occupied[:-1]
+        touching[:-1] |= occupied[1:]
+        touching &= ~occupied
+        touching[0] = False
+        touching[-1] = False
+
+        for q in np.flatnonzero(touching):
+            letters_pre = letters[q:q]
+            if occupied[q-1]:
+                q_beg, q_end = self._run_extent(letters, q-1, q-1)
+                letters_pre = letters[q_beg:q]
+
+            letters_post = letters[q+1:q+1]
+            if occupied[q+1]:
+                q_beg, q_end = self._run_extent(letters, q+1, q+1)
+                letters_post = letters[q+1:q_end+1]
+
+            masks[q] = self._cross_check_mask(dawg, letters_pre.tostring().lower(),
+                                              letters_post.tostring().lower())
+            sums[q] = np.sum(self.points[letters_pre.view(np.uint8)]) + \
+                      np.sum(self.points[letters_post.view(np.uint8)])
+
+        # Done.
+
+
+    def _cross_check_mask(self, dawg, letters_pre, letters_post):
+        """Bitmask of letters L for which letters_pre + L + letters_post is a word.
+        Walk the prefix once, then try each outgoing edge against the suffix.
+        """
+        node = dawg.root
+        for L in letters_pre:
+            if L not in node.edges:
+                return 0
+            node = node.edges[L]
+
+        mask = 0
+        for L, child in node.edges.items():
+            if L not in _bits:
+                # Skip reversed-prefix edges in a Daggad.
+                continue
+
+            for M in letters_post:
+                if M not in child.edges:
+                    child = None
+                    break
+                child = child.edges[M]
+
+            if child is not None and child.final:
+                mask |= _bits[L]
+
+        # Done.
+        return mask
+
     #########################################
     def set_game_letters(self, ij_letters):
         """Place initial game letters on the board.  Clobber any multipliers underneath.
@@ -178,6 +387,7 @@ class Board():
 
 
         self._anchors = None
+        self._touch(ij_letters)
 
     def play_letters(self, ij_letters):
         """Place new letters on the board.
@@ -202,6 +412,8 @@ class Board():
             # Store move for later undo.
             self._player_moves.append( (ij, L) )
 
+        self._touch(ij_letters)
+
     def unplay_letters(self):
         """Undo just-played letters.
         """
@@ -216,10 +428,138 @@ class Board():
             self.letters[i, j] = self.blank
 
         # Done.
+        self._touch(self._player_moves)
+        self._anchors = None
         self._player_moves = []
 
         return count
 
+    ##############################################
+    # Move validation.
+    def validate_move(self, ij_letters, dawg):
+        """Check a complete move against the board and dictionary.
+        Letters are lowercase, or uppercase when played from a blank.
+        Return score and list of words formed.  Raise IllegalMove if the move breaks the rules.
+        """
+        if not ij_letters:
+            raise IllegalMove('No letters played')
+
+        ii = np.asarray([ij[0] for ij, L in ij_letters])
+        jj = np.asarray([ij[1] for ij, L in ij_letters])
+        letters = np.asarray([L for ij, L in ij_letters], dtype='|S1')
+        num = len(letters)
+
+        # Placement.
+        if ii.min() < 1 or jj.min() < 1 or ii.max() > self.width-2 or jj.max() > self.width-2:
+            raise IllegalMove('Letters placed off the board')
+
+        if np.any(self.letters[ii, jj] != self.blank):
+            raise IllegalMove('Letters placed on occupied squares')
+
+        if len(set(zip(ii, jj))) != num:
+            raise IllegalMove('Letters placed on the same square')
+
+        # Collinear.  A single letter is treated as played along its row.
+        if np.all(jj == jj[0]):
+            direction = ACROSS
+            letters_main = self.letters[:, jj[0]]
+            xL_main = self.xL[:, jj[0]]
+            xW_main = self.xW[:, jj[0]]
+            kk, kk_cross = ii, jj
+        elif np.all(ii == ii[0]):
+            direction = DOWN
+            letters_main = self.letters[ii[0], :]
+            xL_main = self.xL[ii[0], :]
+            xW_main = self.xW[ii[0], :]
+            kk, kk_cross = jj, ii
+        else:
+            raise IllegalMove('Letters not in a single row or column')
+
+        # Contiguous main word.
+        line = letters_main.copy()
+        line[kk] = letters
+
+        k_beg, k_end = self._run_extent(line, kk.min(), kk.max())
+        num_existing = np.sum(letters_main[k_beg:k_end+1] != self.blank)
+        if k_end - k_beg + 1 != num + num_existing:
+            raise IllegalMove('Letters not contiguous')
+
+        new = np.zeros(self.width, dtype=bool)
+        new[kk] = True
+
+        words = []
+        spans = []
+        if k_end > k_beg:
+            words.append(line[k_beg:k_end+1])
+            spans.append( (line[k_beg:k_end+1], xL_main[k_beg:k_end+1],
+                           xW_main[k_beg:k_end+1], new[k_beg:k_end+1]) )
+
+        # Cross words, one per placed letter.
+        for k, c, L in zip(kk, kk_cross, letters):
+            if direction == ACROSS:
+                line = self.letters[k, :].copy()
+                xL_line = self.xL[k, :]
+                xW_line = self.xW[k, :]
+            else:
+                line = self.letters[:, k].copy()
+                xL_line = self.xL[:, k]
+                xW_line = self.xW[:, k]
+
+            line[c] = L
+            c_beg, c_end = self._run_extent(line, c, c)
+            if c_end > c_beg:
+                new_cross = np.zeros(c_end - c_beg + 1, dtype=bool)
+                new_cross[c - c_beg] = True
+
+                words.append(line[c_beg:c_end+1])
+                spans.append( (line[c_beg:c_end+1], xL_line[c_beg:c_end+1],
+                               xW_line[c_beg:c_end+1], new_cross) )
+
+        # Connected to existing letters, or covering the start square on an empty board.
+        if np.any(self.letters[1:-1, 1:-1] != self.blank):
+            num_cross = len(words) - int(k_end > k_beg)
+            if num_existing == 0 and num_cross == 0:
+                raise IllegalMove('Letters not connected to existing letters')
+        else:
+            if not np.any((ii == self.layout.start[0]) & (jj == self.layout.start[1])):
+                raise IllegalMove('First move must cover the start square')
+
+        if not words:
+            raise IllegalMove('No word formed')
+
+        # Dictionary, all words at once.
+        words = [w.tostring().lower() for w in words]
+        missing = dawg.search_words(words)
+        if missing:
+            raise IllegalMove('Not in dictionary: %s' % ', '.join(missing))
+
+        # Score.
+        score = 0
+        for line, xL_span, xW_span, new_span in spans:
+            points = self.points[line.view(np.uint8)]
+            xL_span = np.where(new_span, xL_span, 1)
+            xW_span = np.where(new_span, xW_span, 1)
+
+            score += np.sum(points * xL_span) * np.prod(xW_span)
+
+        if num == self.layout.rack_size:
+            score += self.layout.bingo_bonus
+
+        # Done.
+        return int(score), words
+
+
+    def _run_extent(self, line, k_beg, k_end):
+        """First and last index of the run of letters in line covering k_beg through k_end.
+        Relies on the empty moat at either end of the line.
+        """
+        occupied = line != self.blank
+
+        k_beg -= np.argmin(occupied[k_beg::-1]) - 1
+        k_end += np.argmin(occupied[k_end:]) - 1
+
+        return k_beg, k_end
+
     ##############################################
 
     @property
@@ -0,0 +1,101 @@
+from __future__ import division, print_function, unicode_literals
+
+import numpy as np
+
+from bag_manager import alphabet
+
+
+#
+# Exchange analysis.  Every way of splitting the rack into tiles kept and tiles exchanged is valued
+# by the expected leave value of the rack after refilling from the unseen pool.
+#
+# Racks with repeated letters have fewer distinct splits than subsets (aaeeirt has 71, not 127), so
+# splits are enumerated directly as multisets: every combination of 0..count copies of each letter.
+#
+
+def kept_counts(rack_counts):
+    """
+    All distinct multisets of letters that may be kept from a rack, as counts shaped (num, 27).
+    The full rack is excluded, an exchange returns at least one tile.
+    """
+    rack_counts = np.asarray(rack_counts)
+    ix = np.flatnonzero(rack_counts)
+
+    grids = np.indices(rack_counts[ix] + 1).reshape(len(ix), -1).T
+
+    kept = np.zeros((len(grids), len(alphabet)), dtype=np.int32)
+    kept[:, ix] = grids
+
+    # Drop the last combination, the full rack.
+    return kept[:-1]
+
+
+
+def evaluate_exchanges(letters_rack, unseen, table):
+    """
+    Rank every exchange of rack tiles by the expected leave value of the refilled rack.
+
+    The unseen pool (an unseen_manager.Unseen with our rack set) supplies the draw distribution,
+    and the leave table (a leave_manager.LeaveTable) the values.  Exchanges of more tiles than the
+    bag holds are skipped.
+
+    Return list of (value, letters_kept, letters_exchanged), sorted by decreasing value.
+    """
+    rack = table.counts(letters_rack)
+    if not rack.any():
+        return []
+
+    kept = kept_counts(rack)
+
+    num_draw = rack.sum() - kept.sum(axis=1)
+
+    values = np.zeros(len(kept))
+    for d in np.unique(num_draw):
+        if d > unseen.count_bag:
+            values[num_draw == d] = -np.inf
+            continue
+
+        which = num_draw == d
+        values[which] = table.expected_value(kept[which], unseen.pmf(d))
+
+    order = np.argsort(-values, kind='mergesort')
+
+    results = []
+    for k in order:
+        if values[k] == -np.inf:
+            break
+
+        letters_kept = ''.join(L*c for L, c in zip(alphabet, kept[k]))
+        letters_exchanged = ''.join(L*c for L, c in zip(alphabet, rack - kept[k]))
+
+        results.append( (float(values[k]), letters_kept, letters_exchanged) )
+
+    # Done.
+    return results
+
+
+
+if __name__ == '__main__':
+    import os
+
+    import leave_manager
+    import unseen_manager
+
+    from timer import Timer
+
+    path_module = os.path.dirname(os.path.abspath(__file__))
+    path_words = os.path.join(path_module, 'data', 'words and letters')
+
+    table = leave_manager.read_leaves(os.path.join(path_words, 'leaves_zynga.yml'))
+    unseen = unseen_manager.Unseen(os.path.join(path_words, 'letters_zynga.yml'))
+
+    for rack in ['iiuuvwq', 'aaeeirt', 'sqvwxyz']:
+        unseen.reset()
+        unseen.set_rack(rack)
+
+        with Timer('Exchanges %s' % rack):
+            results = evaluate_exchanges(rack, unseen, table)
+
+        print(len(results))
+        for value, keep, swap in results[:5]:
+            print('    %6.2f keep %-7s swap %s' % (value, keep, swap))
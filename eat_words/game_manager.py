@@ -65,20 +65,9 @@ print(letters_rack)
 #
 # Cross check.
 #
-for i, j in board.anchors:
-
-    ij_pre, letters_pre = board.contiguous_vertical( (i, j-1) )
-    ij_post, letters_post = board.contiguous_vertical( (i, j+1) )
-
-    board.playables[i, j] = ''
-
-    # Loop over rack letters, establish wich are playable.
-    for L in letters_rack:
-        word_test = letters_pre + L + letters_post
-        if daggad.search(word_test):
-            board.playables[i, j] += L
-
+board.update_cross_checks(daggad)
 
+mask_rack = board_manager.letter_mask(letters_rack)
 
 
 #
@@ -87,15 +76,13 @@ for i, j in board.anchors:
 j = 15
 line, playable = board.get_line(j)
 print(line)
-print(playable)
 
-# Pretty print.
+# Pretty print rack letters playable at each square.
 template = '%1s  %1s  %1s  %1s  %1s  %1s  %1s  %1s  %1s  %1s  %1s  %1s  %1s  %1s  %1s  %1s  %1s'
 print()
 
-val = [v for v in playable]
-for k in range(7):
+val = [board_manager.mask_letters(m & mask_rack) for m in playable]
+for k in range(max(len(v) for v in val)):
     line = [v[:1] for v in val]
     print(template % tuple(line))
     val = [v[1:] for v in val]
-
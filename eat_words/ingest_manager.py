@@ -0,0 +1,246 @@
+from __future__ import division, print_function, unicode_literals
+
+import os
+import sys
+import glob
+import json
+import time
+import struct
+import collections
+import multiprocessing
+
+import data_io as io
+
+import tiles
+
+
+#
+# Batch screenshot ingestion.  Screenshots are decoded and parsed across a process pool, each worker
+# loading the config and reference tiles once.  One JSON record per image is written as results
+# arrive, in input order:
+#
+#     {"image": ..., "board": [[i, j, letter], ...], "rack": ..., "error": null,
+#      "time_decode": ..., "time_carve": ..., "time_match": ...}
+#
+# Board coordinates are as in Board.set_game_letters.  A screenshot that fails to parse gets a
+# record with its error message and no letters.
+#
+# Screenshots may come from devices of any resolution.  Before the workers start, image sizes are
+# read from the PNG headers and each size neither in the config nor in the geometry cache file is
+# calibrated once, from the first of its screenshots that parses, see tiles.calibrated_config().
+# Workers get the geometry from the parent and never write the cache.
+#
+
+stages = ['decode', 'calibrate', 'carve', 'match']
+
+
+def find_images(source):
+    """
+    Screenshot files from a folder, a glob pattern, or a list of either.
+    """
+    if isinstance(source, (list, tuple)):
+        fnames = []
+        for s in source:
+            fnames.extend(find_images(s))
+        return fnames
+
+    if os.path.isdir(source):
+        source = os.path.join(source, '*.png')
+
+    return sorted(glob.glob(source))
+
+
+
+def image_size(fname):
+    """
+    Width and height of a PNG file, read from its header.  None if not a PNG file.
+    """
+    with open(fname, 'rb') as fo:
+        header = fo.read(24)
+
+    if len(header) < 24 or header[:8] != b'\x89PNG\r\n\x1a\n' or header[12:16] != b'IHDR':
+        return None
+
+    return struct.unpack(str('>II'), header[16:24])
+
+
+
+def calibrate_sizes(fnames, info_config, reference_grid, reference_rack, fname_geometry,
+                    num_tries=3):
+    """
+    Geometry for every image size among the screenshots, keyed by image size.  Sizes not already
+    known are calibrated from the first of up to num_tries of their screenshots that parses, and
+    saved to fname_geometry.  Sizes failing every try are None.
+    """
+    groups = collections.OrderedDict()
+    for fname in fnames:
+        try:
+            size = image_size(fname)
+        except IOError:
+            continue
+
+        if size is not None:
+            groups.setdefault(tiles.image_key(size[::-1]), []).append(fname)
+
+    geometry = {}
+    for key, group in groups.items():
+        geometry[key] = None
+        for fname in group[:num_tries]:
+            try:
+                img, meta = io.read(fname)
+                info = tiles.calibrated_config(img, info_config, reference_grid, reference_rack,
+                                               fname_geometry)
+            except Exception:
+                continue
+
+            geometry[key] = {'grid_parameters': info['grid_parameters'],
+                             'rack_parameters': info['rack_parameters']}
+            break
+
+    # Done.
+    return geometry
+
+
+##################################################
+# Worker processes.
+
+_worker = {}
+
+def _initialize_worker(fname_config, geometry):
+    _worker['config'] = io.read(fname_config)
+    _worker['reference'] = tiles.load_reference_tiles()
+
+    tiles.seed_geometry(geometry)
+
+
+
+def _parse(fname):
+    record = {'image': fname, 'board': [], 'rack': '', 'error': None}
+    for stage in stages:
+        record['time_%s' % stage] = 0.
+
+    try:
+        time_start = time.time()
+        img, meta = io.read(fname)
+        time_decode = time.time()
+
+        reference_grid, reference_rack = _worker['reference']
+        info_config = tiles.calibrated_config(img, _worker['config'], reference_grid, reference_rack)
+        time_calibrate = time.time()
+
+        tiles_grid = tiles.carve_grid(img, info_config)
+        tiles_rack = tiles.carve_rack(img, info_config)
+        time_carve = time.time()
+
+        letters_grid, letters_rack = tiles.match_game_letters(tiles_grid, tiles_rack,
+                                                              reference_grid, reference_rack,
+                                                              info_config)
+        time_match = time.time()
+
+    except Exception as e:
+        record['error'] = '%s' % e
+        return record
+
+    record['board'] = [[int(ij[0]), int(ij[1]), letter] for ij, letter in letters_grid]
+    record['rack'] = letters_rack
+
+    record['time_decode'] = time_decode - time_start
+    record['time_calibrate'] = time_calibrate - time_decode
+    record['time_carve'] = time_carve - time_calibrate
+    record['time_match'] = time_match - time_carve
+
+    # Done.
+    return record
+
+
+##################################################
+
+def ingest(source, fname_out=None, processes=None, fname_config=None, chunksize=4,
+           fname_geometry=None):
+    """
+    Parse every screenshot in source, see find_images(), writing JSON Lines to fname_out
+    (standard output if None).  Calibrated geometry is cached in fname_geometry, by default
+    tiles.default_geometry_cache().
+
+    Return summary: counts of images and errors, images per second, seconds spent calibrating
+    before the workers start, and seconds per image spent in each stage, summed over workers.
+    """
+    path_module = os.path.dirname(os.path.abspath(__file__))
+    if fname_config is None:
+        fname_config = os.path.join(path_module, 'data', 'config.yml')
+
+    if fname_geometry is None:
+        fname_geometry = tiles.default_geometry_cache()
+
+    fnames = find_images(source)
+
+    time_start = time.time()
+    reference_grid, reference_rack = tiles.load_reference_tiles()
+    geometry = calibrate_sizes(fnames, io.read(fname_config), reference_grid, reference_rack,
+                               fname_geometry)
+    time_geometry = time.time() - time_start
+
+    fo = sys.stdout if fname_out is None else open(fname_out, 'w')
+
+    summary = {'images': 0, 'errors': 0}
+    for stage in stages:
+        summary['time_%s' % stage] = 0.
+
+    summary['time_geometry'] = time_geometry
+
+    pool = multiprocessing.Pool(processes, _initialize_worker, (fname_config, geometry))
+
+    time_start = time.time()
+    try:
+        for record in pool.imap(_parse, fnames, chunksize):
+            fo.write(json.dumps(record, sort_keys=True) + '\n')
+
+            summary['images'] += 1
+            summary['errors'] += record['error'] is not None
+            for stage in stages:
+                summary['time_%s' % stage] += record['time_%s' % stage]
+
+        pool.close()
+    except:
+        pool.terminate()
+        raise
+    finally:
+        pool.join()
+        if fo is not sys.stdout:
+            fo.close()
+
+    time_elapsed = time.time() - time_start
+
+    num = max(summary['images'], 1)
+    for stage in stages:
+        summary['time_%s' % stage] /= num
+
+    summary['images_per_second'] = summary['images'] / time_elapsed if time_elapsed else 0.
+
+    # Done.
+    return summary
+
+
+
+def print_summary(summary):
+    print('Images: %d, errors: %d, %.1f images per second' %
+          (summary['images'], summary['errors'], summary['images_per_second']), file=sys.stderr)
+
+    print('    %-9s %7.4f s' % ('geometry', summary['time_geometry']), file=sys.stderr)
+
+    for stage in stages:
+        print('    %-9s %7.4f s/image' % (stage, summary['time_%s' % stage]), file=sys.stderr)
+
+
+
+if __name__ == '__main__':
+
+    path_module = os.path.dirname(os.path.abspath(__file__))
+
+    if len(sys.argv) > 1:
+        source = sys.argv[1:]
+    else:
+        source = os.path.join(path_module, 'data', 'games')
+
+    summary = ingest(source)
+    print_summary(summary)
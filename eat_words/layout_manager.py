@@ -0,0 +1,120 @@
+from __future__ import division, print_function, unicode_literals
+
+import os
+import numpy as np
+
+import data_io as io
+
+
+# Premium square symbols used in layout files.
+symbols_xL = {'d': 2, 't': 3}
+symbols_xW = {'D': 2, 'T': 3, 'S': 2}
+
+# Line directions.  ACROSS lines are rows (fixed j), DOWN lines are columns (fixed i).
+ACROSS = 0
+DOWN = 1
+
+# Compiled layouts, keyed by name.
+_layouts = {}
+
+
+##################################################
+
+class Layout(object):
+    """
+    A compiled board layout: premium square multipliers plus the rule values that go with them.
+    Arrays include the one-square moat around the board and are read-only, shared by all boards
+    built from this layout.
+    """
+
+    def __init__(self, definition):
+        """
+        Compile layout definition, as read from a layout file.
+        """
+        self.name = definition['name']
+        self.rack_size = definition['rack_size']
+        self.bingo_bonus = definition['bingo_bonus']
+
+        grid = definition['grid']
+        size = len(grid)
+        for row in grid:
+            if len(row) != size:
+                raise Exception('Layout grid is not square: %s' % self.name)
+
+        self.width = size + 2   # includes moat
+        shape = (self.width, self.width)
+
+        # Point multipliers.  Moat squares are zero.
+        self.xL = np.zeros(shape, dtype=np.uint8)
+        self.xW = np.zeros(shape, dtype=np.uint8)
+
+        self.xL[1:-1, 1:-1] = 1
+        self.xW[1:-1, 1:-1] = 1
+
+        # Grid rows run down the board (j), characters run across (i).
+        for j, row in enumerate(grid):
+            for i, symbol in enumerate(row):
+                if symbol in symbols_xL:
+                    self.xL[i+1, j+1] = symbols_xL[symbol]
+                elif symbol in symbols_xW:
+                    self.xW[i+1, j+1] = symbols_xW[symbol]
+                elif symbol != '.':
+                    raise Exception('Invalid layout symbol: "%s"' % symbol)
+
+        self.start = tuple(definition['start'])
+
+        # Per-line premium summaries, indexed by [direction, line].  Used for scoring and for upper
+        # bounds when pruning move searches.
+        lines_xL = np.asarray([self.xL.T, self.xL])
+        lines_xW = np.asarray([self.xW.T, self.xW])
+
+        self.line_xL_max = lines_xL.max(axis=2)
+        self.line_xW_max = lines_xW.max(axis=2)
+        self.line_xW_product = np.prod(np.maximum(lines_xW, 1).astype(np.int32), axis=2)
+        self.line_premium_count = np.sum((lines_xL > 1) | (lines_xW > 1), axis=2)
+
+        for arr in [self.xL, self.xW, self.line_xL_max, self.line_xW_max,
+                    self.line_xW_product, self.line_premium_count]:
+            arr.flags.writeable = False
+
+        # Done.
+
+
+    def __repr__(self):
+        return 'Layout(%s)' % self.name
+
+
+
+def load_layout(name='wwf', path_base=None):
+    """
+    Return compiled board layout.  Layout files are read and compiled only once per process.
+    """
+    if name in _layouts:
+        return _layouts[name]
+
+    if path_base is None:
+        path_base = os.path.dirname(os.path.abspath(__file__))
+
+    fname = 'layout_%s.yml' % name
+    f = os.path.join(path_base, 'data', 'layouts', fname)
+    if not os.path.isfile(f):
+        raise Exception('Unknown board layout: %s' % name)
+
+    definition = io.read(f)
+    layout = Layout(definition)
+
+    _layouts[name] = layout
+
+    # Done.
+    return layout
+
+
+
+if __name__ == '__main__':
+
+    for name in ['wwf', 'scrabble']:
+        layout = load_layout(name)
+
+        print(layout)
+        print(layout.xW[1:-1, 1:-1].T)
+        print(layout.line_xW_product)
@@ -0,0 +1,138 @@
+from __future__ import division, print_function, unicode_literals
+
+import os
+import collections
+import numpy as np
+
+import data_io as io
+
+from bag_manager import alphabet
+
+
+##################################################
+
+class LeaveTable(object):
+    """
+    Value of the tiles left on a rack after a move.
+
+    The value of a leave is a sum over letters, values[L, c] for holding c copies of letter L, with
+    values[L, 0] = 0.  Being a sum of per-letter terms, the expected value of a rack refilled from
+    the unseen pool needs only each letter's marginal draw distribution.
+    """
+
+    def __init__(self, values, rack_size=7):
+        """
+        Table values shaped (27, rack_size+1), rows ordered as the bag's alphabet, blanks last.
+        """
+        values = np.asarray(values, dtype=np.float64)
+        if values.shape != (len(alphabet), rack_size+1):
+            raise Exception('Leave table has wrong shape: %s' % (values.shape,))
+
+        self.rack_size = rack_size
+        self.values = values
+
+        self._index = dict((L, k) for k, L in enumerate(alphabet))
+
+
+    @classmethod
+    def from_definition(cls, definition):
+        """
+        Build table from a leave definition, as read from a leave file.
+        """
+        rack_size = definition['rack_size']
+
+        values = np.zeros((len(alphabet), rack_size+1))
+        for k, L in enumerate(alphabet):
+            given = [0.] + list(definition['values'].get(L, []))
+            step = given[-1] - given[-2] if len(given) > 1 else 0.
+
+            for c in range(1, rack_size+1):
+                if c < len(given):
+                    values[k, c] = given[c]
+                else:
+                    values[k, c] = values[k, c-1] + step
+
+        # Done.
+        return cls(values, rack_size)
+
+
+    ###########################################
+
+    def counts(self, letters):
+        """
+        Letter counts for a rack or leave, ordered as the alphabet.
+        """
+        counts = np.zeros(len(alphabet), dtype=np.int32)
+        for L in letters:
+            counts[self._index[L]] += 1
+
+        return counts
+
+
+    def value(self, letters):
+        """
+        Value of keeping supplied letters.
+        """
+        counts = collections.Counter(letters)
+
+        return sum(self.values[self._index[L], c] for L, c in counts.items())
+
+
+    def value_counts(self, counts):
+        """
+        Values of many leaves at once, counts shaped (..., 27).
+        """
+        counts = np.minimum(counts, self.rack_size)
+
+        return self.values[np.arange(len(alphabet)), counts].sum(axis=-1)
+
+
+    def expected_value(self, counts, pmf):
+        """
+        Expected values of leaves after each draws more tiles.  Counts shaped (num, 27) for leaves
+        all drawing the same number of tiles, pmf shaped (27, num_draw+1) as from
+        unseen_manager.hypergeometric_pmf.
+        """
+        counts = np.asarray(counts)
+        x = np.arange(pmf.shape[1])
+
+        # Value after drawing x more copies of each letter, shaped (num, 27, num_draw+1).
+        held = np.minimum(counts[:, :, np.newaxis] + x, self.rack_size)
+        values = self.values[np.arange(len(alphabet))[:, np.newaxis], held]
+
+        return np.sum(values * pmf, axis=(1, 2))
+
+
+
+def read_leaves(fname):
+    """
+    Return LeaveTable from a leave file.  A .npy table, as written by write_leaves(), is
+    memory-mapped rather than read.
+    """
+    if os.path.splitext(fname)[1] == '.npy':
+        values = np.load(fname, mmap_mode='r')
+        return LeaveTable(values, values.shape[1] - 1)
+
+    definition = io.read(fname)
+
+    return LeaveTable.from_definition(definition)
+
+
+
+def write_leaves(fname, table):
+    """
+    Save table values to a .npy file.
+    """
+    np.save(fname, np.asarray(table.values))
+
+
+
+if __name__ == '__main__':
+
+    path_module = os.path.dirname(os.path.abspath(__file__))
+    f = os.path.join(path_module, 'data', 'words and letters', 'leaves_zynga.yml')
+
+    table = read_leaves(f)
+
+    for leave in ['s', 'ss', 'sss', '_', 'aeinr', 'qu', 'iiuuv']:
+        print('%8s %6.1f' % (leave, table.value(leave)))
@@ -0,0 +1,320 @@
+from __future__ import division, print_function, unicode_literals
+
+import numpy as np
+
+import bag_manager
+import move_manager
+import selfplay_manager
+import snapshot_manager
+import unseen_manager
+
+from board_manager import ACROSS, DOWN
+from bag_manager import alphabet
+
+
+#
+# Two-ply lookahead.  Each candidate move is valued as its score, plus leave value, less the
+# opponent's best reply score averaged over a weighted sample of racks they might hold.
+#
+# Opponent racks are a stratified sample: strata are the number of blanks and s's on the rack, each
+# given samples in proportion to its hypergeometric probability, with the remaining tiles drawn at
+# random within the stratum.  Sampling is seeded, so the same position always gets the same racks.
+#
+# The best reply along one line depends only on that line's letters, cross checks, cross sums and
+# multipliers, on the rack, and on the rules: rack size, bingo bonus, start square and letter
+# points.  Replies are cached per line under exactly that key, so after the first candidate only
+# lines it touched (its own line and the neighbours whose cross checks changed) are searched
+# again.  Whole-board replies are also cached under the rules, position hash and rack.  Each
+# distinct set of rules is numbered once, keeping keys short.
+#
+# Line keys hold nothing specific to one position, so cached lines keep paying off across turns and
+# games.  Both caches are bounded: each keeps two generations of at most cache_size entries, the
+# older dropped whole when the newer fills, and entries found in the older generation move back.
+#
+# Candidates are played on the caller's board and taken back again.  Letters the caller has
+# already played (Board.play_letters) stay on the board and are restored as pending afterwards.
+#
+
+_index = dict((L, k) for k, L in enumerate(alphabet))
+
+
+class _BoundedCache(object):
+    """
+    Dictionary holding at most 2*size entries, recently used ones kept.
+    """
+
+    def __init__(self, size):
+        self.size = size
+        self.clear()
+
+
+    def clear(self):
+        self._new = {}
+        self._old = {}
+
+
+    def get(self, key):
+        value = self._new.get(key)
+        if value is None:
+            value = self._old.get(key)
+            if value is not None:
+                self.put(key, value)
+
+        return value
+
+
+    def put(self, key, value):
+        if len(self._new) >= self.size:
+            self._old = self._new
+            self._new = {}
+
+        self._new[key] = value
+
+
+    def __len__(self):
+        return len(self._new) + len(self._old)
+
+
+
+class Lookahead(object):
+    """
+    Two-ply move selection, sharing opponent reply searches between candidates and positions.
+    """
+
+    def __init__(self, dawg, leaves=None, num_candidates=10, num_racks=16, seed=0,
+                 cache_size=100000):
+        self.dawg = dawg
+        self.leaves = leaves
+        self.num_candidates = num_candidates
+        self.num_racks = num_racks
+        self.seed = bag_manager.make_seed(seed)
+
+        self._line_cache = _BoundedCache(cache_size)
+        self._reply_cache = _BoundedCache(cache_size)
+        self._rules = {}
+
+
+    def clear(self):
+        """
+        Forget cached replies.
+        """
+        self._line_cache.clear()
+        self._reply_cache.clear()
+
+
+    ###########################################
+
+    def sample_racks(self, unseen):
+        """
+        Stratified sample of opponent racks from the unseen pool.
+        Return list of (letters_rack, weight), weights summing to one.
+        """
+        counts = unseen.counts
+        total = int(counts.sum())
+        size = min(unseen.rack_size, total)
+
+        if total <= unseen.rack_size:
+            return [(''.join(L*c for L, c in zip(alphabet, counts)), 1.)]
+
+        num_blank = int(counts[_index['_']])
+        num_s = int(counts[_index['s']])
+        num_rest = total - num_blank - num_s
+
+        rest = np.array(counts)
+        rest[_index['_']] = 0
+        rest[_index['s']] = 0
+        pool_rest = ''.join(L*c for L, c in zip(alphabet, rest))
+
+        # Stratum probabilities, P(b blanks and s s's on the rack).
+        strata = []
+        for b in range(min(num_blank, size) + 1):
+            for s in range(min(num_s, size - b) + 1):
+                if size - b - s > num_rest:
+                    continue
+
+                log_p = unseen_manager.log_comb(num_blank, b) + unseen_manager.log_comb(num_s, s) + \
+                        unseen_manager.log_comb(num_rest, size - b - s) - \
+                        unseen_manager.log_comb(total, size)
+                strata.append( (b, s, float(np.exp(log_p))) )
+
+        # Allocate samples by largest remainder.
+        share = np.asarray([p for b, s, p in strata]) * self.num_racks
+        allocation = np.floor(share).astype(int)
+        order = np.argsort(allocation - share, kind='mergesort')
+        allocation[order[:self.num_racks - allocation.sum()]] += 1
+
+        key = tuple(int(c) for c in counts)
+        rng = bag_manager.make_rng(self.seed + key)
+
+        racks = []
+        for (b, s, p), n in zip(strata, allocation):
+            for k in range(n):
+                ix = rng.choice(num_rest, size - b - s, replace=False)
+                letters = '_'*b + 's'*s + ''.join(pool_rest[i] for i in ix)
+                racks.append( (''.join(sorted(letters)), p / n) )
+
+        weight_total = sum(w for letters, w in racks)
+
+        # Done.
+        return [(letters, w / weight_total) for letters, w in racks]
+
+
+    ###########################################
+
+    def _rules_id(self, board):
+        """
+        Small number standing for the board's layout and letter points in cache keys.
+        """
+        layout = board.layout
+        key = (layout.rack_size, layout.bingo_bonus, tuple(layout.start),
+               layout.xL.tostring(), layout.xW.tostring(), board.points.tostring())
+
+        return self._rules.setdefault(key, len(self._rules))
+
+
+    def _line_best(self, board, direction, k, letters_rack, rules=None):
+        """
+        Best move score along one line, cached by line contents, rack and rules.
+        """
+        if rules is None:
+            rules = self._rules_id(board)
+
+        key = (rules, direction, k, letters_rack,
+               board.line(board.letters, direction, k).tostring(),
+               board.line(board.cross_checks[direction], direction, k).tostring(),
+               board.line(board.cross_sums[direction], direction, k).tostring(),
+               board.line(board.xL, direction, k).tostring(),
+               board.line(board.xW, direction, k).tostring())
+
+        best = self._line_cache.get(key)
+        if best is None:
+            moves = move_manager.generate_line_moves(board, self.dawg, direction, k, letters_rack)
+            best = max(score for score, ij_letters in moves) if moves else 0
+            self._line_cache.put(key, best)
+
+        return best
+
+
+    def best_reply(self, board, letters_rack, hash_value=None):
+        """
+        Score of the best move for supplied rack.  Board cross checks must be up to date.
+        """
+        rules = self._rules_id(board)
+
+        key = (rules, hash_value, letters_rack)
+        if hash_value is not None:
+            best = self._reply_cache.get(key)
+            if best is not None:
+                return best
+
+        best = 0
+        for direction in [ACROSS, DOWN]:
+            for k in range(1, board.width-1):
+                if len(board.line_summary(direction, k).anchors):
+                    best = max(best, self._line_best(board, direction, k, letters_rack, rules))
+
+        if hash_value is not None:
+            self._reply_cache.put(key, best)
+
+        return best
+
+
+    def evaluate(self, board, moves, letters_rack, unseen):
+        """
+        Value the top candidate moves, as from move_manager.generate_moves.  Unseen is an
+        unseen_manager.Unseen with our rack set.  The board is left as it was found, pending
+        letters from Board.play_letters included.
+
+        Return list of (value, move, mean_reply), sorted by decreasing value.
+        """
+        racks = self.sample_racks(unseen)
+
+        snapshot = snapshot_manager.BoardSnapshot.from_board(board)
+
+        # Pending letters stay put while candidates are played and taken back.
+        pending = board._player_moves
+        board._player_moves = []
+
+        results = []
+        try:
+            for move in moves[:self.num_candidates]:
+                score, ij_letters = move
+                hash_value = hash(snapshot.play(ij_letters))
+
+                board.play_letters(ij_letters)
+                board.update_cross_checks(self.dawg)
+
+                mean_reply = sum(w * self.best_reply(board, letters, hash_value)
+                                 for letters, w in racks)
+
+                board.unplay_letters()
+
+                value = score - mean_reply
+                if self.leaves is not None:
+                    value += self.leaves.value(selfplay_manager.rack_leave(letters_rack, ij_letters))
+
+                results.append( (value, move, mean_reply) )
+        finally:
+            board.unplay_letters()
+            board._player_moves = pending
+
+        board.update_cross_checks(self.dawg)
+
+        results.sort(key=lambda r: r[0], reverse=True)
+
+        # Done.
+        return results
+
+
+    def choose(self, board, letters_rack, unseen):
+        """
+        Best move by two-ply lookahead, or None if there is no legal move.
+        """
+        moves = move_manager.generate_moves(board, self.dawg, letters_rack)
+        if not moves:
+            return None
+
+        if self.leaves is not None:
+            moves.sort(key=lambda m: m[0] + self.leaves.value(selfplay_manager.rack_leave(letters_rack, m[1])),
+                       reverse=True)
+
+        return self.evaluate(board, moves, letters_rack, unseen)[0][1]
+
+
+
+if __name__ == '__main__':
+    import os
+    import trie_manager
+    import board_manager
+    import leave_manager
+
+    from timer import Timer
+
+    path_module = os.path.dirname(os.path.abspath(__file__))
+    path_words = os.path.join(path_module, 'data', 'words and letters')
+
+    dawg = trie_manager.load_daggad_arrays(os.path.join(path_words, 'words_zynga.txt'))
+    leaves = leave_manager.read_leaves(os.path.join(path_words, 'leaves_zynga.yml'))
+
+    f = os.path.join(path_words, 'letters_zynga.yml')
+    bag = bag_manager.Bag(f, seed=1234)
+    unseen = unseen_manager.Unseen(f)
+
+    board = board_manager.Board(letter_points=bag.letter_points)
+    board.set_game_letters([((6, 8), 'q'), ((7, 8), 'u'), ((8, 8), 'i'), ((9, 8), 'r'), ((10, 8), 'e')])
+    unseen.observe_board([((6, 8), 'q'), ((7, 8), 'u'), ((8, 8), 'i'), ((9, 8), 'r'), ((10, 8), 'e')])
+
+    rack = 'aeilnst'
+    unseen.set_rack(rack)
+
+    lookahead = Lookahead(dawg, leaves, num_candidates=10, num_racks=16)
+    moves = move_manager.generate_moves(board, dawg, rack)
+
+    with Timer('Two-ply'):
+        results = lookahead.evaluate(board, moves, rack, unseen)
+
+    for value, move, mean_reply in results[:5]:
+        print('%6.1f %4d %5.1f %s' % (value, move[0], mean_reply, move[1]))
+
+    with Timer('Two-ply again'):
+        lookahead.evaluate(board, moves, rack, unseen)
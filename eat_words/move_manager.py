@@ -0,0 +1,296 @@
+from __future__ import division, print_function, unicode_literals
+
+import collections
+
+import board_manager
+from board_manager import ACROSS, DOWN
+
+
+#
+# Move generation after Appel & Jacobson, walking a Daggad from each anchor square.  Starting at the
+# anchor the suffix is laid down rightwards in lowercase edges, then the reversed prefix leftwards in
+# uppercase edges.
+#
+# A move is a tuple (score, ij_letters), with ij_letters as accepted by Board.set_game_letters.
+# Letters played from a blank are uppercase.
+#
+
+_bits = dict((L, 1 << k) for k, L in enumerate(board_manager.letters_mask))
+
+
+class _LineGenerator(object):
+    """
+    Generate all moves along one row or column of the board.
+    """
+
+    def __init__(self, board, direction, k, rack, moves):
+        self.board = board
+        self.direction = direction
+        self.k = k
+        self.moves = moves
+
+        summary = board.line_summary(direction, k)
+        self.summary = summary
+
+        # Plain Python lists for speed inside the recursion.
+        self.chars = list(summary.letters.tostring().decode('ascii'))
+        self.masks = [int(m) for m in board.line(board.cross_checks[direction], direction, k)]
+        self.sums = [int(m) for m in board.line(board.cross_sums[direction], direction, k)]
+        self.xL = [int(m) for m in board.line(board.xL, direction, k)]
+        self.xW = [int(m) for m in board.line(board.xW, direction, k)]
+        self.points = board.points
+
+        self.rack = rack
+        self.rack_size = board.layout.rack_size
+        self.bingo_bonus = board.layout.bingo_bonus
+        self.blank = board.blank
+        self.end = board.width - 1
+
+        # Neighbors along the other direction, to skip single-letter moves found in both directions.
+        other = board.line(board.letters, direction, k-1) != board.blank
+        other |= board.line(board.letters, direction, k+1) != board.blank
+        self.has_other = other
+
+
+    def generate(self, dawg):
+        """
+        Generate moves from every anchor on the line.
+        """
+        for anchor, limit in zip(self.summary.anchors, self.summary.left_limits):
+            self.anchor = anchor
+            self.limit = min(limit, sum(self.rack.values()) - 1)
+
+            self._right(anchor, dawg.root, [], 0, 1, 0)
+
+
+    def _points(self, L):
+        return int(self.points[ord(L)])
+
+
+    def _right(self, p, node, placed, main_sum, word_mult, cross_total):
+        """
+        Extend suffix rightwards through square p.
+        """
+        ch = self.chars[p]
+        if ch != self.blank:
+            child = node.edges.get(ch.lower())
+            if child is not None:
+                self._after_right(p, child, placed, main_sum + self._points(ch), word_mult, cross_total)
+            return
+
+        mask = self.masks[p]
+        if not mask:
+            return
+
+        for L, count in self.rack.items():
+            if count == 0 or L == '_' or not mask & _bits[L]:
+                continue
+
+            child = node.edges.get(L)
+            if child is not None:
+                self.rack[L] -= 1
+                self._place_right(p, child, L, placed, main_sum, word_mult, cross_total)
+                self.rack[L] += 1
+
+        if self.rack.get('_', 0):
+            self.rack['_'] -= 1
+            for L, child in node.edges.items():
+                if L in _bits and mask & _bits[L]:
+                    self._place_right(p, child, L.upper(), placed, main_sum, word_mult, cross_total)
+            self.rack['_'] += 1
+
+
+    def _place_right(self, p, child, L, placed, main_sum, word_mult, cross_total):
+        points = self._points(L) * self.xL[p]
+        if self.sums[p] >= 0:
+            cross_total += (self.sums[p] + points) * self.xW[p]
+
+        placed.append( (p, L) )
+        self._after_right(p, child, placed, main_sum + points, word_mult * self.xW[p], cross_total)
+        placed.pop()
+
+
+    def _after_right(self, p, node, placed, main_sum, word_mult, cross_total):
+        """
+        Suffix now ends at square p.  Record word, switch to prefix, or keep extending.
+        """
+        if self.chars[p+1] == self.blank:
+            a = self.anchor
+            if self.chars[a-1] == self.blank:
+                if node.final:
+                    self._record(a, p, placed, main_sum, word_mult, cross_total)
+
+                if self.limit > 0:
+                    self._left(a-1, node, placed, main_sum, word_mult, cross_total, 0)
+            else:
+                self._left(a-1, node, placed, main_sum, word_mult, cross_total, 0)
+
+        if p+1 < self.end:
+            self._right(p+1, node, placed, main_sum, word_mult, cross_total)
+
+
+    def _left(self, q, node, placed, main_sum, word_mult, cross_total, used):
+        """
+        Extend reversed prefix leftwards through square q.
+        """
+        ch = self.chars[q]
+        if ch != self.blank:
+            child = node.edges.get(ch.upper())
+            if child is not None:
+                self._after_left(q, child, placed, main_sum + self._points(ch), word_mult,
+                                 cross_total, used)
+            return
+
+        if used >= self.limit:
+            return
+
+        mask = self.masks[q]
+        for L, count in self.rack.items():
+            if count == 0 or L == '_' or not mask & _bits[L]:
+                continue
+
+            child = node.edges.get(L.upper())
+            if child is not None:
+                self.rack[L] -= 1
+                self._place_left(q, child, L, placed, main_sum, word_mult, cross_total, used)
+                self.rack[L] += 1
+
+        if self.rack.get('_', 0):
+            self.rack['_'] -= 1
+            for U, child in node.edges.items():
+                L = U.lower()
+                if U != L and mask & _bits[L]:
+                    self._place_left(q, child, U, placed, main_sum, word_mult, cross_total, used)
+            self.rack['_'] += 1
+
+
+    def _place_left(self, q, child, L, placed, main_sum, word_mult, cross_total, used):
+        points = self._points(L) * self.xL[q]
+        if self.sums[q] >= 0:
+            cross_total += (self.sums[q] + points) * self.xW[q]
+
+        placed.append( (q, L) )
+        self._after_left(q, child, placed, main_sum + points, word_mult * self.xW[q], cross_total,
+                         used + 1)
+        placed.pop()
+
+
+    def _after_left(self, q, node, placed, main_sum, word_mult, cross_total, used):
+        """
+        Prefix now starts at square q.
+        """
+        if self.chars[q-1] == self.blank:
+            if node.final:
+                self._record(q, None, placed, main_sum, word_mult, cross_total)
+
+        if q-1 > 0:
+            self._left(q-1, node, placed, main_sum, word_mult, cross_total, used)
+
+
+    def _record(self, q_beg, q_end, placed, main_sum, word_mult, cross_total):
+        """
+        Store a complete move.
+        """
+        num = len(placed)
+        if num == 1:
+            if q_end == q_beg:
+                # Single letter along this line, the word runs the other way.
+                return
+
+            if self.direction == DOWN and self.has_other[placed[0][0]]:
+                # Already found along the row.
+                return
+
+        score = main_sum * word_mult + cross_total
+        if num == self.rack_size:
+            score += self.bingo_bonus
+
+        if self.direction == ACROSS:
+            ij_letters = [((p, self.k), L) for p, L in placed]
+        else:
+            ij_letters = [((self.k, p), L) for p, L in placed]
+
+        self.moves.append( (score, ij_letters) )
+
+
+
+def rack_counts(letters):
+    """
+    Counter of rack letters, blanks as '_'.
+    """
+    return collections.Counter(letters)
+
+
+
+def generate_line_moves(board, dawg, direction, k, letters_rack, moves=None):
+    """
+    Generate all moves along line k in given direction.
+    Board cross checks must be up to date, see Board.update_cross_checks.
+    """
+    if moves is None:
+        moves = []
+
+    rack = rack_counts(letters_rack)
+    if rack:
+        generator = _LineGenerator(board, direction, k, rack, moves)
+        generator.generate(dawg)
+
+    # Done.
+    return moves
+
+
+
+def generate_moves(board, dawg, letters_rack):
+    """
+    Generate all legal moves for the supplied rack, sorted by decreasing score.
+    """
+    board.update_cross_checks(dawg)
+
+    moves = []
+    for direction in [ACROSS, DOWN]:
+        for k in range(1, board.width-1):
+            if len(board.line_summary(direction, k).anchors):
+                generate_line_moves(board, dawg, direction, k, letters_rack, moves)
+
+    moves.sort(key=lambda m: m[0], reverse=True)
+
+    # Done.
+    return moves
+
+
+
+if __name__ == '__main__':
+    import os
+    import trie_manager
+    import bag_manager
+
+    from timer import Timer
+
+    path_module = os.path.dirname(os.path.abspath(__file__))
+    path_words = os.path.join(path_module, 'data', 'words and letters')
+
+    f = os.path.join(path_words, 'words_zynga.txt')
+    daggad = trie_manager.load_daggad_dictionary(f)
+
+    f = os.path.join(path_words, 'letters_zynga.yml')
+    bag = bag_manager.Bag(f)
+
+    board = board_manager.Board(letter_points=bag.letter_points)
+
+    rack = 'retains'
+    with Timer('Opening moves'):
+        moves = generate_moves(board, daggad, rack)
+
+    print(len(moves))
+    print(moves[:5])
+
+    score, ij_letters = moves[0]
+    board.set_game_letters(ij_letters)
+    print(board)
+
+    rack = 'qu_ixte'
+    with Timer('Second moves'):
+        moves = generate_moves(board, daggad, rack)
+
+    print(len(moves))
+    print(moves[:5])
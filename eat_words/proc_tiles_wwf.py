@@ -68,6 +68,12 @@ for fname_img, info_img in info['reference']['rack'].items():
                 f = os.path.join(path_data, 'tiles', fname)
                 io.write(f, tile)
 
+#
+# Compile saved tiles into one memory-mapped bundle in the user's home folder, read by
+# tiles.load_reference_tiles().
+#
+tiles.write_reference_bundle(path_module)
+
 # Done.
 
 #
@@ -0,0 +1,179 @@
+from __future__ import division, print_function, unicode_literals
+
+import time
+import collections
+
+import board_manager
+import bag_manager
+import move_manager
+
+
+#
+# Bot-versus-bot games.  A policy chooses a move from the generated list:
+#
+#     policy(moves, letters_rack, leaves) -> move, or None to pass
+#
+# where moves are (score, ij_letters) sorted by decreasing score, as from move_manager, and leaves is
+# a leave_manager.LeaveTable.  Policies are looked up by name so they can be handed to worker
+# processes.
+#
+
+def choose_score(moves, letters_rack, leaves):
+    """
+    Highest scoring move.
+    """
+    if not moves:
+        return None
+
+    return moves[0]
+
+
+
+def choose_equity(moves, letters_rack, leaves):
+    """
+    Highest score plus value of the tiles left on the rack.
+    """
+    best = None
+    best_equity = None
+    for move in moves:
+        equity = move[0] + leaves.value(rack_leave(letters_rack, move[1]))
+        if best is None or equity > best_equity:
+            best, best_equity = move, equity
+
+    return best
+
+
+
+policies = {'score': choose_score,
+            'equity': choose_equity}
+
+
+def rack_leave(letters_rack, ij_letters):
+    """
+    Rack letters left after playing a move.  Uppercase letters were played from a blank.
+    """
+    rack = collections.Counter(letters_rack)
+    for ij, L in ij_letters:
+        if L.isupper():
+            rack['_'] -= 1
+        else:
+            rack[L] -= 1
+
+    return ''.join(L*c for L, c in sorted(rack.items()))
+
+
+##################################################
+
+# Phases timed within each game.
+phases = ['generate', 'select', 'play']
+
+# Consecutive scoreless turns that end a game.
+num_scoreless_max = 6
+
+
+def play_game(dawg, fname_letters, names_policy, seed, first=0, leaves=None, layout='wwf',
+              record=None):
+    """
+    Play one game between two policies, named in names_policy.  Player first moves first.
+    The game is determined by its seed alone.
+
+    If record is a list, append (player, letters_leave, score, count_bag) for each turn, with
+    count_bag the number of tiles in the bag before refilling the rack.  Passes leave the whole rack.
+
+    Return dict with final scores, number of turns and bingos, and seconds spent in each phase.
+    """
+    choose = [policies[name] for name in names_policy]
+
+    bag = bag_manager.Bag(fname_letters, seed=seed)
+    board = board_manager.Board(layout, letter_points=bag.letter_points)
+    rack_size = board.layout.rack_size
+
+    racks = [''.join(bag.pick_letters(rack_size)) for player in range(2)]
+    scores = [0, 0]
+    bingos = [0, 0]
+    timing = dict((phase, 0.) for phase in phases)
+
+    player = first
+    num_turns = 0
+    num_scoreless = 0
+    while True:
+        time_start = time.time()
+        moves = move_manager.generate_moves(board, dawg, racks[player])
+        time_generate = time.time()
+
+        move = choose[player](moves, racks[player], leaves)
+        time_select = time.time()
+
+        if move is None:
+            num_scoreless += 1
+
+            if record is not None:
+                record.append( (player, racks[player], 0, bag.count_inside) )
+        else:
+            score, ij_letters = move
+            board.set_game_letters(ij_letters)
+
+            rack = rack_leave(racks[player], ij_letters)
+            if record is not None:
+                record.append( (player, rack, score, bag.count_inside) )
+
+            racks[player] = rack + ''.join(bag.pick_letters(rack_size - len(rack)))
+
+            scores[player] += score
+            bingos[player] += len(ij_letters) == rack_size
+            num_scoreless = 0 if score else num_scoreless + 1
+
+        time_play = time.time()
+
+        timing['generate'] += time_generate - time_start
+        timing['select'] += time_select - time_generate
+        timing['play'] += time_play - time_select
+
+        num_turns += 1
+
+        if not racks[player] or num_scoreless >= num_scoreless_max:
+            break
+
+        player = 1 - player
+
+    # Tiles left on the racks count against their holders, and for a player going out.
+    remaining = [sum(bag.letter_points[L] for L in rack) for rack in racks]
+    for k in range(2):
+        scores[k] -= remaining[k]
+        if not racks[k]:
+            scores[k] += remaining[1-k]
+
+    result = {'first': first,
+              'score_0': scores[0],
+              'score_1': scores[1],
+              'bingos_0': bingos[0],
+              'bingos_1': bingos[1],
+              'turns': num_turns}
+
+    for phase in phases:
+        result['time_%s' % phase] = timing[phase]
+
+    # Done.
+    return result
+
+
+
+if __name__ == '__main__':
+    import os
+    import trie_manager
+    import leave_manager
+
+    from timer import Timer
+
+    path_module = os.path.dirname(os.path.abspath(__file__))
+    path_words = os.path.join(path_module, 'data', 'words and letters')
+
+    dawg = trie_manager.load_daggad_arrays(os.path.join(path_words, 'words_zynga.txt'))
+    leaves = leave_manager.read_leaves(os.path.join(path_words, 'leaves_zynga.yml'))
+
+    f = os.path.join(path_words, 'letters_zynga.yml')
+    for k in range(2):
+        with Timer('Game %d' % k):
+            result = play_game(dawg, f, ['equity', 'score'], seed=(1234, k), first=k % 2,
+                               leaves=leaves)
+        print(sorted(result.items()))
@@ -0,0 +1,237 @@
+from __future__ import division, print_function, unicode_literals
+
+import numpy as np
+
+import board_manager
+import layout_manager
+
+
+#
+# Compact tile codes: 0 for an empty square, 1-26 for letters a-z, 27-52 for letters A-Z played
+# from a blank.
+#
+letters_code = '.' + board_manager.letters_mask + board_manager.letters_mask.upper()
+
+_codes = np.zeros(256, dtype=np.uint8)
+for c, L in enumerate(letters_code):
+    _codes[ord(L)] = c
+
+_chars = np.asarray(list(letters_code), dtype='|S1')
+
+# Zobrist keys for position hashing, indexed by [square, code].
+_size_max = 32
+_zobrist = np.random.RandomState(8675309).randint(1, 2**62, size=(_size_max**2, len(letters_code)))
+_zobrist[:, 0] = 0
+_zobrist = _zobrist.tolist()
+
+
+def encode_letters(letters):
+    """Tile codes for an array of board letters.
+    """
+    letters = np.asarray(letters, dtype='|S1')
+    return _codes[letters.view(np.uint8)]
+
+
+def decode_letters(codes):
+    """Board letters for an array of tile codes.
+    """
+    return _chars[codes]
+
+
+##################################################
+
+class BoardSnapshot(object):
+    """
+    An immutable board position.
+
+    Rows of tile codes (one per j, indexed by i, moat included) are read-only arrays shared between
+    a snapshot and every position derived from it.  Playing letters copies only the rows they land
+    on, so a child position costs about the number of tiles changed.  Nothing is ever written after
+    construction, so snapshots may be read from any number of threads.
+    """
+
+    def __init__(self, layout, rows, hash_value, num_tiles):
+        """
+        Use from_board() or play() rather than calling directly.
+        """
+        self.layout = layout
+        self.width = layout.width
+        self.num_tiles = num_tiles
+
+        self._rows = rows
+        self._hash = hash_value
+
+
+    @classmethod
+    def from_board(cls, board):
+        """
+        Snapshot of the letters currently on a Board.
+        """
+        codes = encode_letters(board.letters)
+
+        rows = []
+        for j in range(board.width):
+            row = codes[:, j].copy()
+            row.flags.writeable = False
+            rows.append(row)
+
+        hash_value = 0
+        ii, jj = np.nonzero(codes)
+        for i, j in zip(ii, jj):
+            hash_value ^= _zobrist[i*_size_max + j][codes[i, j]]
+
+        # Done.
+        return cls(board.layout, tuple(rows), hash_value, len(ii))
+
+
+    @classmethod
+    def empty(cls, layout='wwf'):
+        """
+        Snapshot of an empty board, for a named or compiled layout.
+        """
+        if not isinstance(layout, layout_manager.Layout):
+            layout = layout_manager.load_layout(layout)
+
+        row = np.zeros(layout.width, dtype=np.uint8)
+        row.flags.writeable = False
+
+        return cls(layout, (row,)*layout.width, 0, 0)
+
+
+    def play(self, ij_letters):
+        """
+        Return new snapshot with letters placed on empty squares.  This snapshot is unchanged.
+        Letters are lowercase, or uppercase when played from a blank.
+        """
+        rows = list(self._rows)
+        copied = set()
+
+        hash_value = self._hash
+        for ij, L in ij_letters:
+            i, j = ij
+            if not (0 < i < self.width-1 and 0 < j < self.width-1):
+                raise board_manager.IllegalMove('Square off the board: %d, %d' % (i, j))
+
+            code = _codes[ord(L)] if len(L) == 1 and ord(L) < len(_codes) else 0
+            if code == 0:
+                raise board_manager.IllegalMove('Invalid letter: "%s"' % L)
+
+            if rows[j][i] != 0:
+                raise board_manager.IllegalMove('Square already occupied: %d, %d' % (i, j))
+
+            if j not in copied:
+                rows[j] = rows[j].copy()
+                copied.add(j)
+
+            rows[j][i] = code
+            hash_value ^= _zobrist[i*_size_max + j][code]
+
+        for j in copied:
+            rows[j].flags.writeable = False
+
+        # Done.
+        return BoardSnapshot(self.layout, tuple(rows), hash_value, self.num_tiles + len(ij_letters))
+
+
+    ###########################################
+
+    def tile(self, i, j):
+        """
+        Tile code at square (i, j).
+        """
+        return self._rows[j][i]
+
+
+    def row(self, j):
+        """
+        Read-only tile codes along row j.
+        """
+        return self._rows[j]
+
+
+    def column(self, i):
+        """
+        Tile codes down column i.
+        """
+        return np.asarray([row[i] for row in self._rows], dtype=np.uint8)
+
+
+    @property
+    def codes(self):
+        """
+        Tile codes for the whole board, indexed by [i, j].  A new array.
+        """
+        return np.asarray(self._rows).T
+
+
+    @property
+    def letters(self):
+        """
+        Board letters, indexed by [i, j], as in Board.letters.  A new array.
+        """
+        return decode_letters(self.codes)
+
+
+    def to_board(self, letter_points=None):
+        """
+        New mutable Board holding this position.
+        """
+        board = board_manager.Board(self.layout, letter_points)
+
+        codes = self.codes
+        ii, jj = np.nonzero(codes)
+        if len(ii):
+            board.set_game_letters( [((i, j), L) for i, j, L in zip(ii, jj, _chars[codes[ii, jj]])] )
+
+        # Done.
+        return board
+
+
+    ###########################################
+
+    def __hash__(self):
+        return self._hash
+
+
+    def __eq__(self, other):
+        if not isinstance(other, BoardSnapshot):
+            return NotImplemented
+
+        if self._hash != other._hash or self.layout is not other.layout:
+            return False
+
+        return all(a is b or np.array_equal(a, b) for a, b in zip(self._rows, other._rows))
+
+
+    def __ne__(self, other):
+        result = self.__eq__(other)
+        if result is NotImplemented:
+            return result
+        return not result
+
+
+    def __repr__(self):
+        return 'BoardSnapshot(%s, tiles=%d, hash=%016x)' % (self.layout.name, self.num_tiles, self._hash)
+
+
+
+if __name__ == '__main__':
+
+    from timer import Timer
+
+    root = BoardSnapshot.empty()
+
+    a = root.play([((7, 8), 'b'), ((8, 8), 'o'), ((9, 8), 'y')])
+    b = a.play([((9, 9), 'e'), ((9, 10), 's')])
+    c = a.play([((9, 9), 'E'), ((9, 10), 's')])
+
+    print(root, a, b, c)
+    print(b == c, b.row(7) is a.row(7), b.row(8) is a.row(8))
+
+    board = b.to_board()
+    print(board)
+    print(BoardSnapshot.from_board(board) == b)
+
+    with Timer('10000 children'):
+        for k in range(10000):
+            b.play([((10, 10), 'a'), ((11, 10), 't')])
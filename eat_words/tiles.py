@@ -3,203 +3,1049 @@ from __future__ import division, print_function, unicode_literals
 
 import os
 import glob
+import json
+import collections
 import numpy as np
 
 import data_io as io
 
 
+# Reference tiles of one kind (grid or rack), stacked as an array shaped (R, h, w, c), with their
+# labels and the letter each label stands for (None for empty and premium squares).
+Reference = collections.namedtuple('Reference', ['labels', 'letters', 'tiles'])
+
+# Compiled tile masks, keyed by mask kind, tile size and mask entries.
+_masks = {}
+
+# Block size for low resolution tile signatures, in pixels.
+block_size = 8
+
+# Reference tile signatures, keyed by ids of reference tiles and mask.
+_signatures = {}
+
+# Largest sum of squared pixel differences accumulated in int32.
+_max_int32 = np.iinfo(np.int32).max
+
+# Smallest grey level step counted as an edge when calibrating tile geometry.
+edge_level = 8
+
+# Calibrated grid and rack parameters, keyed by image size (see image_key()), None for sizes
+# where calibration failed.
+_geometry = {}
+
+# Reference tiles and masks for screenshots at other scales, keyed by ids of reference tiles and
+# mask, and tile pitch.
+_scaled = {}
+
 
 #########################################
 
 
+def _taps(origin, pitch, num, size, length):
+    """
+    Source pixel indices and weights resampling num tiles, pitch pixels apart from origin, to size
+    samples each.  Both shaped (num*size, K).  Triangle filter as wide as a source pixel or a
+    sample, whichever is wider.  Indices beyond either end of length pixels are clamped.
+    """
+    scale = pitch / size
+    support = max(scale, 1.)
+
+    t = np.arange(num*size)
+    center = origin + (t // size)*pitch + (t % size + 0.5)*scale - 0.5
+
+    first = np.floor(center - support).astype(int) + 1
+    index = first[:, np.newaxis] + np.arange(int(np.ceil(2*support)) + 1)
+
+    weights = np.maximum(1. - np.abs(index - center[:, np.newaxis]) / support, 0.)
+    weights /= weights.sum(axis=1)[:, np.newaxis]
+
+    return np.clip(index, 0, length - 1), weights
+
+
+
+def _resample(a, index, weights, axis):
+    """
+    Weighted sums of entries of array a along axis, with indices and weights from _taps().
+    """
+    shape = [1]*a.ndim
+    shape[axis] = len(index)
+
+    result = 0.
+    for k in range(index.shape[1]):
+        result = result + np.take(a, index[:, k], axis=axis) * weights[:, k].reshape(shape)
+
+    return result
+
+
+
+def _carve_resampled(img, info_parameters):
+    """
+    Tiles resampled from an image at tile pitch info_parameters['pitch'] to dx pixels, shaped and
+    indexed as from carve_view().
+    """
+    dx = info_parameters['dx']
+    pitch = float(info_parameters['pitch'])
+
+    num_x = info_parameters['num_x']
+    num_y = info_parameters['num_y']
+
+    index_j, weights_j = _taps(info_parameters['j0'], pitch, num_y, dx, img.shape[0])
+    index_i, weights_i = _taps(info_parameters['i0'], pitch, num_x, dx, img.shape[1])
+
+    block = _resample(_resample(img, index_j, weights_j, 0), index_i, weights_i, 1)
+    block = np.clip(np.floor(block + 0.5), 0, 255).astype(img.dtype)
+
+    tiles = np.ascontiguousarray(block.reshape(num_y, dx, num_x, dx, -1).transpose(0, 2, 1, 3, 4))
+    tiles.flags.writeable = False
+
+    # Done.
+    return tiles
+
+
+
+def carve_view(img, info_parameters):
+    """
+    Read-only view of a block of square tiles in an image, shaped (num_y, num_x, dx, dx, c).
+    Tile [jj, ii] is the ii-th tile across, jj-th down.  Nothing is copied.
+
+    For a screenshot at another scale than the reference tiles, info_parameters also gives the
+    tile pitch in the image (pitch, in pixels, need not be whole).  Tiles are then resampled to dx
+    pixels, into a new read-only array of the same shape.
+    """
+    dx = info_parameters['dx']
+    i0 = info_parameters['i0']
+    j0 = info_parameters['j0']
+
+    num_x = info_parameters['num_x']
+    num_y = info_parameters['num_y']
+
+    pitch = info_parameters.get('pitch', dx)
+
+    if dx <= 0 or num_x <= 0 or num_y <= 0 or pitch <= 0:
+        raise Exception('Invalid tile size or count: %d, %d x %d' % (dx, num_x, num_y))
+
+    # The view is built by strides, out of bounds tiles would read memory outside the image.
+    img = np.asarray(img)
+    if img.ndim != 3 or i0 < 0 or j0 < 0 or \
+       j0 + pitch*num_y > img.shape[0] or i0 + pitch*num_x > img.shape[1]:
+        raise Exception('Tiles extend beyond image: %s' % (img.shape,))
+
+    if pitch != dx:
+        return _carve_resampled(img, info_parameters)
+
+    s0, s1, s2 = img.strides
+    view = np.lib.stride_tricks.as_strided(img[j0:, i0:], shape=(num_y, num_x, dx, dx, img.shape[2]),
+                                           strides=(dx*s0, dx*s1, s0, s1, s2), writeable=False)
+
+    # Done.
+    return view
+
+
+
+def carve_grid(img, info_config):
+    """
+    View of the game grid tiles, shaped (15, 15, dx, dx, c), indexed [j, i].
+    """
+    return carve_view(img, info_config['grid_parameters'])
+
+
+
+def carve_rack(img, info_config):
+    """
+    View of the rack tiles, shaped (1, 7, dx, dx, c).
+    """
+    return carve_view(img, info_config['rack_parameters'])
+
+
+
 def carve_tiles(img, info_config):
     """
-    Carve out grid and rack tiles from screenshot image.
+    Carve out grid and rack tiles from screenshot image, masked.
+    Return lists of ([ii, jj], tile) pairs.
+    """
+    tiles_grid = apply_mask(carve_grid(img, info_config), info_config)
+    tiles_rack = apply_mask(carve_rack(img, info_config), info_config)
+
+    pairs_grid = [([ii, jj], tiles_grid[jj, ii]) for jj in range(tiles_grid.shape[0])
+                                                 for ii in range(tiles_grid.shape[1])]
+
+    pairs_rack = [([ii, jj], tiles_rack[jj, ii]) for jj in range(tiles_rack.shape[0])
+                                                 for ii in range(tiles_rack.shape[1])]
+
+    # Done.
+    return pairs_grid, pairs_rack
+
+
+#########################################
+
+
+def _runs(flags, gap=0):
+    """
+    Runs of True in a boolean profile as [start, stop) pairs, joining runs separated by at most gap.
+    """
+    d = np.diff(np.concatenate([[0], np.asarray(flags, dtype=np.int8), [0]]))
+
+    runs = []
+    for start, stop in zip(np.flatnonzero(d == 1), np.flatnonzero(d == -1)):
+        if runs and start - runs[-1][1] <= gap:
+            runs[-1] = (runs[-1][0], stop)
+        else:
+            runs.append( (start, stop) )
+
+    return runs
+
+
+
+def _pitch(profile, lag_min, lag_max):
+    """
+    Lag between lag_min and lag_max at which a profile best correlates with itself.
+    """
+    p = np.asarray(profile, dtype=np.float64)
+    p = p - p.mean()
+
+    lags = np.arange(max(lag_min, 1), min(lag_max, len(p) - 1) + 1)
+    if not len(lags):
+        raise Exception('No room for tile pitch in profile of length %d' % len(p))
+
+    correlation = [np.dot(p[:-k], p[k:]) / (len(p) - k) for k in lags]
+
+    return int(lags[np.argmax(correlation)])
+
+
+
+def _centered(start, stop, num, dx):
+    """
+    Origin of num tiles of width dx centered on [start, stop), rounding half up.
+    """
+    return int(np.floor((start + stop - num*dx) / 2. + 0.5))
+
+
+
+def detect_geometry(img, info_config):
+    """
+    Estimate grid and rack parameters of a screenshot from projection profiles of its edges.
+    Tile counts are taken from info_config.
+
+    The board is the longest band of rows whose vertical edges span most of the image width.  Its
+    rows repeat with the tile pitch, found by autocorrelation, and the tiles are centered on it.
+    The rack sits in the first band below the board bounded by full width horizontal edges, with its
+    pitch found the same way across columns.
+
+    Result may be off by a few pixels, see refine_geometry().
+    """
+    img = np.asarray(img)
+    if img.ndim != 3:
+        raise Exception('Expected colour image: %s' % (img.shape,))
+
+    grey = img.astype(np.float64).mean(axis=2)
+    height, width = grey.shape
+
+    edges_x = np.abs(np.diff(grey, axis=1)) > edge_level
+    edges_y = np.abs(np.diff(grey, axis=0)) > edge_level
+
+    info_grid = dict(info_config['grid_parameters'])
+    info_rack = dict(info_config['rack_parameters'])
+
+    # Board rows.
+    first = np.argmax(edges_x, axis=1)
+    last = width - 1 - np.argmax(edges_x[:, ::-1], axis=1)
+    span = np.where(edges_x.any(axis=1), last - first, 0)
+
+    runs = _runs(span > width // 2, gap=height // 100)
+    if not runs:
+        raise Exception('Board not found')
+
+    j_start, j_stop = max(runs, key=lambda r: r[1] - r[0])
+
+    # Board columns.
+    cols = np.flatnonzero(edges_y[j_start:j_stop].any(axis=0))
+    i_start, i_stop = cols[0], cols[-1] + 1
+
+    num_x, num_y = info_grid['num_x'], info_grid['num_y']
+
+    guess = max((j_stop - j_start) / num_y, (i_stop - i_start) / num_x)
+    dx = _pitch(edges_x[j_start:j_stop].mean(axis=1), int(guess*0.8), int(guess*1.2) + 1)
+
+    info_grid['dx'] = dx
+    info_grid['i0'] = _centered(i_start, i_stop, num_x, dx)
+    info_grid['j0'] = _centered(j_start, j_stop, num_y, dx)
+
+    # Rack band, below board.
+    num_x, num_y = info_rack['num_x'], info_rack['num_y']
+
+    j_low = j_stop
+    j_high = min(j_stop + 2*width // num_x, height - 1)
+    full = np.flatnonzero(edges_y[j_low:j_high].mean(axis=1) > 0.5) + j_low
+    if len(full) < 2 or full[-1] - full[0] < 2:
+        raise Exception('Rack not found')
+
+    j_start, j_stop = full[0] + 1, full[-1] + 1
+
+    profile = edges_x[j_start:j_stop].mean(axis=0)
+    dx = _pitch(profile, width // (2*num_x), width // num_x)
+
+    cols = np.flatnonzero(profile > 0)
+    if not len(cols):
+        raise Exception('Rack not found')
+
+    i_start, i_stop = cols[0] + 1, cols[-1] + 1
+
+    info_rack['dx'] = dx
+    info_rack['i0'] = _centered(i_start, i_stop, num_x, dx)
+    info_rack['j0'] = _centered(j_start, j_stop, num_y, dx)
+
+    # Done.
+    return info_grid, info_rack
+
+
+
+def refine_geometry(img, info_parameters, reference, mask=None, thresh=10**2, pitch=None):
+    """
+    Adjust tile origin, one axis at a time, to best fit reference tiles.  Fit is the number of
+    tiles matching some reference closer than thresh, then their mean distance to the nearest one.
+
+    Tiles are compared at the reference tile size.  The tile pitch in the image is pitch if
+    supplied, else the detected pitch (info_parameters dx), taken as the reference tile size when
+    within an eighth of it.  At any other pitch tiles are resampled, see carve_view() and
+    scaled_reference().  The tiles' center is kept.
+
+    Origins are searched only where every tile lies within the image.
+
+    Return parameters and number of tiles matched, None if not refined.
+    """
+    info_parameters = dict(info_parameters)
+    info_parameters.pop('pitch', None)
+
+    dx = reference.tiles.shape[1]
+    if pitch is None:
+        pitch = info_parameters['dx']
+        if abs(pitch - dx) <= max(dx // 8, 1):
+            pitch = dx
+
+    radius = max(int(pitch) // 8, 1)
+
+    # Largest origins keeping the last tile inside the image.
+    height, width = np.shape(img)[:2]
+    limits = {'i0': int(np.floor(width - pitch*info_parameters['num_x'])),
+              'j0': int(np.floor(height - pitch*info_parameters['num_y']))}
+
+    if limits['i0'] < 0 or limits['j0'] < 0:
+        return info_parameters, None
+
+    for key, num in [('i0', 'num_x'), ('j0', 'num_y')]:
+        shift = info_parameters[num] * (info_parameters['dx'] - pitch) / 2.
+        origin = int(np.floor(info_parameters[key] + shift + 0.5))
+        info_parameters[key] = min(max(origin, 0), limits[key])
+
+    info_parameters['dx'] = dx
+    if pitch != dx:
+        info_parameters['pitch'] = float(pitch)
+
+    reference, mask = scaled_reference(reference, info_parameters, mask)
+
+    def fit(info):
+        distance = tile_distances(carve_view(img, info), reference, mask).min(axis=1)
+        return (np.sum(distance < thresh), -distance.mean())
+
+    best = fit(info_parameters)
+    for key in ['j0', 'i0', 'j0']:
+        info_best = info_parameters
+        origin = info_parameters[key]
+        for value in range(max(origin - radius, 0), min(origin + radius, limits[key]) + 1):
+            info = dict(info_parameters)
+            info[key] = value
+
+            f = fit(info)
+            if f > best:
+                best, info_best = f, info
+
+        info_parameters = info_best
+
+    # Done.
+    return info_parameters, best[0]
+
+
+
+def calibrate_geometry(img, info_config, reference_grid=None, reference_rack=None):
     """
-    dx_grid = info_config['grid_parameters']['dx']
-    i0_grid = info_config['grid_parameters']['i0']
-    j0_grid = info_config['grid_parameters']['j0']
+    Find grid and rack parameters for a screenshot, see detect_geometry().  Given reference tiles,
+    the tile origins are refined to the pixel, and calibration fails unless at least half the grid
+    squares and one rack tile match.
+
+    Screenshots may be at another scale than the reference tiles, see refine_geometry().  The rack
+    is then taken at the grid's scale, its own detected pitch being less reliable.
 
-    num_grid_x = info_config['grid_parameters']['num_x']
-    num_grid_y = info_config['grid_parameters']['num_y']
+    Return copy of info_config with calibrated grid_parameters and rack_parameters.
+    """
+    info_grid, info_rack = detect_geometry(img, info_config)
 
-    dx_rack = info_config['rack_parameters']['dx']
-    i0_rack = info_config['rack_parameters']['i0']
-    j0_rack = info_config['rack_parameters']['j0']
+    pitch_rack = None
+    if reference_grid is not None:
+        mask = tile_mask(reference_grid.tiles.shape[1], info_config)
+        info_grid, num = refine_geometry(img, info_grid, reference_grid, mask)
 
-    num_rack_x = info_config['rack_parameters']['num_x']
-    num_rack_y = info_config['rack_parameters']['num_y']
+        if num is not None and num < info_grid['num_x']*info_grid['num_y'] / 2:
+            raise Exception('Grid does not match reference tiles: %d squares' % num)
 
+        if reference_rack is not None:
+            scale = info_grid.get('pitch', info_grid['dx']) / info_grid['dx']
+            pitch_rack = reference_rack.tiles.shape[1] * scale
 
-    # Grid coordinates.
-    i_grid = np.arange(i0_grid, i0_grid + dx_grid*(num_grid_x), dx_grid)
-    j_grid = np.arange(j0_grid, j0_grid + dx_grid*(num_grid_y), dx_grid)
+    if reference_rack is not None:
+        mask = tile_mask(reference_rack.tiles.shape[1], info_config)
+        info_rack, num = refine_geometry(img, info_rack, reference_rack, mask, pitch=pitch_rack)
 
-    i_rack = np.arange(i0_rack, i0_rack + dx_rack*(num_rack_x), dx_rack)
-    j_rack = np.arange(j0_rack, j0_rack + dx_rack*(num_rack_y), dx_rack)
+        if num is not None and num < 1:
+            raise Exception('Rack does not match reference tiles')
 
-    # Carve out grid tiles.
-    tiles_grid = []
-    for jj, j in enumerate(j_grid):
-        for ii, i in enumerate(i_grid):
-            tile = img[j:j+dx_grid, i:i+dx_grid]
-            tile = apply_mask(tile, info_config)
-            tiles_grid.append( ([ii, jj], tile) )
+    # Both must fit.
+    carve_view(img, info_grid)
+    carve_view(img, info_rack)
 
-    # Carve out rack tiles.
-    tiles_rack = []
-    for jj, j in enumerate(j_rack):
-        for ii, i in enumerate(i_rack):
-            tile = img[j:j+dx_rack, i:i+dx_rack, :]
-            tile = apply_mask(tile, info_config)
-            tiles_rack.append( ([ii, jj], tile) )
+    info_calibrated = dict(info_config)
+    info_calibrated['grid_parameters'] = info_grid
+    info_calibrated['rack_parameters'] = info_rack
 
     # Done.
-    return tiles_grid, tiles_rack
+    return info_calibrated
+
+
+
+def image_key(shape):
+    """
+    Geometry cache key for an image shaped (height, width, ...), e.g. '720x1280'.
+    """
+    return '%dx%d' % (shape[1], shape[0])
 
 
 
-def apply_mask(tile, info_config):
+def default_geometry_cache():
     """
-    Mask out portion of tile.
+    Default geometry cache file, in the user's home folder rather than the package.
     """
+    return os.path.join(os.path.expanduser('~'), '.eat_words', 'geometry.json')
 
-    tile = np.asarray(tile).copy()
-    wid = tile.shape[0]
 
+
+def config_geometry(info_config):
+    """
+    Geometry given in the config, keyed by image size, if the config says which screenshot size
+    (image_size: [width, height]) its grid and rack parameters are for.
+    """
+    if 'image_size' not in info_config:
+        return {}
+
+    width, height = info_config['image_size']
+
+    return {image_key((height, width)): {'grid_parameters': dict(info_config['grid_parameters']),
+                                         'rack_parameters': dict(info_config['rack_parameters'])}}
+
+
+
+def read_geometry(fname_cache):
+    """
+    Cached geometry, keyed by image size.  Empty if there is no cache file.
+    """
+    if not os.path.isfile(fname_cache):
+        return {}
+
+    with open(fname_cache) as fo:
+        return json.load(fo)
+
+
+
+def write_geometry(fname_cache, geometry):
+    """
+    Add geometry to cache file.  Entries for failed calibrations (None) are not written.
+    """
+    cache = read_geometry(fname_cache)
+    cache.update((key, info) for key, info in geometry.items() if info is not None)
+
+    path_cache = os.path.dirname(fname_cache)
+    if path_cache and not os.path.isdir(path_cache):
+        os.makedirs(path_cache)
+
+    # File appears complete or not at all.
+    f_temp = '%s.%d.tmp' % (fname_cache, os.getpid())
+    with open(f_temp, 'w') as fo:
+        json.dump(cache, fo, indent=4, sort_keys=True)
+    os.rename(f_temp, fname_cache)
+
+
+
+def seed_geometry(geometry):
+    """
+    Add geometry, keyed by image size, to this process's cache, e.g. calibrated by a parent
+    process.  None marks a size whose calibration failed.
+    """
+    _geometry.update(geometry)
+
+
+
+def calibrated_config(img, info_config, reference_grid=None, reference_rack=None, fname_cache=None):
+    """
+    Config with grid and rack parameters for the screenshot's size.  Sizes described by the config
+    itself, see config_geometry(), are used as is.  Other sizes are calibrated from their first
+    screenshot, see calibrate_geometry(), and reused for later ones.  Given reference tiles, a
+    calibration is kept only if its screenshot then parses.
+
+    If fname_cache is supplied, calibrated geometry is also kept there (JSON, keyed by image size)
+    for later runs.  Only one process should write to a cache file at a time.
+    """
+    key = image_key(np.shape(img))
+
+    if key not in _geometry:
+        geometry = read_geometry(fname_cache) if fname_cache is not None else {}
+        geometry.update(config_geometry(info_config))
+
+        for k, info in geometry.items():
+            _geometry.setdefault(k, info)
+
+    if key not in _geometry:
+        info_calibrated = calibrate_geometry(img, info_config, reference_grid, reference_rack)
+
+        if reference_grid is not None and reference_rack is not None:
+            parse_game_letters(img, reference_grid, reference_rack, info_calibrated)
+
+        _geometry[key] = {'grid_parameters': info_calibrated['grid_parameters'],
+                          'rack_parameters': info_calibrated['rack_parameters']}
+
+        if fname_cache is not None:
+            write_geometry(fname_cache, {key: _geometry[key]})
+
+    if _geometry[key] is None:
+        raise Exception('Geometry calibration failed for image size %s' % key)
+
+    info_calibrated = dict(info_config)
+    info_calibrated.update(_geometry[key])
+
+    # Done.
+    return info_calibrated
+
+
+
+def tile_mask(wid, info_config):
+    """
+    Boolean mask for tiles of supplied width, True for pixels kept.  Compiled once per config and
+    cached.
+    """
     if wid == info_config['grid_parameters']['dx']:
-        info_mask = info_config['grid_tile_mask']
+        name = 'grid_tile_mask'
         symmetric = False
     elif wid == info_config['rack_parameters']['dx']:
-        info_mask = info_config['rack_tile_mask']
+        name = 'rack_tile_mask'
         symmetric = True
     else:
         raise Exception('Invalid tile size: %s' % wid)
 
-    for i,j in info_mask:
-        tile[j, i:, :] = 0
+    key = (name, wid, tuple(tuple(ij) for ij in info_config[name]))
+    if key in _masks:
+        return _masks[key]
+
+    mask = np.ones((wid, wid), dtype=bool)
+    for i, j in info_config[name]:
+        mask[j, i:] = False
 
         if symmetric:
-            tile[j, :-i, :] = 0
-            tile[-j-1, i:, :] = 0
-            tile[-j-1, :-i, :] = 0
-            
+            mask[j, :-i] = False
+            mask[-j-1, i:] = False
+            mask[-j-1, :-i] = False
+
+    mask.flags.writeable = False
+    _masks[key] = mask
+
     # Done.
-    return tile
+    return mask
 
 
 
-def load_reference_tiles(path_base=None):
+def apply_mask(tiles, info_config):
     """
-    Load reference tile images.
+    Mask out portion of tiles.  Works on a single tile shaped (h, w, c) or any stack of them shaped
+    (..., h, w, c), in one multiply.  Returns a new array.
     """
+    tiles = np.asarray(tiles)
+    mask = tile_mask(tiles.shape[-3], info_config)
 
+    # Done.
+    return tiles * mask[:, :, np.newaxis].astype(tiles.dtype)
+
+
+
+def _resample_tiles(tiles, size):
+    """
+    Stack of square tiles shaped (..., h, w, c) resampled to size x size pixels, as floats.
+    """
+    n = tiles.shape[-2]
+    index, weights = _taps(0, n, 1, size, n)
+
+    tiles = _resample(tiles, index, weights, tiles.ndim-3)
+
+    return _resample(tiles, index, weights, tiles.ndim-2)
+
+
+
+def scaled_reference(reference, info_parameters, mask=None):
+    """
+    Reference tiles and tile mask to compare tiles carved by info_parameters with, see
+    carve_view().  As supplied, unless the screenshot is at another scale (pitch differs from dx).
+    Then the reference tiles are resampled to the screenshot's pitch and back, blurred as the
+    carved tiles are.  Near their edges carved tiles also blend in the neighbouring tile, so pixels
+    within reach of both resampling filters are masked out.  Cached.
+    """
+    dx = reference.tiles.shape[1]
+    pitch = info_parameters.get('pitch', dx)
+    if pitch == dx:
+        return reference, mask
+
+    if mask is None:
+        mask = np.ones((dx, dx), dtype=bool)
+
+    key = (id(reference.tiles), id(mask), float(pitch))
+    if key in _scaled:
+        tiles_cached, mask_cached, result = _scaled[key]
+        if tiles_cached is reference.tiles and mask_cached is mask:
+            return result
+
+    dtype = reference.tiles.dtype
+
+    size = max(int(round(pitch)), 1)
+    tiles = np.clip(np.floor(_resample_tiles(reference.tiles, size) + 0.5), 0, 255)
+    tiles = np.clip(np.floor(_resample_tiles(tiles, dx) + 0.5), 0, 255)
+
+    border = int(np.ceil(2*max(pitch/dx, dx/pitch)))
+    mask_scaled = np.array(mask)
+    mask_scaled[:border] = False
+    mask_scaled[-border:] = False
+    mask_scaled[:, :border] = False
+    mask_scaled[:, -border:] = False
+    mask_scaled.flags.writeable = False
+
+    tiles = tiles.astype(dtype) * mask_scaled[:, :, np.newaxis].astype(dtype)
+
+    result = (Reference(reference.labels, reference.letters, tiles), mask_scaled)
+    _scaled[key] = (reference.tiles, mask, result)
+
+    # Done.
+    return result
+
+
+
+def _reference_files(path_tiles):
+    """
+    Reference tile image files for grid and rack, sorted, with their labels.
+    """
     ix_name_label = 10
     pattern_grid_tiles = 'tile_grid_*.png'
     pattern_rack_tiles = 'tile_rack_*.png'
 
+    result = []
+    for pattern in [pattern_grid_tiles, pattern_rack_tiles]:
+        files = sorted(glob.glob(os.path.join(path_tiles, pattern)))
+
+        # Label is the end of the file name.
+        labels = [os.path.splitext(os.path.basename(f))[0][ix_name_label:] for f in files]
+
+        result.append( (files, labels) )
+
+    return result
+
+
+
+def read_reference_tiles(path_tiles):
+    """
+    Decode reference tile images in folder.  Tiles are saved already masked by proc_tiles_wwf, so
+    are compared as they are.
+    """
+    references = []
+    for files, labels in _reference_files(path_tiles):
+        info_reference = {}
+        for f, label in zip(files, labels):
+            tile, meta = io.read(f)
+            info_reference[label] = tile
+
+        references.append(stack_reference_tiles(info_reference))
+
+    # Done.
+    return references[0], references[1]
+
+
+
+def compile_reference_tiles(reference_grid, reference_rack):
+    """
+    Pack grid and rack reference tiles into a single uint8 array: an int32 header (number of grid
+    and rack tiles, their sizes, colour channels, label width), labels as fixed width ASCII, then
+    the grid tiles and rack tiles.
+    """
+    labels = list(reference_grid.labels) + list(reference_rack.labels)
+    width = max(len(label) for label in labels)
+
+    channels = reference_grid.tiles.shape[-1]
+    header = np.asarray([len(reference_grid.labels), len(reference_rack.labels),
+                         reference_grid.tiles.shape[1], reference_rack.tiles.shape[1],
+                         channels, width], dtype=np.int32)
+
+    text = np.zeros((len(labels), width), dtype=np.uint8)
+    for k, label in enumerate(labels):
+        text[k, :len(label)] = np.frombuffer(label.encode('ascii'), dtype=np.uint8)
+
+    # Done.
+    return np.concatenate([header.view(np.uint8), text.ravel(),
+                           np.asarray(reference_grid.tiles, dtype=np.uint8).ravel(),
+                           np.asarray(reference_rack.tiles, dtype=np.uint8).ravel()])
+
+
+
+def _split_reference(data):
+    """
+    Grid and rack References viewing a compiled reference tile array.
+    """
+    size_header = 6*4
+    header = np.array(data[:size_header]).view(np.int32)
+    num_grid, num_rack, dx_grid, dx_rack, channels, width = [int(v) for v in header]
+
+    a = size_header
+    b = a + (num_grid + num_rack)*width
+    c = b + num_grid*dx_grid*dx_grid*channels
+    d = c + num_rack*dx_rack*dx_rack*channels
+
+    text = np.asarray(data[a:b]).reshape(-1, width)
+    labels = [row.tostring().rstrip(b'\0').decode('ascii') for row in text]
+
+    reference_grid = Reference(labels[:num_grid], [label_letter(L) for L in labels[:num_grid]],
+                               np.asarray(data[b:c]).reshape(num_grid, dx_grid, dx_grid, channels))
+
+    reference_rack = Reference(labels[num_grid:], [label_letter(L) for L in labels[num_grid:]],
+                               np.asarray(data[c:d]).reshape(num_rack, dx_rack, dx_rack, channels))
+
+    return reference_grid, reference_rack
+
+
+
+def default_reference_bundle():
+    """
+    Default compiled reference tile file, in the user's home folder rather than the package.
+    """
+    return os.path.join(os.path.expanduser('~'), '.eat_words', 'tiles_reference.npy')
+
+
+
+def _save_bundle(fname_bundle, reference_grid, reference_rack):
+    """
+    Write compiled reference tiles to bundle file.
+    """
+    path_bundle = os.path.dirname(fname_bundle)
+    if path_bundle and not os.path.isdir(path_bundle):
+        os.makedirs(path_bundle)
+
+    # File appears complete or not at all.
+    f_temp = '%s.%d.tmp' % (fname_bundle, os.getpid())
+    try:
+        with open(f_temp, 'wb') as fo:
+            np.save(fo, compile_reference_tiles(reference_grid, reference_rack))
+        os.rename(f_temp, fname_bundle)
+    finally:
+        if os.path.isfile(f_temp):
+            os.remove(f_temp)
+
+
+
+def write_reference_bundle(path_base=None, fname_bundle=None):
+    """
+    Compile reference tile images in path_base/data/tiles into a bundle file, by default
+    default_reference_bundle().  Return reference tiles, as from load_reference_tiles().
+    """
+    if path_base is None:
+        path_base = os.path.dirname(os.path.abspath(__file__))
+
+    if fname_bundle is None:
+        fname_bundle = default_reference_bundle()
+
+    reference_grid, reference_rack = read_reference_tiles(os.path.join(path_base, 'data', 'tiles'))
+    _save_bundle(fname_bundle, reference_grid, reference_rack)
+
+    # Done.
+    return reference_grid, reference_rack
+
+
+
+def load_reference_tiles(path_base=None, fname_bundle=None):
+    """
+    Load reference tiles for grid and rack, memory-mapped from the compiled bundle, by default
+    default_reference_bundle().  The bundle is rebuilt from the tile images in path_base/data/tiles
+    if missing, older than any of them, or labelled differently.  If it can not be written, tiles
+    are read from the images for this process only.
+    """
     if path_base is None:
         path_base = os.path.dirname(os.path.abspath(__file__))
-    
-    folder_tiles = os.path.join('data', 'tiles')
-    path_tiles = os.path.join(path_base, folder_tiles)
-
-    # Load reference grid tiles and rack tiles.
-    p = os.path.join(path_tiles, pattern_grid_tiles)
-    files_grid = glob.glob(p)
-
-    p = os.path.join(path_tiles, pattern_rack_tiles)
-    files_rack = glob.glob(p)
-
-    info_reference_grid = {}
-    for f in files_grid:
-        # Load tile from file.
-        tile, meta = io.read(f)
-
-        # Extract label.
-        name, ext = os.path.splitext(os.path.basename(f))
-        label = name[ix_name_label:]
-
-        # Store.
-        info_reference_grid[label] = tile
-
-    info_reference_rack = {}
-    for f in files_rack:
-        # Load tile from file.
-        tile, meta = io.read(f)
-
-        # Extract label.
-        name, ext = os.path.splitext(os.path.basename(f))
-        label = name[ix_name_label:]
-
-        # Store.
-        info_reference_rack[label] = tile
-
-    # Done.
-    return info_reference_grid, info_reference_rack
-
-    
-    
-def match_tile_letter(tile_test, info_reference):
-    thresh = 10**2
-    
-    scores = []
-    labels = []
-    for label, tile_reference in info_reference.items():
-        if tile_test.shape == tile_reference.shape:
-            diff = tile_test.astype(np.float) - tile_reference.astype(np.float)
-            rms = np.mean( diff**2 )
-            
-            scores.append(rms)
-            labels.append(label)
-        
-    bool_pass = np.asarray(scores) < thresh
-    num = np.sum(bool_pass)
-    if num != 1:
-        raise Exception('Number of matching tiles is not unique: %d' % num)
-    
-    ix_best = np.argmin(scores)
-    label_best = labels[ix_best]
-    
+
+    if fname_bundle is None:
+        fname_bundle = default_reference_bundle()
+
+    path_tiles = os.path.join(path_base, 'data', 'tiles')
+    (files_grid, labels_grid), (files_rack, labels_rack) = _reference_files(path_tiles)
+
+    if os.path.isfile(fname_bundle):
+        time_bundle = os.path.getmtime(fname_bundle)
+        if all(os.path.getmtime(f) <= time_bundle for f in files_grid + files_rack):
+            reference_grid, reference_rack = _split_reference(np.load(fname_bundle, mmap_mode='r'))
+
+            if reference_grid.labels == labels_grid and reference_rack.labels == labels_rack:
+                return reference_grid, reference_rack
+
+    reference_grid, reference_rack = read_reference_tiles(path_tiles)
+    try:
+        _save_bundle(fname_bundle, reference_grid, reference_rack)
+    except (IOError, OSError):
+        pass
+
+    # Done.
+    return reference_grid, reference_rack
+
+
+
+def label_letter(label):
+    """
+    Letter for a reference tile label, or None for empty and premium squares.
+    """
     # Labels are multiple-character strings.  First letter is the one we want.
-    if 1 <= len(label_best) <= 2:
-        letter = label_best[0].lower()
+    if 1 <= len(label) <= 2:
+        return label[0].lower()
+    else:
+        return None
+
+
+
+def stack_reference_tiles(info_reference):
+    """
+    Stack dict of reference tiles, keyed by label, into a Reference.  Tiles must all be one shape.
+    """
+    labels = sorted(info_reference)
+    letters = [label_letter(label) for label in labels]
+
+    shapes = set(info_reference[label].shape for label in labels)
+    if len(shapes) > 1:
+        raise Exception('Reference tiles differ in shape: %s' % sorted(shapes))
+
+    tiles = np.asarray([info_reference[label] for label in labels])
+
+    # Done.
+    return Reference(labels, letters, tiles)
+
+
+
+def tile_distances(tiles, reference, mask=None):
+    """
+    Mean squared difference between each tile and each reference tile, shaped (N, R).
+    Tiles shaped (..., h, w, c), e.g. a view from carve_view(), are flattened to N tiles in C order.
+
+    If a tile mask is supplied, only pixels it keeps are compared.  Reference tiles are zero
+    elsewhere, so this equals comparing masked tiles, without masking them first.
+
+    Computed in one matrix product from |a - b|**2 = |a|**2 + |b|**2 - 2 a.b.  Pixel values are
+    integers, so every term is exact in float64 and results equal a direct difference.
+    """
+    size = reference.tiles[0].size
+
+    if mask is None:
+        A = np.asarray(tiles, dtype=np.float64).reshape(-1, size)
+        B = reference.tiles.reshape(-1, size).astype(np.float64)
     else:
-        letter = None
-    
+        A = np.asarray(tiles)[..., mask, :].astype(np.float64)
+        A = A.reshape(-1, A.shape[-2]*A.shape[-1])
+        B = reference.tiles[:, mask, :].reshape(len(reference.tiles), -1).astype(np.float64)
+
+    ssd = np.sum(A**2, axis=1)[:, np.newaxis] + np.sum(B**2, axis=1) - 2*np.dot(A, B.T)
+
+    return ssd / size
+
+
+
+def tile_signatures(tiles, mask=None, size=block_size):
+    """
+    Low resolution signatures of tiles shaped (..., h, w, c): sums of each colour channel over
+    blocks of size x size pixels, counting only pixels kept by the mask.
+
+    Return integer signatures shaped (N, num_blocks, c) and the number of pixels summed in each
+    block.
+    """
+    tiles = np.asarray(tiles)
+    h, w, c = tiles.shape[-3:]
+
+    if mask is None:
+        mask = np.ones((h, w), dtype=bool)
+
+    masked = (tiles * mask[:, :, np.newaxis].astype(tiles.dtype)).reshape(-1, h, w, c)
+
+    edges_j = np.arange(0, h, size)
+    edges_i = np.arange(0, w, size)
+
+    sums = np.add.reduceat(masked, edges_j, axis=1, dtype=np.int32)
+    sums = np.add.reduceat(sums, edges_i, axis=2)
+
+    counts = np.add.reduceat(mask.astype(np.int64), edges_j, axis=0)
+    counts = np.add.reduceat(counts, edges_i, axis=1)
+
     # Done.
-    return letter
+    return sums.reshape(len(masked), -1, c).astype(np.int64), counts.ravel()
+
+
+
+def _reference_signatures(reference, mask):
+    """
+    Signatures of reference tiles, plus the tiles flattened.  Cached.
+    """
+    key = (id(reference.tiles), id(mask))
+    if key in _signatures:
+        tiles, mask_cached, signatures = _signatures[key]
+        if tiles is reference.tiles and mask_cached is mask:
+            return signatures
+
+    signatures = tile_signatures(reference.tiles, mask) + \
+                 (reference.tiles.reshape(len(reference.tiles), -1).astype(np.int16),)
+    _signatures[key] = (reference.tiles, mask, signatures)
+
+    return signatures
+
+
 
-    
-    
-def parse_game_letters(img_game, info_reference_grid, info_reference_rack, info_config):
+def sum_squared_differences(a, b):
+    """
+    Sum of squared differences between rows of two uint8 arrays shaped (N, size), in integers.
+    Differences are taken in int16 and squares accumulated in int32, unless a full sum could
+    overflow it.
+    """
+    dtype = np.int32 if a.shape[-1] * 255**2 <= _max_int32 else np.int64
+
+    diff = a.astype(np.int16) - b.astype(np.int16)
+
+    return np.einsum('ij,ij->i', diff, diff, dtype=dtype)
+
+
+
+def match_tiles(tiles, reference, mask=None, thresh=10**2):
+    """
+    Letters for a batch of tiles shaped (..., h, w, c), as a list in C order.  Each tile must match
+    exactly one reference closer than thresh (mean squared difference).  Unmasked tiles, e.g. views
+    from carve_view(), are compared through the tile mask.
+
+    Tile-reference pairs pass through a cascade of lower bounds on their squared difference, and
+    only pairs that could still fall under thresh go on to the next stage:
+
+        1. mean colour, which sets letter tiles apart from empty and premium squares,
+        2. block means,
+        3. full resolution.
+
+    By Cauchy-Schwarz, n times the sum of squares of n differences is at least the square of their
+    sum, so each bound holds and results equal comparing every pair in full.  All stages work on
+    integers: bounds are rounded down, which keeps them bounds, and nothing is promoted to float.
+    """
+    tiles = np.asarray(tiles)
+    if tiles.shape[-3:] != reference.tiles.shape[1:]:
+        raise Exception('Tile shape does not match references: %s' % (tiles.shape[-3:],))
+
+    size = reference.tiles[0].size
+    limit = thresh * size
+
+    signatures, counts = tile_signatures(tiles, mask)
+    signatures_ref, counts, flat_ref = _reference_signatures(reference, mask)
+
+    # Stage 1: mean colour.
+    totals = signatures.sum(axis=1)
+    totals_ref = signatures_ref.sum(axis=1)
+
+    bound = np.sum((totals[:, np.newaxis, :] - totals_ref)**2 // max(counts.sum(), 1), axis=2)
+    pairs_n, pairs_r = np.nonzero(bound < limit)
+
+    # Stage 2: block means.  Blocks with no pixels kept have zero sums.
+    diff = signatures[pairs_n] - signatures_ref[pairs_r]
+    bound = np.sum(diff**2 // np.maximum(counts, 1)[:, np.newaxis], axis=(1, 2))
+
+    keep = bound < limit
+    pairs_n, pairs_r = pairs_n[keep], pairs_r[keep]
+
+    # Stage 3: full resolution, only for tiles still in the running.
+    num_tiles = len(signatures)
+    needed, pairs_k = np.unique(pairs_n, return_inverse=True)
+
+    selected = tiles[np.unravel_index(needed, tiles.shape[:-3])]
+    if mask is not None:
+        selected = selected * mask[:, :, np.newaxis].astype(selected.dtype)
+    selected = selected.reshape(len(needed), -1)
+
+    ssd = sum_squared_differences(selected[pairs_k], flat_ref[pairs_r])
+
+    passing = ssd < limit
+    pairs_n, pairs_r = pairs_n[passing], pairs_r[passing]
+
+    num = np.bincount(pairs_n, minlength=num_tiles)
+    if np.any(num != 1):
+        raise Exception('Number of matching tiles is not unique: %d' % num[num != 1][0])
+
+    ix_best = np.zeros(num_tiles, dtype=np.int64)
+    ix_best[pairs_n] = pairs_r
+
+    # Done.
+    return [reference.letters[ix] for ix in ix_best]
+
+
+
+def match_tile_letter(tile_test, reference, mask=None):
+    """
+    Letter for a single tile.
+    """
+    return match_tiles(tile_test[np.newaxis], reference, mask)[0]
+
+
+
+def parse_game_letters(img_game, reference_grid, reference_rack, info_config):
     """
     Match game tiles to played letters.
     """
-    
-    # Carve game tiles.
-    tiles_grid_game, tiles_rack_game = carve_tiles(img_game, info_config)
 
-    # Determine letters on game grid.
-    letters_grid = []
-    for ij_test, tile_test in tiles_grid_game:
-        letter = match_tile_letter(tile_test, info_reference_grid)
+    # Views of game tiles.
+    tiles_grid = carve_grid(img_game, info_config)
+    tiles_rack = carve_rack(img_game, info_config)
+
+    # Done.
+    return match_game_letters(tiles_grid, tiles_rack, reference_grid, reference_rack, info_config)
+
+
 
+def grid_letters(letters, num_x):
+    """
+    Played letters as ([i, j], letter) pairs from one letter (or None) per grid square, in C order.
+    Coordinates are as in Board.set_game_letters, counting from one.
+    """
+    letters_grid = []
+    for k, letter in enumerate(letters):
         if letter:
-            ij_test[0] += 1
-            ij_test[1] += 1
-            letters_grid.append( (ij_test, letter) )
-            
+            jj, ii = divmod(k, num_x)
+            letters_grid.append( ([ii+1, jj+1], letter) )
+
+    return letters_grid
+
+
+
+def match_game_letters(tiles_grid, tiles_rack, reference_grid, reference_rack, info_config):
+    """
+    Match carved grid and rack tiles, from carve_grid() and carve_rack(), to played letters.
+    """
+
+    # Determine letters on game grid, all tiles at once.
+    mask = tile_mask(tiles_grid.shape[-2], info_config)
+    reference, mask = scaled_reference(reference_grid, info_config['grid_parameters'], mask)
+    letters = match_tiles(tiles_grid, reference, mask)
+
+    letters_grid = grid_letters(letters, tiles_grid.shape[1])
+
     # Determine letters on game rack.
-    letters_rack = ''
-    for ij_test, tile_test in tiles_rack_game:
-        letter = match_tile_letter(tile_test, info_reference_rack)
+    mask = tile_mask(tiles_rack.shape[-2], info_config)
+    reference, mask = scaled_reference(reference_rack, info_config['rack_parameters'], mask)
+    letters = match_tiles(tiles_rack, reference, mask)
+
+    letters_rack = ''.join(letter for letter in letters if letter)
 
-        if letter:
-            ij_test[0] += 1
-            ij_test[1] += 1
-            letters_rack += letter
-                
     # Done.
     return letters_grid, letters_rack
     
\ No newline at end of file
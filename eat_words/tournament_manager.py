@@ -0,0 +1,297 @@
+from __future__ import division, print_function, unicode_literals
+
+import os
+import glob
+import time
+import multiprocessing
+
+import numpy as np
+
+import bag_manager
+import trie_manager
+import leave_manager
+import selfplay_manager
+
+
+#
+# Self-play tournaments.  Games between two policies are spread over a process pool.  Every worker
+# memory-maps the same compiled dictionary, so it is loaded from disk once and shared.
+#
+# Game k is played from seed + (k,), with policy 0 moving first in even games, so each game's result
+# depends only on the tournament seed and its id, never on which worker played it or when.
+#
+# Results are streamed to a folder of column chunks, results_000000.npz, results_000001.npz, ...
+# A chunk is written every chunk_size games or about every flush_interval seconds, whichever comes
+# first, and when the tournament stops, so a killed run loses little more than flush_interval
+# seconds of games.  A stopped tournament picks up where it left off, skipping games already logged.
+#
+
+columns = ['game_id', 'first', 'score_0', 'score_1', 'bingos_0', 'bingos_1', 'turns'] + \
+          ['time_%s' % phase for phase in selfplay_manager.phases]
+
+
+class ResultLog(object):
+    """
+    Columnar log of game results in a folder.  Results are buffered and written chunk_size games
+    at a time, or sooner when a result arrives flush_interval seconds or more after the oldest one
+    buffered.  Each chunk also records the policies and seed, checked when resuming.
+    """
+
+    def __init__(self, path, names_policy, seed=None, chunk_size=1000, flush_interval=10.):
+        if not os.path.isdir(path):
+            os.makedirs(path)
+
+        self.path = path
+        self.names_policy = list(names_policy)
+        self.chunk_size = chunk_size
+        self.flush_interval = flush_interval
+
+        self._buffer = []
+        self._time_buffer = None
+        self._completed = set()
+
+        fnames = self._chunk_files()
+        for f in fnames:
+            with np.load(f) as data:
+                logged = (list(data['names_policy']), tuple(data['seed'].tolist()))
+                self._completed.update(data['game_id'].tolist())
+
+            if seed is None:
+                seed = logged[1]
+
+            if logged != (self.names_policy, bag_manager.make_seed(seed)):
+                raise Exception('Log %s was written for a different tournament: %s' % (f, logged))
+
+        self.seed = bag_manager.make_seed(seed)
+        self._num_chunks = len(fnames)
+
+
+    def _chunk_files(self):
+        return sorted(glob.glob(os.path.join(self.path, 'results_*.npz')))
+
+
+    def completed_ids(self):
+        """
+        Set of game ids already in the log, written or buffered.
+        """
+        return self._completed | set(game_id for game_id, result in self._buffer)
+
+
+    def append(self, game_id, result):
+        """
+        Add result of one game.
+        """
+        if not self._buffer:
+            self._time_buffer = time.time()
+
+        self._buffer.append( (game_id, result) )
+        if len(self._buffer) >= self.chunk_size or \
+           time.time() - self._time_buffer >= self.flush_interval:
+            self.flush()
+
+
+    def flush(self):
+        """
+        Write buffered results as a new chunk.
+        """
+        if not self._buffer:
+            return
+
+        data = {'names_policy': np.asarray(self.names_policy),
+                'seed': np.asarray(self.seed, dtype=np.int64),
+                'game_id': np.asarray([game_id for game_id, result in self._buffer], dtype=np.int64)}
+
+        for name in columns[1:]:
+            data[name] = np.asarray([result[name] for game_id, result in self._buffer])
+
+        f = os.path.join(self.path, 'results_%06d.npz' % self._num_chunks)
+        f_temp = f + '.tmp'
+        with open(f_temp, 'wb') as fo:
+            np.savez(fo, **data)
+
+        # Chunk appears complete or not at all.
+        os.rename(f_temp, f)
+
+        self._completed.update(game_id for game_id, result in self._buffer)
+        self._buffer = []
+        self._num_chunks += 1
+
+
+    def read(self):
+        """
+        All logged results as a dict of columns, ordered by game id.
+        """
+        parts = dict((name, []) for name in columns)
+        for f in self._chunk_files():
+            with np.load(f) as data:
+                for name in columns:
+                    parts[name].append(data[name])
+
+        if not parts['game_id']:
+            return dict((name, np.zeros(0)) for name in columns)
+
+        results = dict((name, np.concatenate(parts[name])) for name in columns)
+
+        order = np.argsort(results['game_id'], kind='mergesort')
+
+        # Done.
+        return dict((name, values[order]) for name, values in results.items())
+
+
+##################################################
+# Worker processes.
+
+_worker = {}
+
+def _initialize_worker(fname_words, fname_letters, fname_leaves, names_policy):
+    _worker['dawg'] = trie_manager.load_daggad_arrays(fname_words)
+    _worker['leaves'] = leave_manager.read_leaves(fname_leaves)
+    _worker['fname_letters'] = fname_letters
+    _worker['names_policy'] = names_policy
+
+
+
+def _play(task):
+    game_id, seed = task
+
+    result = selfplay_manager.play_game(_worker['dawg'], _worker['fname_letters'],
+                                        _worker['names_policy'], seed, first=game_id % 2,
+                                        leaves=_worker['leaves'])
+
+    return game_id, result
+
+
+##################################################
+
+def wilson_interval(wins, num, z=1.96):
+    """
+    Wilson score confidence interval for a win rate, 95% for z = 1.96.
+    """
+    if num == 0:
+        return 0., 1.
+
+    p = wins / num
+    denom = 1. + z**2 / num
+    center = (p + z**2 / (2*num)) / denom
+    half = z * np.sqrt(p*(1-p) / num + z**2 / (4*num**2)) / denom
+
+    return max(center - half, 0.), min(center + half, 1.)
+
+
+
+def summarize(results):
+    """
+    Tournament statistics from logged result columns.  Ties count as half a win.
+    """
+    num = len(results['game_id'])
+
+    wins = np.sum(results['score_0'] > results['score_1']) + 0.5*np.sum(results['score_0'] == results['score_1'])
+
+    summary = {'games': num,
+               'wins_0': float(wins),
+               'win_rate_0': wins / num if num else 0.,
+               'win_interval_0': wilson_interval(wins, num)}
+
+    if num:
+        summary['mean_score_0'] = float(np.mean(results['score_0']))
+        summary['mean_score_1'] = float(np.mean(results['score_1']))
+        summary['mean_bingos_0'] = float(np.mean(results['bingos_0']))
+        summary['mean_bingos_1'] = float(np.mean(results['bingos_1']))
+        summary['mean_turns'] = float(np.mean(results['turns']))
+
+        time_total = sum(np.sum(results['time_%s' % phase]) for phase in selfplay_manager.phases)
+        for phase in selfplay_manager.phases:
+            seconds = np.sum(results['time_%s' % phase])
+            summary['time_%s' % phase] = float(seconds / num)
+            summary['share_%s' % phase] = float(seconds / time_total) if time_total else 0.
+
+    # Done.
+    return summary
+
+
+
+def print_summary(summary, names_policy):
+    print('Games: %d' % summary['games'])
+    if 'games_per_second' in summary:
+        print('Games per second: %.2f' % summary['games_per_second'])
+
+    if not summary['games']:
+        return
+
+    low, high = summary['win_interval_0']
+    print('%s vs %s: win rate %.3f, 95%% interval [%.3f, %.3f]' %
+          (names_policy[0], names_policy[1], summary['win_rate_0'], low, high))
+    print('Mean score: %.1f vs %.1f,  bingos: %.2f vs %.2f,  turns: %.1f' %
+          (summary['mean_score_0'], summary['mean_score_1'],
+           summary['mean_bingos_0'], summary['mean_bingos_1'], summary['mean_turns']))
+
+    for phase in selfplay_manager.phases:
+        print('    %-10s %8.4f s/game  %5.1f%%' %
+              (phase, summary['time_%s' % phase], 100*summary['share_%s' % phase]))
+
+
+
+def run_tournament(path_log, names_policy, num_games, seed=None, processes=None,
+                   fname_words=None, fname_letters=None, fname_leaves=None, chunk_size=1000,
+                   flush_interval=10.):
+    """
+    Play games 0 .. num_games-1 between two named policies, see selfplay_manager.policies, skipping
+    games already in the log folder.  A new tournament without a seed draws one from the OS, a
+    resumed tournament reuses the logged seed.  Results are logged as in ResultLog.
+
+    Return summary of all logged games, plus games per second for games played in this call.
+    """
+    if fname_words is None or fname_letters is None or fname_leaves is None:
+        path_module = os.path.dirname(os.path.abspath(__file__))
+        path_words = os.path.join(path_module, 'data', 'words and letters')
+
+        fname_words = fname_words or os.path.join(path_words, 'words_zynga.txt')
+        fname_letters = fname_letters or os.path.join(path_words, 'letters_zynga.yml')
+        fname_leaves = fname_leaves or os.path.join(path_words, 'leaves_zynga.yml')
+
+    log = ResultLog(path_log, names_policy, seed, chunk_size, flush_interval)
+
+    completed = log.completed_ids()
+    tasks = [(game_id, log.seed + (game_id,)) for game_id in range(num_games)
+             if game_id not in completed]
+
+    # Compile the shared dictionary once, before any worker wants it.
+    trie_manager.load_daggad_arrays(fname_words)
+
+    pool = multiprocessing.Pool(processes, _initialize_worker,
+                                (fname_words, fname_letters, fname_leaves, list(names_policy)))
+
+    time_start = time.time()
+    try:
+        for game_id, result in pool.imap_unordered(_play, tasks, chunksize=4):
+            log.append(game_id, result)
+
+        pool.close()
+    except:
+        pool.terminate()
+        raise
+    finally:
+        pool.join()
+        log.flush()
+
+    time_elapsed = time.time() - time_start
+
+    summary = summarize(log.read())
+    summary['games_per_second'] = len(tasks) / time_elapsed if tasks else 0.
+
+    # Done.
+    return summary
+
+
+
+if __name__ == '__main__':
+    import sys
+
+    path_module = os.path.dirname(os.path.abspath(__file__))
+    path_log = os.path.join(path_module, 'data', 'tournaments', 'equity_vs_score')
+
+    num_games = int(sys.argv[1]) if len(sys.argv) > 1 else 100
+    names_policy = ['equity', 'score']
+
+    summary = run_tournament(path_log, names_policy, num_games, seed=1234, chunk_size=20)
+    print_summary(summary, names_policy)
@@ -0,0 +1,153 @@
+from __future__ import division, print_function, unicode_literals
+
+import numpy as np
+
+import tiles
+
+
+#
+# Incremental parsing of an ongoing game.  Successive screenshots of one game differ only by the
+# last move or two, so the tracker keeps the previous screenshot's grid pixels and letters and
+# compares the new grid square by square.  Only squares with some pixel changed under the tile mask
+# go to the reference tiles, every other square keeps its letter.  The classifier sees nothing but
+# masked pixels, so results equal a full parse.  The rack is always matched in full.
+#
+
+class GameTracker(object):
+    """
+    Parsed state of one game, updated from successive screenshots.
+    """
+
+    def __init__(self, reference_grid, reference_rack, info_config):
+        self.reference_grid = reference_grid
+        self.reference_rack = reference_rack
+        self.info_config = info_config
+
+        self.reset()
+
+
+    def reset(self):
+        """
+        Forget previous screenshot, next update parses the whole grid.
+        """
+        self._pixels = None
+        self._letters = None
+
+        self.letters_rack = ''
+        self.num_changed = 0
+
+
+    @property
+    def letters_grid(self):
+        """
+        Played letters as ([i, j], letter) pairs, as from tiles.parse_game_letters.
+        """
+        if self._letters is None:
+            return []
+
+        return tiles.grid_letters(self._letters.ravel(), self._letters.shape[1])
+
+
+    def changed_squares(self, tiles_grid):
+        """
+        Boolean array shaped (num_y, num_x), True for squares differing from the previous screenshot
+        under the tile mask.  All True if there is none.
+        """
+        if self._pixels is None or self._pixels.shape != tiles_grid.shape:
+            return np.ones(tiles_grid.shape[:2], dtype=bool)
+
+        mask = tiles.tile_mask(tiles_grid.shape[-2], self.info_config)
+
+        different = np.any(tiles_grid != self._pixels, axis=-1) & mask
+
+        return np.any(different, axis=(2, 3))
+
+
+    def update(self, img_game):
+        """
+        Parse a new screenshot of the game, matching only squares that changed.
+        Return letters_grid, letters_rack as from tiles.parse_game_letters.
+        """
+        tiles_grid = tiles.carve_grid(img_game, self.info_config)
+        tiles_rack = tiles.carve_rack(img_game, self.info_config)
+
+        changed = self.changed_squares(tiles_grid)
+
+        letters = np.empty(changed.shape, dtype=object)
+        if self._letters is not None and self._letters.shape == changed.shape:
+            letters[...] = self._letters
+
+        if changed.any():
+            mask = tiles.tile_mask(tiles_grid.shape[-2], self.info_config)
+            reference, mask = tiles.scaled_reference(self.reference_grid,
+                                                     self.info_config['grid_parameters'], mask)
+            letters[changed] = tiles.match_tiles(tiles_grid[changed], reference, mask)
+
+        mask = tiles.tile_mask(tiles_rack.shape[-2], self.info_config)
+        reference, mask = tiles.scaled_reference(self.reference_rack,
+                                                 self.info_config['rack_parameters'], mask)
+        letters_rack = ''.join(letter for letter in tiles.match_tiles(tiles_rack, reference, mask)
+                               if letter)
+
+        # Keep state only once the whole screenshot has parsed.
+        if self._pixels is None or self._pixels.shape != tiles_grid.shape:
+            self._pixels = np.array(tiles_grid)
+        else:
+            self._pixels[changed] = tiles_grid[changed]
+
+        self._letters = letters
+        self.letters_rack = letters_rack
+        self.num_changed = int(changed.sum())
+
+        # Done.
+        return self.letters_grid, self.letters_rack
+
+
+
+if __name__ == '__main__':
+    import os
+    import glob
+
+    import data_io as io
+
+    from timer import Timer
+
+    path_module = os.path.dirname(os.path.abspath(__file__))
+    path_data = os.path.join(path_module, 'data')
+
+    info_config = io.read(os.path.join(path_data, 'config.yml'))
+    reference_grid, reference_rack = tiles.load_reference_tiles()
+
+    fname = sorted(glob.glob(os.path.join(path_data, 'games', '*.png')))[0]
+    img, meta = io.read(fname)
+
+    tracker = GameTracker(reference_grid, reference_rack, info_config)
+
+    with Timer('First screenshot'):
+        letters_grid, letters_rack = tracker.update(img)
+    print('Changed: %d, letters: %d, rack: %s' % (tracker.num_changed, len(letters_grid), letters_rack))
+
+    with Timer('Same screenshot'):
+        tracker.update(img)
+    print('Changed: %d' % tracker.num_changed)
+
+    # Play a tile onto an empty square.
+    dx = info_config['grid_parameters']['dx']
+    i0 = info_config['grid_parameters']['i0']
+    j0 = info_config['grid_parameters']['j0']
+
+    played = set((i-1, j-1) for (i, j), letter in letters_grid)
+    empty = [(ii, jj) for jj in range(15) for ii in range(15) if (ii, jj) not in played]
+    ii, jj = empty[len(empty) // 2]
+
+    k = reference_grid.letters.index('q')
+    img_next = np.array(img)
+    img_next[j0 + jj*dx:j0 + (jj+1)*dx, i0 + ii*dx:i0 + (ii+1)*dx] = reference_grid.tiles[k]
+
+    with Timer('Next move'):
+        letters_grid, letters_rack = tracker.update(img_next)
+    print('Changed: %d, letters: %d' % (tracker.num_changed, len(letters_grid)))
+
+    print('Same as full parse: %s' %
+          ((letters_grid, letters_rack) ==
+           tiles.parse_game_letters(img_next, reference_grid, reference_rack, info_config)))
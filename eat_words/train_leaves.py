@@ -0,0 +1,235 @@
+from __future__ import division, print_function, unicode_literals
+
+import os
+import time
+import multiprocessing
+
+import numpy as np
+
+import bag_manager
+import trie_manager
+import leave_manager
+import selfplay_manager
+
+from bag_manager import alphabet
+
+
+#
+# Fit leave values to self-play.  Each turn's leave is paired with the score its owner makes on
+# their next turn, and the leave table is fitted by least squares:
+#
+#     next_score ~ base + sum over letters L held of values[L, count of L]
+#
+# Features are one-hot over (letter, count), so the normal equations X^T X and X^T y are small
+# (1 + 27*rack_size square) and simply add up across games and worker processes.
+#
+# Each round is an incremental update.  The fit is pulled towards the current table, each
+# (letter, count) value with weight prior times the number of leaves holding it this round, so the
+# table counts for prior times as much as the round's own games whatever their number.  With
+# prior=1 and ridge=0, a value moves half way from its previous value to its least squares fit
+# with the other values held fixed.  A small fixed weight ridge is added to every value's pull, so
+# values seen in only a few leaves move less than that.  Letter counts never seen in play keep
+# their previous values.
+#
+# Only turns that refill a full rack are used.
+#
+
+def leave_features(counts, rack_size):
+    """
+    One-hot feature rows for leaves given as letter counts shaped (num, 27).  Column 0 is the
+    constant term, column 1 + L*rack_size + c-1 is holding c copies of letter L.
+    """
+    counts = np.minimum(np.asarray(counts), rack_size)
+    num = len(counts)
+
+    X = np.zeros((num, 1 + len(alphabet)*rack_size))
+    X[:, 0] = 1.
+
+    rows, letters = np.nonzero(counts)
+    X[rows, 1 + letters*rack_size + counts[rows, letters] - 1] = 1.
+
+    return X
+
+
+
+def game_samples(record, table):
+    """
+    Leave counts and next-turn scores from one game's turn record, see selfplay_manager.play_game.
+    """
+    rack_size = table.rack_size
+
+    counts = []
+    targets = []
+    for t, (player, leave, score, count_bag) in enumerate(record[:-2]):
+        if count_bag < rack_size - len(leave):
+            continue
+
+        # Players alternate, so this player's next turn is two entries on.
+        counts.append(table.counts(leave))
+        targets.append(record[t+2][2])
+
+    if not counts:
+        return np.zeros((0, len(alphabet)), dtype=np.int32), np.zeros(0)
+
+    return np.asarray(counts), np.asarray(targets, dtype=np.float64)
+
+
+##################################################
+# Worker processes.
+
+_worker = {}
+
+def _initialize_worker(fname_words, fname_letters, names_policy):
+    _worker['dawg'] = trie_manager.load_daggad_arrays(fname_words)
+    _worker['fname_letters'] = fname_letters
+    _worker['names_policy'] = names_policy
+
+
+
+def _play_batch(task):
+    """
+    Play a batch of games, return summed normal equations.
+    """
+    seeds, values = task
+
+    table = leave_manager.LeaveTable(values, values.shape[1] - 1)
+
+    counts = []
+    targets = []
+    for k, seed in enumerate(seeds):
+        record = []
+        selfplay_manager.play_game(_worker['dawg'], _worker['fname_letters'], _worker['names_policy'],
+                                   seed, first=k % 2, leaves=table, record=record)
+
+        c, y = game_samples(record, table)
+        counts.append(c)
+        targets.append(y)
+
+    X = leave_features(np.concatenate(counts), table.rack_size)
+    y = np.concatenate(targets)
+
+    return np.dot(X.T, X), np.dot(X.T, y), len(y)
+
+
+##################################################
+
+def fit_leaves(XtX, Xty, table_prior, prior=1., ridge=1.):
+    """
+    Solve regularized normal equations for a new leave table.  Each (letter, count) value is
+    pulled towards its value in table_prior with weight prior times its number of samples, the
+    diagonal of XtX, plus ridge.  Values without samples keep their prior value, the constant term
+    is free.
+    """
+    rack_size = table_prior.rack_size
+    w_prior = np.concatenate([[0.], np.asarray(table_prior.values)[:, 1:].ravel()])
+
+    samples = np.diag(XtX)
+    penalty = float(prior) * samples + float(ridge)
+
+    # Nothing else constrains a value without samples, any weight pins it to the prior.
+    penalty[(samples == 0) & (penalty == 0)] = 1.
+    penalty[0] = 0.
+
+    A = XtX + np.diag(penalty)
+    b = Xty + penalty * w_prior
+
+    w = np.linalg.lstsq(A, b, rcond=None)[0]
+
+    values = np.zeros((len(alphabet), rack_size+1))
+    values[:, 1:] = w[1:].reshape(len(alphabet), rack_size)
+
+    # Done.
+    return leave_manager.LeaveTable(values, rack_size), w[0]
+
+
+
+def train_leaves(fname_out, num_games, num_rounds=1, table_start=None, seed=None, processes=None,
+                 batch_size=10, prior=1., ridge=1., names_policy=('equity', 'equity'),
+                 fname_words=None, fname_letters=None):
+    """
+    Play num_games self-play games per round with the current table, refit, repeat.  Start from
+    table_start (a LeaveTable or leave file name, e.g. an earlier output), or the default leave file.
+    The final table is written to fname_out as .npy, for leave_manager.read_leaves().
+
+    Return final LeaveTable and a list of per-round stats: games and leaves used, fitted base
+    score, and seconds.
+    """
+    path_module = os.path.dirname(os.path.abspath(__file__))
+    path_words = os.path.join(path_module, 'data', 'words and letters')
+
+    fname_words = fname_words or os.path.join(path_words, 'words_zynga.txt')
+    fname_letters = fname_letters or os.path.join(path_words, 'letters_zynga.yml')
+
+    if table_start is None:
+        table_start = os.path.join(path_words, 'leaves_zynga.yml')
+
+    if isinstance(table_start, leave_manager.LeaveTable):
+        table = table_start
+    else:
+        table = leave_manager.read_leaves(table_start)
+
+    seed = bag_manager.make_seed(seed)
+
+    # Compile the shared dictionary once, before any worker wants it.
+    trie_manager.load_daggad_arrays(fname_words)
+
+    pool = multiprocessing.Pool(processes, _initialize_worker,
+                                (fname_words, fname_letters, list(names_policy)))
+    rounds = []
+    try:
+        for r in range(num_rounds):
+            time_start = time.time()
+
+            values = np.array(table.values)
+            seeds = bag_manager.spawn_seeds(seed + (r,), num_games)
+            tasks = [(seeds[k:k+batch_size], values) for k in range(0, num_games, batch_size)]
+
+            size = 1 + len(alphabet)*table.rack_size
+            XtX = np.zeros((size, size))
+            Xty = np.zeros(size)
+            num = 0
+            for XtX_batch, Xty_batch, num_batch in pool.imap_unordered(_play_batch, tasks):
+                XtX += XtX_batch
+                Xty += Xty_batch
+                num += num_batch
+
+            table, base = fit_leaves(XtX, Xty, table, prior, ridge)
+
+            rounds.append({'games': num_games, 'leaves': num, 'base': float(base),
+                           'time': time.time() - time_start})
+
+        pool.close()
+    except:
+        pool.terminate()
+        raise
+    finally:
+        pool.join()
+
+    leave_manager.write_leaves(fname_out, table)
+
+    # Done.
+    return table, rounds
+
+
+
+def print_rounds(rounds):
+    for r, stats in enumerate(rounds):
+        print('Round %d: %d games, %d leaves, base %.2f, %.1f s' %
+              (r, stats['games'], stats['leaves'], stats['base'], stats['time']))
+
+
+
+if __name__ == '__main__':
+    import sys
+
+    path_module = os.path.dirname(os.path.abspath(__file__))
+    f = os.path.join(path_module, 'data', 'words and letters', 'leaves_zynga_trained.npy')
+
+    num_games = int(sys.argv[1]) if len(sys.argv) > 1 else 100
+
+    table_start = f if os.path.isfile(f) else None
+    table, rounds = train_leaves(f, num_games, table_start=table_start, seed=1234)
+    print_rounds(rounds)
+
+    for leave in ['s', 'ss', '_', 'e', 'q', 'v', 'aeinr', 'iiuuv']:
+        print('%8s %6.1f' % (leave, table.value(leave)))
@@ -3,6 +3,8 @@ import sys
 import os
 import cPickle as pickle
 
+import numpy as np
+
 #
 # Helper functions.
 #
@@ -176,6 +178,24 @@ class Dawg(object):
 
         return node.final
 
+    def search_words(self, words):
+        """Check a batch of words in one call.
+        Returns list of words not found, empty if all are valid.
+        """
+        root = self.root
+        missing = []
+        for word in words:
+            node = root
+            for letter in word:
+                node = node.edges.get(letter)
+                if node is None:
+                    break
+
+            if node is None or not node.final:
+                missing.append(word)
+
+        return missing
+
     @property
     def node_count(self):
         return len(self.minimizedNodes)
@@ -257,6 +277,218 @@ class Daggad(Dawg):
         # Done.
 
 
+#########################################################
+#
+# Compiled dictionary.  A Dawg or Daggad flattened to one int32 array, saved as a .npy file that any
+# number of processes may memory-map read-only and share:
+#
+#   [num_nodes, num_edges, offsets (num_nodes+1), final (num_nodes), labels (num_edges), targets (num_edges)]
+#
+# Edges of node n are labels[offsets[n]:offsets[n+1]] (character codes), leading to nodes
+# targets[...].  The root is node 0.
+#
+
+def compile_arrays(dawg):
+    """Flatten a Dawg or Daggad to a single int32 array.
+    """
+    index = {id(dawg.root): 0}
+    nodes = [dawg.root]
+
+    k = 0
+    while k < len(nodes):
+        for label, child in sorted(nodes[k].edges.items()):
+            if id(child) not in index:
+                index[id(child)] = len(nodes)
+                nodes.append(child)
+        k += 1
+
+    num_nodes = len(nodes)
+    num_edges = sum(len(node.edges) for node in nodes)
+
+    data = np.zeros(2 + (num_nodes+1) + num_nodes + 2*num_edges, dtype=np.int32)
+    data[0] = num_nodes
+    data[1] = num_edges
+
+    offsets, final, labels, targets = _split_arrays(data)
+
+    e = 0
+    for n, node in enumerate(nodes):
+        offsets[n] = e
+        final[n] = node.final
+        for label, child in sorted(node.edges.items()):
+            labels[e] = ord(label)
+            targets[e] = index[id(child)]
+            e += 1
+
+    offsets[num_nodes] = e
+
+    # Done.
+    return data
+
+
+def _split_arrays(data):
+    """Views onto the parts of a compiled dictionary array.
+    """
+    num_nodes, num_edges = int(data[0]), int(data[1])
+
+    a = 2
+    b = a + num_nodes + 1
+    c = b + num_nodes
+    d = c + num_edges
+
+    return data[a:b], data[b:c], data[c:d], data[d:d+num_edges]
+
+
+
+class ArrayEdges(object):
+    """Edges of an ArrayNode: a read-only mapping from label to child node.
+    Holds child indices only, children are fetched from the dawg's node cache when looked up.
+    """
+    __slots__ = ['_dawg', '_targets']
+
+    def __init__(self, dawg, targets):
+        self._dawg = dawg
+        self._targets = targets
+
+
+    def get(self, label, default=None):
+        index = self._targets.get(label)
+        if index is None:
+            return default
+        return self._dawg.node(index)
+
+    def __getitem__(self, label):
+        return self._dawg.node(self._targets[label])
+
+    def __contains__(self, label):
+        return label in self._targets
+
+    def __len__(self):
+        return len(self._targets)
+
+    def __iter__(self):
+        return iter(self._targets)
+
+    def keys(self):
+        return list(self._targets)
+
+    def items(self):
+        node = self._dawg.node
+        return [(L, node(index)) for L, index in self._targets.items()]
+
+
+
+class ArrayNode(object):
+    """Node of an ArrayDawg, with the same final and edges attributes as DawgNode.
+    Edges are read from the arrays on first use.
+    """
+    __slots__ = ['id', 'final', '_dawg', '_edges']
+
+    def __init__(self, dawg, index):
+        self.id = index
+        self.final = bool(dawg.final[index])
+
+        self._dawg = dawg
+        self._edges = None
+
+
+    @property
+    def edges(self):
+        if self._edges is None:
+            dawg = self._dawg
+            a, b = dawg.offsets[self.id], dawg.offsets[self.id+1]
+
+            labels = [chr(c) for c in dawg.labels[a:b].tolist()]
+            targets = dawg.targets[a:b].tolist()
+
+            self._edges = ArrayEdges(dawg, dict(zip(labels, targets)))
+
+        return self._edges
+
+
+
+class ArrayDawg(object):
+    """Dictionary searches over a compiled array, usually memory-mapped from a .npy file.
+    Drop-in replacement for a Dawg or Daggad wherever only root, search() and search_words() are
+    used, e.g. board cross checks and move generation.
+
+    Nodes are built as they are visited and kept in a two-generation cache: once cache_size nodes
+    are in the current generation it becomes the old one and the previous old generation is
+    dropped.  Nodes found in the old generation move back to the current one, so recently used
+    nodes survive.  Nodes refer to their children by index only, so the dawg holds at most
+    2*cache_size nodes.  Only those take private memory, the arrays themselves stay shared.
+    """
+
+    def __init__(self, data, cache_size=100000):
+        self.data = data
+        self.offsets, self.final, self.labels, self.targets = _split_arrays(data)
+
+        self.cache_size = cache_size
+        self._nodes = {}
+        self._nodes_old = {}
+
+        self.root = ArrayNode(self, 0)
+
+
+    def node(self, index):
+        """Node at supplied index.
+        """
+        node = self._nodes.get(index)
+        if node is None:
+            node = self._nodes_old.get(index)
+            if node is None:
+                node = ArrayNode(self, index)
+
+            if len(self._nodes) >= self.cache_size:
+                self._nodes_old = self._nodes
+                self._nodes = {}
+
+            self._nodes[index] = node
+
+        return node
+
+
+    def search(self, word):
+        """Check to see if word exists in current structure.
+        Returns True or False.
+        """
+        return not self.search_words([word])
+
+
+    def search_words(self, words):
+        """Check a batch of words in one call.
+        Returns list of words not found, empty if all are valid.
+        """
+        missing = []
+        for word in words:
+            node = self.root
+            for letter in word:
+                node = node.edges.get(letter)
+                if node is None:
+                    break
+
+            if node is None or not node.final:
+                missing.append(word)
+
+        return missing
+
+    @property
+    def node_count(self):
+        return len(self.final)
+
+    @property
+    def edge_count(self):
+        return len(self.labels)
+
+
+def load_arrays(fname):
+    """Memory-map a compiled dictionary from file.
+    """
+    data = np.load(fname, mmap_mode='r')
+
+    return ArrayDawg(data)
+
+
 # Another helper.
 def load_daggad_dictionary(fname_words):
 
@@ -284,6 +516,19 @@ def load_daggad_dictionary(fname_words):
     return daggad
 
 
+def load_daggad_arrays(fname_words):
+    """Compiled Daggad for supplied word list, memory-mapped.  Compiled and saved on first use.
+    """
+    fname_arrays = os.path.splitext(fname_words)[0] + '.daggad.npy'
+
+    if not os.path.isfile(fname_arrays):
+        daggad = load_daggad_dictionary(fname_words)
+        np.save(fname_arrays, compile_arrays(daggad))
+
+    # Done.
+    return load_arrays(fname_arrays)
+
+
 ###############################################################
 # Testing.
 
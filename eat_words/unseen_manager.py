@@ -0,0 +1,253 @@
+from __future__ import division, print_function, unicode_literals
+
+import collections
+import numpy as np
+
+import data_io as io
+
+from bag_manager import alphabet
+
+
+# Log factorials for hypergeometric probabilities.
+_log_factorial = np.concatenate([[0.], np.cumsum(np.log(np.arange(1, 1025)))])
+
+
+def log_comb(n, k):
+    """
+    Log of binomial coefficient C(n, k), elementwise.  -inf where k < 0 or k > n.
+    """
+    n = np.asarray(n)
+    k = np.asarray(k)
+
+    valid = (k >= 0) & (k <= n)
+    n_ = np.where(valid, n, 0)
+    k_ = np.where(valid, k, 0)
+
+    val = _log_factorial[n_] - _log_factorial[k_] - _log_factorial[n_ - k_]
+
+    return np.where(valid, val, -np.inf)
+
+
+
+def hypergeometric_pmf(counts, total, num_draw):
+    """
+    Probability of drawing exactly x copies of each letter, for x = 0 .. num_draw, when drawing
+    num_draw tiles from a pool of total tiles holding counts[L] copies of letter L.
+    Return array shaped (len(counts), num_draw+1).
+    """
+    counts = np.asarray(counts)[:, np.newaxis]
+    x = np.arange(num_draw+1)[np.newaxis, :]
+
+    log_p = log_comb(counts, x) + log_comb(total - counts, num_draw - x) - log_comb(total, num_draw)
+
+    return np.exp(log_p)
+
+
+##################################################
+
+class Unseen(object):
+    """
+    Tiles we have not seen: the full letter distribution, less tiles on the board, less our rack.
+    This is the pool the opponent's rack and the bag are drawn from.
+
+    Counts are ordered as the bag's alphabet, blanks last.  Letters played from a blank are
+    uppercase on the board and count as blanks.
+
+    Tiles reach the board two ways.  Letters we never held, those already on the board and each
+    opponent move, go through observe_board().  Our own moves go through observe_play(), since
+    their tiles came off our rack and were never unseen.
+    """
+
+    def __init__(self, fname_definition, rack_size=7):
+        """
+        Start from the full distribution in the letter definition file.
+        """
+        definition = io.read(fname_definition)
+
+        self._index = dict((L, k) for k, L in enumerate(alphabet))
+        self.frequency = np.asarray([definition['frequency'][L] for L in alphabet], dtype=np.int32)
+        self.rack_size = rack_size
+
+        self.reset()
+
+
+    def reset(self):
+        """
+        Nothing on the board, nothing on our rack.
+        """
+        self.counts = self.frequency.copy()
+        self._rack = np.zeros_like(self.frequency)
+        self._cache = {}
+
+
+    def _code(self, L):
+        if L.isupper():
+            return self._index['_']
+        return self._index[L]
+
+
+    def _rack_counts(self, letters):
+        rack = np.zeros_like(self.frequency)
+        for L in letters:
+            rack[self._index[L]] += 1
+
+        return rack
+
+
+    def _update(self, counts, rack, letters):
+        if np.any(counts < 0):
+            raise Exception('Accounting error.  Rack letters not among unseen tiles: %s' % letters)
+
+        self.counts = counts
+        self._rack = rack
+        self._cache = {}
+
+
+    def observe_board(self, ij_letters):
+        """
+        Remove letters placed on the board by anyone but us: those in Board.set_game_letters at the
+        start, or an opponent's move.  For our own moves use observe_play().
+        """
+        counts = self.counts.copy()
+        for ij, L in ij_letters:
+            k = self._code(L)
+            if counts[k] == 0:
+                raise Exception('Accounting error.  No unseen letters of type "%s".' % L)
+            counts[k] -= 1
+
+        self.counts = counts
+        self._cache = {}
+
+
+    def observe_play(self, ij_letters, rack_after=None):
+        """
+        Our own move: letters played, e.g. as passed to Board.play_letters, move from our rack to
+        the board, and the rack becomes rack_after, the letters left plus those drawn.  Unseen
+        counts change only by the tiles drawn.  Without rack_after the rack is just what is left.
+        """
+        rack = self._rack.copy()
+        for ij, L in ij_letters:
+            k = self._code(L)
+            if rack[k] == 0:
+                raise Exception('Accounting error.  Letter "%s" played is not on our rack.' % L)
+            rack[k] -= 1
+
+        if rack_after is None:
+            self._update(self.counts, rack, '')
+            return
+
+        rack_new = self._rack_counts(rack_after)
+        self._update(self.counts + rack - rack_new, rack_new, rack_after)
+
+
+    def set_rack(self, letters):
+        """
+        Replace our rack letters, e.g. at the start of a game or after an exchange.
+        """
+        rack = self._rack_counts(letters)
+        self._update(self.counts + self._rack - rack, rack, letters)
+
+
+    ###########################################
+
+    @property
+    def count(self):
+        """
+        Number of unseen tiles.
+        """
+        return int(self.counts.sum())
+
+
+    @property
+    def count_bag(self):
+        """
+        Number of tiles left in the bag, with the opponent holding a full rack if possible.
+        """
+        return max(self.count - self.rack_size, 0)
+
+
+    def letters(self):
+        """
+        Unseen letters as a Counter.
+        """
+        return collections.Counter(dict(zip(alphabet, self.counts.tolist())))
+
+
+    def pmf(self, num_draw):
+        """
+        Hypergeometric probabilities of holding exactly x copies of each letter among num_draw
+        tiles taken from the unseen pool, shaped (27, num_draw+1).  Cached until counts change.
+        """
+        num_draw = min(num_draw, self.count)
+        if num_draw not in self._cache:
+            self._cache[num_draw] = hypergeometric_pmf(self.counts, self.count, num_draw)
+
+        return self._cache[num_draw]
+
+
+    def prob_at_least(self, num_draw, number=1):
+        """
+        Probability for each letter of at least number copies among num_draw unseen tiles.
+        """
+        return self.pmf(num_draw)[:, number:].sum(axis=1)
+
+
+    def prob_opponent_holds(self, letters=None, number=1):
+        """
+        Probability that the opponent's rack holds at least number copies of each letter.
+        Return array over the alphabet, or over the supplied letters.
+        """
+        prob = self.prob_at_least(min(self.rack_size, self.count), number)
+
+        if letters is None:
+            return prob
+
+        return prob[[self._index[L] for L in letters]]
+
+
+    def prob_draw(self, num_draw, letters=None, number=1):
+        """
+        Probability of drawing at least number copies of each letter when drawing num_draw tiles
+        next turn.  From our side the bag and the opponent's rack are indistinguishable, so this is
+        a draw from the whole unseen pool.
+        """
+        prob = self.prob_at_least(num_draw, number)
+
+        if letters is None:
+            return prob
+
+        return prob[[self._index[L] for L in letters]]
+
+
+    def expected_counts(self, num_draw):
+        """
+        Expected number of copies of each letter among num_draw unseen tiles.
+        """
+        total = self.count
+        if total == 0:
+            return np.zeros(len(alphabet))
+
+        return num_draw * self.counts / total
+
+
+
+if __name__ == '__main__':
+    import os
+
+    from timer import Timer
+
+    path_module = os.path.dirname(os.path.abspath(__file__))
+    f = os.path.join(path_module, 'data', 'words and letters', 'letters_zynga.yml')
+
+    unseen = Unseen(f)
+
+    unseen.observe_board([((8, 8), 'q'), ((9, 8), 'i'), ((10, 8), 'S')])
+    unseen.set_rack('aeinrst')
+
+    print('unseen: %d, bag: %d' % (unseen.count, unseen.count_bag))
+    print(unseen.prob_opponent_holds('q_sz'))
+    print(unseen.prob_draw(3, 'es'))
+
+    with Timer('10000 queries'):
+        for k in range(10000):
+            unseen.prob_opponent_holds()
@@ -0,0 +1,311 @@
+from __future__ import division, print_function, unicode_literals
+
+import os
+import sys
+import json
+import time
+import fnmatch
+import logging
+import collections
+
+import data_io as io
+
+import tiles
+import bag_manager
+import board_manager
+import move_manager
+import trie_manager
+import tracker_manager
+
+
+#
+# Hot folder.  A long-running watcher keeps the dictionary, reference tiles and calibrated geometry
+# resident, and polls a folder for new or changed screenshots.  Each one is parsed, solved, and the
+# result written next to it, e.g. game.png -> game.json:
+#
+#     {"image": ..., "image_stat": [size, mtime], "board": [[i, j, letter], ...], "rack": ...,
+#      "error": null, "moves": [[score, [[i, j, letter], ...]], ...],
+#      "time_parse": ..., "time_solve": ...}
+#
+# Board coordinates are as in Board.set_game_letters, letters played from a blank are uppercase.
+# Moves are the best num_moves by score.
+#
+# A screenshot is taken once its size and modification time are unchanged for one poll, so files
+# still being copied in are left alone.  Each result records the size and modification time of the
+# screenshot it came from, and a screenshot is processed again whenever they change, whether or not
+# it parsed before.  A restarted watcher picks up where it left off.
+#
+# Problems with one file, or with reading the folder, are logged and the watcher carries on.
+#
+# Screenshots are parsed through a GameTracker per screenshot file, the game it shows being updated
+# in place: each new screenshot of a game only matches squares that changed.  Trackers of the
+# num_trackers most recently processed files are kept.
+#
+
+logger = logging.getLogger(__name__)
+
+
+class Watcher(object):
+    """
+    Parse and solve screenshots dropped into a folder.
+    """
+
+    def __init__(self, path_games, fname_words=None, fname_letters=None, fname_config=None,
+                 fname_geometry=None, num_moves=10, pattern='*.png', num_trackers=16):
+        path_module = os.path.dirname(os.path.abspath(__file__))
+        path_data = os.path.join(path_module, 'data')
+        path_words = os.path.join(path_data, 'words and letters')
+
+        if fname_words is None:
+            fname_words = os.path.join(path_words, 'words_zynga.txt')
+
+        if fname_letters is None:
+            fname_letters = os.path.join(path_words, 'letters_zynga.yml')
+
+        if fname_config is None:
+            fname_config = os.path.join(path_data, 'config.yml')
+
+        if fname_geometry is None:
+            fname_geometry = tiles.default_geometry_cache()
+
+        self.path_games = path_games
+        self.fname_geometry = fname_geometry
+        self.num_moves = num_moves
+        self.pattern = pattern
+        self.num_trackers = num_trackers
+
+        self.dawg = trie_manager.load_daggad_arrays(fname_words)
+        self.letter_points = bag_manager.Bag(fname_letters).letter_points
+        self.info_config = io.read(fname_config)
+        self.reference_grid, self.reference_rack = tiles.load_reference_tiles()
+
+        # Game trackers, keyed by file name and image shape, most recently used last.
+        self._trackers = collections.OrderedDict()
+
+        # File size and modification time at last poll, and those each result came from, keyed by
+        # file name.
+        self._stat = {}
+        self._done = {}
+
+
+    ###########################################
+
+    @staticmethod
+    def result_name(fname):
+        return os.path.splitext(fname)[0] + '.json'
+
+
+    def _result_stat(self, fname):
+        """
+        Screenshot size and modification time recorded in its result file, None if there is none.
+        """
+        try:
+            with open(self.result_name(fname)) as fo:
+                stat = json.load(fo).get('image_stat')
+        except (IOError, OSError, ValueError):
+            return None
+
+        return tuple(stat) if stat else None
+
+
+    def pending(self):
+        """
+        Screenshots matching pattern ready to process: size or modification time differ from those
+        of their result, and are unchanged since the previous poll.
+        """
+        try:
+            names = sorted(os.listdir(self.path_games))
+        except OSError as e:
+            logger.warning('Unable to read folder %s: %s', self.path_games, e)
+            return []
+
+        stat = {}
+        for name in names:
+            if not fnmatch.fnmatch(name, self.pattern):
+                continue
+
+            fname = os.path.join(self.path_games, name)
+            try:
+                s = os.stat(fname)
+            except OSError:
+                continue
+
+            if fname not in self._done:
+                self._done[fname] = self._result_stat(fname)
+
+            if self._done[fname] != (s.st_size, s.st_mtime):
+                stat[fname] = (s.st_size, s.st_mtime)
+
+        ready = [fname for fname in sorted(stat) if self._stat.get(fname) == stat[fname]]
+        self._stat = stat
+
+        # Forget files since removed.
+        names = set(os.path.join(self.path_games, name) for name in names)
+        self._done = dict((fname, v) for fname, v in self._done.items() if fname in names)
+        self._trackers = collections.OrderedDict((key, tracker) for key, tracker in
+                                                 self._trackers.items() if key[0] in names)
+
+        return ready
+
+
+    ###########################################
+
+    def _tracker(self, fname, img):
+        key = (fname, img.shape)
+
+        tracker = self._trackers.pop(key, None)
+        if tracker is None:
+            info_config = tiles.calibrated_config(img, self.info_config, self.reference_grid,
+                                                  self.reference_rack, self.fname_geometry)
+            tracker = tracker_manager.GameTracker(self.reference_grid, self.reference_rack,
+                                                  info_config)
+
+        self._trackers[key] = tracker
+        while len(self._trackers) > self.num_trackers:
+            self._trackers.popitem(last=False)
+
+        return tracker
+
+
+    def solve(self, fname):
+        """
+        Parse and solve one screenshot.  Return result record.
+        """
+        record = {'image': fname, 'board': [], 'rack': '', 'moves': [], 'error': None,
+                  'time_parse': 0., 'time_solve': 0.}
+
+        try:
+            time_start = time.time()
+            img, meta = io.read(fname)
+
+            tracker = self._tracker(fname, img)
+            try:
+                letters_grid, letters_rack = tracker.update(img)
+            except:
+                tracker.reset()
+                raise
+            time_parse = time.time()
+
+            board = board_manager.Board(letter_points=self.letter_points)
+            board.set_game_letters(letters_grid)
+
+            moves = move_manager.generate_moves(board, self.dawg, letters_rack)
+            time_solve = time.time()
+
+        except Exception as e:
+            record['error'] = '%s' % e
+            return record
+
+        record['board'] = [[int(ij[0]), int(ij[1]), letter] for ij, letter in letters_grid]
+        record['rack'] = letters_rack
+        record['moves'] = [[int(score), [[int(ij[0]), int(ij[1]), L] for ij, L in ij_letters]]
+                           for score, ij_letters in moves[:self.num_moves]]
+
+        record['time_parse'] = time_parse - time_start
+        record['time_solve'] = time_solve - time_parse
+
+        # Done.
+        return record
+
+
+    def write_result(self, record):
+        """
+        Write result record next to its screenshot.  Readers never see a partial file.
+        """
+        fname_result = self.result_name(record['image'])
+        fname_temp = '%s.%d.tmp' % (fname_result, os.getpid())
+
+        try:
+            with open(fname_temp, 'w') as fo:
+                fo.write(json.dumps(record, sort_keys=True) + '\n')
+            os.rename(fname_temp, fname_result)
+        finally:
+            if os.path.isfile(fname_temp):
+                os.remove(fname_temp)
+
+        return fname_result
+
+
+    ###########################################
+
+    def poll(self):
+        """
+        Process every screenshot ready now.  Return their result records.  A screenshot whose
+        result can not be written is logged and not tried again until it changes.
+        """
+        records = []
+        for fname in self.pending():
+            stat = self._stat[fname]
+
+            record = self.solve(fname)
+            record['image_stat'] = list(stat)
+
+            self._done[fname] = stat
+            try:
+                self.write_result(record)
+            except (IOError, OSError) as e:
+                logger.error('Unable to write result for %s: %s', fname, e)
+                continue
+
+            records.append(record)
+
+        return records
+
+
+    def run(self, interval=0.1, callback=None):
+        """
+        Poll folder every interval seconds until interrupted.  Callback, if supplied, is called with
+        each result record.
+        """
+        while True:
+            time_start = time.time()
+
+            try:
+                records = self.poll()
+            except Exception:
+                logger.exception('Poll failed')
+                records = []
+
+            for record in records:
+                if callback is not None:
+                    callback(record)
+
+            time.sleep(max(interval - (time.time() - time_start), 0.))
+
+
+
+def print_record(record):
+    name = os.path.basename(record['image'])
+    if record['error'] is not None:
+        print('%s: %s' % (name, record['error']), file=sys.stderr)
+        return
+
+    best = record['moves'][0] if record['moves'] else None
+    print('%s: rack %s, %d moves, best %s, parse %.3f s, solve %.3f s' %
+          (name, record['rack'], len(record['moves']), best,
+           record['time_parse'], record['time_solve']))
+    sys.stdout.flush()
+
+
+
+if __name__ == '__main__':
+
+    from timer import Timer
+
+    logging.basicConfig()
+
+    path_module = os.path.dirname(os.path.abspath(__file__))
+
+    if len(sys.argv) > 1:
+        path_games = sys.argv[1]
+    else:
+        path_games = os.path.join(path_module, 'data', 'games')
+
+    with Timer('Load'):
+        watcher = Watcher(path_games)
+
+    print('Watching %s' % path_games)
+    try:
+        watcher.run(callback=print_record)
+    except KeyboardInterrupt:
+        pass
@@ -1,4 +1,3 @@
-
 """
 Great idea from kennethreitz.org for allowing test module to import the package.
 """
@@ -6,6 +5,6 @@ Great idea from kennethreitz.org for allowing test module to import the package.
 import os
 import sys
 
-# path_work = os.path.abspath(os.path.join('..', '..'))
-path_work = os.path.abspath('..')
+# Package modules import one another by name, so the package folder itself goes on the path.
+path_work = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'eat_words'))
 sys.path.insert(0, path_work)
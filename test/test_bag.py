@@ -0,0 +1,168 @@
+from __future__ import division, print_function, unicode_literals
+
+import unittest
+import os
+import collections
+
+import context
+
+import bag_manager
+
+from bag_manager import alphabet
+
+_fname_letters = os.path.join(os.path.dirname(os.path.abspath(bag_manager.__file__)),
+                              'data', 'words and letters', 'letters_zynga.yml')
+
+
+#------------------------------------------------
+
+class TestBag(unittest.TestCase):
+    def setUp(self):
+        self.bag = bag_manager.Bag(_fname_letters)
+        self.frequency = list(self.bag._frequency)
+
+
+    def check_counts(self, counts):
+        bag = self.bag
+
+        self.assertEqual(bag.counts_inside.tolist(), list(counts))
+        self.assertEqual([bag._count(ix) for ix in range(len(alphabet))], list(counts))
+        self.assertEqual(bag.count_inside, sum(counts))
+        self.assertEqual(bag.count_outside, bag.count_total - sum(counts))
+
+        # Each rank falls on the letter a linear search over the counts finds.
+        ranks = [ix for ix, c in enumerate(counts) for k in range(c)]
+        self.assertEqual([bag._find(rank) for rank in range(sum(counts))], ranks)
+
+
+    def test_full(self):
+        self.assertEqual(self.bag.count_total, sum(self.frequency))
+        self.check_counts(self.frequency)
+
+
+    def test_draw(self):
+        drawn = collections.Counter()
+        for number in [7, 1, 30, 0, 7]:
+            letters = self.bag.pick_letters(number)
+            self.assertEqual(len(letters), number)
+
+            drawn.update(letters)
+            self.check_counts([f - drawn[L] for f, L in zip(self.frequency, alphabet)])
+
+        removed = self.bag.letters_removed
+        self.assertEqual(dict((L, c) for L, c in removed.items() if c), dict(drawn))
+
+
+    def test_draw_all(self):
+        letters = self.bag.pick_letters(self.bag.count_total + 10)
+
+        self.assertEqual(len(letters), self.bag.count_total)
+        self.assertEqual([letters.count(L) for L in alphabet], self.frequency)
+        self.check_counts([0]*len(alphabet))
+
+        self.assertEqual(self.bag.pick_letters(3), [])
+        self.assertIsNone(self.bag._random_letter())
+
+
+    def test_replace(self):
+        letters = self.bag.pick_letters(40)
+
+        self.assertEqual(self.bag.replace_letters(letters[:15]), 15)
+        drawn = collections.Counter(letters[15:])
+        self.check_counts([f - drawn[L] for f, L in zip(self.frequency, alphabet)])
+
+        self.assertEqual(self.bag.replace_letters(letters[15:]), 25)
+        self.check_counts(self.frequency)
+
+
+    def test_replace_too_many(self):
+        letters = self.bag.pick_letters(1)
+
+        self.bag.replace_letters(letters)
+        with self.assertRaises(Exception):
+            self.bag.replace_letters(letters)
+
+        self.check_counts(self.frequency)
+
+
+    def test_set_letters(self):
+        letters = self.bag.pick_letters(20)
+
+        # Counters returned are copies.
+        removed = self.bag.letters_removed
+        removed.clear()
+        self.assertEqual(self.bag.count_outside, 20)
+
+        inside = self.bag.letters_inside
+        inside['e'] -= 1
+        self.bag.letters_inside = inside
+        self.assertEqual(self.bag.count_outside, 21)
+        self.assertEqual(self.bag.letters_removed['e'], collections.Counter(letters)['e'] + 1)
+
+        self.bag.letters_removed = collections.Counter()
+        self.check_counts(self.frequency)
+
+        with self.assertRaises(Exception):
+            self.bag.letters_removed = collections.Counter({'q': 2})
+        self.check_counts(self.frequency)
+
+
+    def test_sample_racks(self):
+        self.bag.pick_letters(90)
+        counts = self.bag.counts_inside.tolist()
+
+        racks = self.bag.sample_racks(200)
+        self.assertEqual(racks.shape, (200, 7))
+
+        # Never more of a letter than the bag holds, and the bag is untouched.
+        for rack in racks:
+            for ix, c in collections.Counter(rack.tolist()).items():
+                self.assertLessEqual(c, counts[ix])
+
+        self.check_counts(counts)
+
+
+    def test_seed(self):
+        seeds = self.bag.spawn(2)
+        a = [bag_manager.Bag(_fname_letters, seed=s).pick_letters(7) for s in seeds]
+        b = [bag_manager.Bag(_fname_letters, seed=s).pick_letters(7) for s in seeds]
+
+        self.assertEqual(a, b)
+        self.assertNotEqual(a[0], a[1])
+
+        # Each call spawns new children.
+        self.assertEqual(set(seeds) & set(self.bag.spawn(2)), set())
+
+
+    def test_same_seed(self):
+        a = bag_manager.Bag(_fname_letters, seed=1234)
+        b = bag_manager.Bag(_fname_letters, seed=(1234,))
+
+        self.assertEqual(a.pick_letters(20), b.pick_letters(20))
+        self.assertEqual(a.sample_racks(5).tolist(), b.sample_racks(5).tolist())
+
+        rng = bag_manager.make_rng(5)
+        self.assertIs(bag_manager.make_rng(rng), rng)
+        with self.assertRaises(Exception):
+            bag_manager.Bag(_fname_letters, seed=rng).spawn()
+
+
+    def test_snapshot(self):
+        self.bag.pick_letters(10)
+        state = self.bag.snapshot()
+        counts = self.bag.counts_inside.tolist()
+
+        for k in range(3):
+            self.bag.pick_letters(50)
+            self.bag.restore(state)
+            self.check_counts(counts)
+
+        # Saved states are copies, unaffected by later draws.
+        saved = list(state)
+        self.bag.pick_letters(5)
+        self.assertEqual(state, saved)
+
+
+#------------------------------------------------
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
@@ -0,0 +1,144 @@
+from __future__ import division, print_function, unicode_literals
+
+import unittest
+import os
+import shutil
+import tempfile
+import itertools
+
+import numpy as np
+
+import context
+
+import bingo_manager
+
+from bag_manager import alphabet
+from board_manager import letters_mask
+
+
+#------------------------------------------------
+# Three letter racks, so every draw can be enumerated.
+
+rack_size = 3
+
+words = ['ate', 'eat', 'tea', 'sat', 'tee', 'rat', 'art', 'tar', 'star', 'rats', 'tsar', 'seat',
+         'ae', 'bookkeeper', 'x-ray']
+
+pool_letters = 'aaeerrsstt_o'
+
+
+def pool_counts(letters):
+    counts = np.zeros(len(alphabet), dtype=np.int64)
+    for L in letters:
+        counts[alphabet.index(L)] += 1
+    return counts
+
+
+
+def brute_force_probability(rack_counts, leave, pool, num_draw):
+    """
+    Fraction of equally likely draws of num_draw pool tiles that, with the leave, make the rack.
+    Blanks stand for any letter.
+    """
+    hits = 0
+    num = 0
+    for drawn in itertools.combinations(pool, num_draw):
+        num += 1
+
+        held = [L for L in leave + ''.join(drawn) if L != '_']
+        if all(held.count(L) <= rack_counts[letters_mask.index(L)] for L in set(held)):
+            hits += 1
+
+    return hits / num
+
+
+
+class TestBingoIndex(unittest.TestCase):
+    def setUp(self):
+        self.index = bingo_manager.BingoIndex.from_words(words, pool_counts(pool_letters), rack_size)
+
+
+    def entry(self, rack, through=''):
+        for k, counts in enumerate(self.index.counts):
+            t = self.index.through[k]
+            if ''.join(L*c for L, c in zip(letters_mask, counts)) == rack and \
+               (letters_mask[t] if t >= 0 else '') == through:
+                return k
+
+        return None
+
+
+    def test_entries(self):
+        # Anagrams share a rack.  Four letter words give one rack per distinct through letter.
+        self.assertEqual(self.index.words[self.entry('aet')].split(), ['ate', 'eat', 'tea'])
+        self.assertEqual(self.index.words[self.entry('art')].split(), ['rat', 'art', 'tar'])
+        self.assertEqual(self.index.words[self.entry('ast', 'r')].split(), ['star', 'rats', 'tsar'])
+        self.assertEqual(self.index.words[self.entry('rst', 'a')].split(), ['star', 'rats', 'tsar'])
+        self.assertEqual(self.index.words[self.entry('aet', 's')].split(), ['seat'])
+
+        # Four three letter racks, four through letters each for star and seat.  Wrong lengths and
+        # non-letters are left out.
+        self.assertEqual(len(self.index.counts), 4 + 4 + 4)
+        self.assertTrue(all('ae' not in w.split() for w in self.index.words))
+
+
+    def test_brute_force(self):
+        pool = pool_counts(pool_letters)
+
+        for leave in ['', 'a', 't', 'at', '_', 'e_', 'ee', 'ttt']:
+            num_draw = rack_size - len(leave)
+            ix, prob = self.index.probabilities(leave, pool, rack_size)
+
+            expected = [brute_force_probability(self.index.counts[k], leave, pool_letters, num_draw)
+                        for k in range(len(self.index.counts))]
+
+            # Entries left out are those the leave can not reach.
+            full = np.zeros(len(self.index.counts))
+            full[ix] = prob
+            self.assertTrue(np.allclose(full, expected), leave)
+            for k in set(range(len(expected))) - set(ix.tolist()):
+                self.assertEqual(expected[k], 0.)
+
+        # Full bag probabilities.
+        ix, prob = self.index.probabilities('', pool, rack_size)
+        self.assertTrue(np.allclose(self.index.prob_full, prob))
+
+
+    def test_too_few_tiles(self):
+        ix, prob = self.index.probabilities('a', pool_counts('e'), rack_size)
+        self.assertEqual(len(ix), 0)
+
+
+    def test_top_bingos(self):
+        pool = pool_counts(pool_letters)
+
+        results = self.index.top_bingos('at', pool, number=20, rack_size=rack_size)
+        self.assertEqual(len(results), len(self.index.probabilities('at', pool, rack_size)[0]))
+
+        probs = [p for p, w, t in results]
+        self.assertEqual(probs, sorted(probs, reverse=True))
+
+        # Racks without a through letter, and those through letters on the board.
+        results = self.index.top_bingos('at', pool, number=20, letters_board='R', rack_size=rack_size)
+        self.assertEqual(set(t for p, w, t in results), set(['', 'r']))
+
+
+    def test_save_load(self):
+        path = tempfile.mkdtemp()
+        try:
+            fname = os.path.join(path, 'words.bingo.npz')
+            self.index.save(fname)
+            index = bingo_manager.BingoIndex.load(fname)
+        finally:
+            shutil.rmtree(path)
+
+        pool = pool_counts(pool_letters)
+        self.assertEqual(index.words.tolist(), self.index.words.tolist())
+        self.assertEqual(index.probabilities('e_', pool, rack_size)[1].tolist(),
+                         self.index.probabilities('e_', pool, rack_size)[1].tolist())
+        self.assertEqual(index.prob_full.tolist(), self.index.prob_full.tolist())
+
+
+#------------------------------------------------
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
@@ -0,0 +1,114 @@
+from __future__ import division, print_function, unicode_literals
+
+import unittest
+import os
+import itertools
+import collections
+
+import numpy as np
+
+import context
+
+import exchange_manager
+import leave_manager
+import unseen_manager
+
+from bag_manager import alphabet
+
+_path_words = os.path.join(os.path.dirname(os.path.abspath(exchange_manager.__file__)),
+                           'data', 'words and letters')
+
+
+#------------------------------------------------
+
+def small_unseen(pool, rack):
+    """
+    Unseen tracker holding only the pool, everything else on the board, and our rack.
+    """
+    unseen = unseen_manager.Unseen(os.path.join(_path_words, 'letters_zynga.yml'))
+
+    board = collections.Counter(dict(zip(alphabet, unseen.frequency.tolist())))
+    board.subtract(pool)
+    board.subtract(rack)
+
+    unseen.observe_board([((0, 0), L) for L in board.elements()])
+    unseen.set_rack(rack)
+
+    return unseen
+
+
+
+def brute_force_value(table, kept, pool, num_draw):
+    """
+    Mean leave value over every equally likely draw of tiles from the pool.
+    """
+    values = [table.value(kept + ''.join(drawn))
+              for drawn in itertools.combinations(pool, num_draw)]
+
+    return np.mean(values)
+
+
+
+class TestKeptCounts(unittest.TestCase):
+    def test_distinct(self):
+        table = leave_manager.LeaveTable(np.zeros((len(alphabet), 8)))
+
+        for rack, num in [('aaeeirt', 71), ('abcdefg', 127), ('aaaaaaa', 7), ('q', 1)]:
+            rack_counts = table.counts(rack)
+            kept = exchange_manager.kept_counts(rack_counts)
+
+            self.assertEqual(len(kept), num, rack)
+            self.assertEqual(len(set(map(tuple, kept.tolist()))), num, rack)
+            self.assertTrue(np.all(kept <= rack_counts))
+            self.assertTrue(np.all(kept.sum(axis=1) < len(rack)))
+
+
+
+class TestEvaluateExchanges(unittest.TestCase):
+    def setUp(self):
+        self.table = leave_manager.read_leaves(os.path.join(_path_words, 'leaves_zynga.yml'))
+
+
+    def test_brute_force(self):
+        pool = 'aeeinorsst_uvw'
+        rack = 'qaai'
+        unseen = small_unseen(pool, rack)
+        self.assertEqual(unseen.count, len(pool))
+
+        results = exchange_manager.evaluate_exchanges(rack, unseen, self.table)
+        self.assertEqual(len(results), 11)
+
+        for value, kept, exchanged in results:
+            self.assertEqual(sorted(kept + exchanged), sorted(rack))
+            self.assertAlmostEqual(value, brute_force_value(self.table, kept, pool, len(exchanged)))
+
+        values = [value for value, kept, exchanged in results]
+        self.assertEqual(values, sorted(values, reverse=True))
+
+        # Dumping the q is best.
+        self.assertNotIn('q', results[0][1])
+
+
+    def test_small_bag(self):
+        # Nine unseen: the opponent holds seven, two left in the bag.
+        pool = 'aeeinorst'
+        rack = 'qaai'
+        unseen = small_unseen(pool, rack)
+        self.assertEqual(unseen.count_bag, 2)
+
+        results = exchange_manager.evaluate_exchanges(rack, unseen, self.table)
+        self.assertEqual(sorted(len(exchanged) for value, kept, exchanged in results),
+                         sorted([1]*3 + [2]*4))
+
+        for value, kept, exchanged in results:
+            self.assertAlmostEqual(value, brute_force_value(self.table, kept, pool, len(exchanged)))
+
+
+    def test_empty_rack(self):
+        unseen = small_unseen('aeiou', '')
+        self.assertEqual(exchange_manager.evaluate_exchanges('', unseen, self.table), [])
+
+
+#------------------------------------------------
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
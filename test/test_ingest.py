@@ -0,0 +1,155 @@
+from __future__ import division, print_function, unicode_literals
+
+import unittest
+import os
+import json
+import shutil
+import tempfile
+
+import context
+
+import data_io as io
+
+import ingest_manager
+import tiles
+
+_path_data = os.path.join(os.path.dirname(os.path.abspath(tiles.__file__)), 'data')
+
+
+#------------------------------------------------
+
+class TestImages(unittest.TestCase):
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+
+
+    def tearDown(self):
+        shutil.rmtree(self.path)
+
+
+    def test_image_size(self):
+        fname = ingest_manager.find_images(_path_data)[0]
+        img, meta = io.read(fname)
+        self.assertEqual(ingest_manager.image_size(fname), (img.shape[1], img.shape[0]))
+
+        # Not PNG files.
+        self.assertIsNone(ingest_manager.image_size(os.path.join(_path_data, 'config.yml')))
+
+        fname = os.path.join(self.path, 'short.png')
+        with open(fname, 'wb') as fo:
+            fo.write(b'\x89PNG\r\n\x1a\n')
+        self.assertIsNone(ingest_manager.image_size(fname))
+
+
+    def test_find_images(self):
+        path_games = os.path.join(_path_data, 'games')
+
+        fnames = ingest_manager.find_images(path_games)
+        self.assertEqual(len(fnames), 3)
+        self.assertEqual(fnames, sorted(fnames))
+
+        self.assertEqual(ingest_manager.find_images(os.path.join(path_games, '*.png')), fnames)
+        self.assertEqual(ingest_manager.find_images([path_games, fnames[0]]), fnames + fnames[:1])
+
+
+
+class TestIngest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.info_config = io.read(os.path.join(_path_data, 'config.yml'))
+        cls.reference_grid, cls.reference_rack = tiles.load_reference_tiles()
+
+        # Screenshots that parse at the config geometry, and what they parse to.
+        cls.expected = []
+        for fname in ingest_manager.find_images(_path_data):
+            img, meta = io.read(fname)
+            try:
+                letters = tiles.parse_game_letters(img, cls.reference_grid, cls.reference_rack,
+                                                   cls.info_config)
+            except Exception:
+                continue
+
+            cls.expected.append( (fname, letters) )
+            if len(cls.expected) == 3:
+                break
+
+
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+        self.fname_geometry = os.path.join(self.path, 'geometry.json')
+
+        self.geometry = dict(tiles._geometry)
+        tiles._geometry.clear()
+
+
+    def tearDown(self):
+        tiles._geometry.clear()
+        tiles._geometry.update(self.geometry)
+
+        shutil.rmtree(self.path)
+
+
+    def test_calibrate_sizes(self):
+        # The config's own size, and screenshots cropped at the top.
+        fnames = []
+        for k, (fname, letters) in enumerate(self.expected):
+            img, meta = io.read(fname)
+
+            f = os.path.join(self.path, 'cropped_%d.png' % k)
+            io.write(f, img[15:])
+            fnames += [fname, f]
+
+        geometry = ingest_manager.calibrate_sizes(fnames, self.info_config, self.reference_grid,
+                                                  self.reference_rack, self.fname_geometry)
+
+        width, height = self.info_config['image_size']
+        key = tiles.image_key((height, width))
+        key_cropped = tiles.image_key((height - 15, width))
+
+        self.assertEqual(sorted(geometry), sorted([key, key_cropped]))
+        self.assertEqual(geometry[key]['grid_parameters'], self.info_config['grid_parameters'])
+
+        # Only the calibrated size is cached.
+        self.assertEqual(list(tiles.read_geometry(self.fname_geometry)), [key_cropped])
+
+        info_config = dict(self.info_config)
+        info_config.update(geometry[key_cropped])
+        for f, (fname, letters) in zip(fnames[1::2], self.expected):
+            img, meta = io.read(f)
+            self.assertEqual(tiles.parse_game_letters(img, self.reference_grid, self.reference_rack,
+                                                      info_config), letters)
+
+
+    def test_ingest(self):
+        fname_bad = os.path.join(self.path, 'bad.png')
+        with open(fname_bad, 'wb') as fo:
+            fo.write(b'not an image')
+
+        fnames = [fname for fname, letters in self.expected]
+        fnames.insert(1, fname_bad)
+
+        fname_out = os.path.join(self.path, 'out.jsonl')
+        summary = ingest_manager.ingest(fnames, fname_out, processes=2, chunksize=1,
+                                        fname_geometry=self.fname_geometry)
+
+        self.assertEqual(summary['images'], len(fnames))
+        self.assertEqual(summary['errors'], 1)
+
+        with open(fname_out) as fo:
+            records = [json.loads(line) for line in fo]
+
+        # Results in input order.
+        self.assertEqual([r['image'] for r in records], fnames)
+        self.assertIsNotNone(records[1]['error'])
+        self.assertEqual(records[1]['board'], [])
+
+        records = records[:1] + records[2:]
+        for record, (fname, (letters_grid, letters_rack)) in zip(records, self.expected):
+            self.assertIsNone(record['error'])
+            self.assertEqual(record['board'], [[ij[0], ij[1], L] for ij, L in letters_grid])
+            self.assertEqual(record['rack'], letters_rack)
+
+
+#------------------------------------------------
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
@@ -0,0 +1,112 @@
+from __future__ import division, print_function, unicode_literals
+
+import unittest
+
+import numpy as np
+
+import context
+
+import board_manager
+import layout_manager
+
+from board_manager import ACROSS, DOWN
+from test_moves import definition
+
+
+#------------------------------------------------
+
+class TestLayout(unittest.TestCase):
+    def setUp(self):
+        self.layout = layout_manager.Layout(definition)
+
+
+    def test_multipliers(self):
+        layout = self.layout
+
+        self.assertEqual(layout.width, 9)
+        self.assertEqual(layout.start, (4, 4))
+
+        # Grid rows run down the board.
+        self.assertEqual(layout.xW[1, 1], 3)
+        self.assertEqual(layout.xL[4, 1], 2)
+        self.assertEqual(layout.xL[1, 4], 2)
+        self.assertEqual(layout.xL[3, 3], 3)
+        self.assertEqual(layout.xW[4, 4], 2)
+
+        # Moat is zero.
+        self.assertEqual(layout.xL[0].tolist(), [0]*9)
+        self.assertEqual(layout.xW[:, -1].tolist(), [0]*9)
+
+
+    def test_line_summaries(self):
+        layout = self.layout
+        board = board_manager.Board(layout)
+
+        for direction in [ACROSS, DOWN]:
+            for k in range(layout.width):
+                xL = board.line(layout.xL, direction, k)
+                xW = board.line(layout.xW, direction, k)
+
+                self.assertEqual(layout.line_xL_max[direction, k], xL.max())
+                self.assertEqual(layout.line_xW_max[direction, k], xW.max())
+                self.assertEqual(layout.line_xW_product[direction, k],
+                                 np.prod([max(x, 1) for x in xW.tolist()]))
+                self.assertEqual(layout.line_premium_count[direction, k],
+                                 np.sum((xL > 1) | (xW > 1)))
+
+        # Top row T..d..T, and down the middle d..S..d.
+        self.assertEqual(layout.line_xW_product[ACROSS, 1], 9)
+        self.assertEqual(layout.line_premium_count[ACROSS, 1], 3)
+        self.assertEqual(layout.line_xW_product[DOWN, 4], 2)
+        self.assertEqual(layout.line_xL_max[DOWN, 4], 2)
+        self.assertEqual(layout.line_premium_count[DOWN, 0], 0)
+
+
+    def test_read_only(self):
+        layout = self.layout
+
+        for arr in [layout.xL, layout.xW, layout.line_xL_max, layout.line_xW_max,
+                    layout.line_xW_product, layout.line_premium_count]:
+            with self.assertRaises(ValueError):
+                arr[1, 1] = 5
+
+        # Boards get their own copy.
+        board = board_manager.Board(layout)
+        board.xW[1, 1] = 1
+        self.assertEqual(layout.xW[1, 1], 3)
+
+        board.reset()
+        self.assertEqual(board.xW[1, 1], 3)
+
+
+    def test_invalid(self):
+        grid = list(definition['grid'])
+
+        with self.assertRaises(Exception):
+            layout_manager.Layout(dict(definition, grid=grid[:-1]))
+
+        grid[0] = 'T..x..T'
+        with self.assertRaises(Exception):
+            layout_manager.Layout(dict(definition, grid=grid))
+
+
+    def test_load(self):
+        for name in ['wwf', 'scrabble']:
+            layout = layout_manager.load_layout(name)
+
+            self.assertIs(layout_manager.load_layout(name), layout)
+            self.assertEqual(layout.width, 17)
+            self.assertEqual(layout.rack_size, 7)
+
+            # Both boards are symmetric.
+            self.assertEqual(layout.xL.tolist(), layout.xL.T.tolist())
+            self.assertEqual(layout.line_xW_product[ACROSS].tolist(),
+                             layout.line_xW_product[DOWN].tolist())
+
+        with self.assertRaises(Exception):
+            layout_manager.load_layout('unknown')
+
+
+#------------------------------------------------
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
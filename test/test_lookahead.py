@@ -0,0 +1,187 @@
+from __future__ import division, print_function, unicode_literals
+
+import unittest
+import os
+import collections
+
+import context
+
+import board_manager
+import layout_manager
+import lookahead_manager
+import move_manager
+import unseen_manager
+
+from bag_manager import alphabet
+from test_moves import definition, letter_points, eat, small_board, small_dawg
+
+_fname_letters = os.path.join(os.path.dirname(os.path.abspath(lookahead_manager.__file__)),
+                              'data', 'words and letters', 'letters_zynga.yml')
+
+
+#------------------------------------------------
+# Same small board and dictionary as the move generation tests, four letter racks.
+
+rack_size = definition['rack_size']
+
+
+def small_unseen(pool, rack):
+    """
+    Unseen tracker holding only the pool and our rack, everything else on the board.
+    """
+    unseen = unseen_manager.Unseen(_fname_letters, rack_size=rack_size)
+
+    board = collections.Counter(dict(zip(alphabet, unseen.frequency.tolist())))
+    board.subtract(pool)
+    board.subtract(rack)
+
+    unseen.observe_board([((0, 0), L) for L in board.elements()])
+    unseen.set_rack(rack)
+
+    return unseen
+
+
+
+def values(results):
+    return [(value, move) for value, move, mean_reply in results]
+
+
+
+class TestSampleRacks(unittest.TestCase):
+    def test_weights(self):
+        unseen = small_unseen('aaeeesssttt_', 'east')
+        racks = lookahead_manager.Lookahead(small_dawg(), num_racks=10).sample_racks(unseen)
+
+        self.assertEqual(len(racks), 10)
+        self.assertAlmostEqual(sum(w for letters, w in racks), 1.)
+
+        pool = collections.Counter('aaeeesssttt_')
+        for letters, w in racks:
+            self.assertEqual(len(letters), rack_size)
+            self.assertEqual(collections.Counter(letters) - pool, collections.Counter())
+
+        # Seeded by the unseen counts.
+        again = lookahead_manager.Lookahead(small_dawg(), num_racks=10).sample_racks(unseen)
+        self.assertEqual(racks, again)
+
+
+    def test_small_pool(self):
+        unseen = small_unseen('tea', 'east')
+        racks = lookahead_manager.Lookahead(small_dawg()).sample_racks(unseen)
+
+        self.assertEqual(racks, [('aet', 1.)])
+
+
+
+class TestBestReply(unittest.TestCase):
+    def setUp(self):
+        self.dawg = small_dawg()
+
+
+    def test_generate_moves(self):
+        lookahead = lookahead_manager.Lookahead(self.dawg)
+
+        for ij_letters in [[], eat]:
+            board = small_board(ij_letters)
+            board.update_cross_checks(self.dawg)
+
+            for rack in ['east', 'tt', 'st_', 'q']:
+                moves = move_manager.generate_moves(board, self.dawg, rack)
+                best = max(score for score, ij_letters in moves) if moves else 0
+
+                self.assertEqual(lookahead.best_reply(board, rack), best, rack)
+
+
+    def test_rules(self):
+        # Same letters and rack under other letter points or layouts share a cache.
+        points = dict(letter_points, a=5)
+
+        grid = list(definition['grid'])
+        grid[3] = 'T.....T'
+        other = dict(definition, grid=grid, bingo_bonus=50)
+
+        boards = [small_board(),
+                  board_manager.Board(layout_manager.Layout(definition), letter_points=points),
+                  board_manager.Board(layout_manager.Layout(other), letter_points=letter_points)]
+
+        lookahead = lookahead_manager.Lookahead(self.dawg)
+        for board in boards:
+            board.set_game_letters(eat)
+            board.update_cross_checks(self.dawg)
+
+            for rack in ['east', 'sta']:
+                fresh = lookahead_manager.Lookahead(self.dawg).best_reply(board, rack)
+                self.assertEqual(lookahead.best_reply(board, rack), fresh)
+                self.assertEqual(lookahead.best_reply(board, rack, hash_value=1), fresh)
+
+        self.assertEqual(len(lookahead._rules), 3)
+
+
+
+class TestEvaluate(unittest.TestCase):
+    def setUp(self):
+        self.dawg = small_dawg()
+        self.rack = 'east'
+        self.unseen = small_unseen('aaeeesssttt_', self.rack)
+
+
+    def test_cache(self):
+        board = small_board(eat)
+        board.update_cross_checks(self.dawg)
+        moves = move_manager.generate_moves(board, self.dawg, self.rack)
+
+        lookahead = lookahead_manager.Lookahead(self.dawg, num_candidates=5, num_racks=8)
+        cold = lookahead.evaluate(board, moves, self.rack, self.unseen)
+        warm = lookahead.evaluate(board, moves, self.rack, self.unseen)
+        self.assertEqual(cold, warm)
+        self.assertEqual(len(cold), 5)
+
+        # Tiny cache, generations dropped all the time.
+        tiny = lookahead_manager.Lookahead(self.dawg, num_candidates=5, num_racks=8, cache_size=2)
+        self.assertEqual(tiny.evaluate(board, moves, self.rack, self.unseen), cold)
+
+        # Best replies recomputed by hand.
+        racks = lookahead.sample_racks(self.unseen)
+        for value, move, mean_reply in cold:
+            board.play_letters(move[1])
+            board.update_cross_checks(self.dawg)
+
+            replies = []
+            for letters, w in racks:
+                replies.append(max([0] + [score for score, ij_letters in
+                                          move_manager.generate_moves(board, self.dawg, letters)]))
+            board.unplay_letters()
+
+            self.assertAlmostEqual(mean_reply, sum(w*r for (letters, w), r in zip(racks, replies)))
+            self.assertAlmostEqual(value, move[0] - mean_reply)
+
+        board.update_cross_checks(self.dawg)
+
+
+    def test_pending(self):
+        # Our s is played, not yet committed.  Candidates go on top of it.
+        board = small_board(eat)
+        board.play_letters([((6, 4), 's')])
+        board.update_cross_checks(self.dawg)
+        moves = move_manager.generate_moves(board, self.dawg, self.rack)
+
+        lookahead = lookahead_manager.Lookahead(self.dawg, num_candidates=5, num_racks=8)
+        results = lookahead.evaluate(board, moves, self.rack, self.unseen)
+
+        self.assertEqual(board._player_moves, [((6, 4), 's')])
+        self.assertEqual(board.letters[6, 4], 's')
+
+        # Same as with the s committed.
+        fixed = small_board(eat + [((6, 4), 's')])
+        fixed.update_cross_checks(self.dawg)
+        expected = lookahead_manager.Lookahead(self.dawg, num_candidates=5, num_racks=8).evaluate(
+            fixed, moves, self.rack, self.unseen)
+        self.assertEqual(values(results), values(expected))
+
+        self.assertEqual(board.unplay_letters(), 1)
+        self.assertEqual(board.letters[6, 4], board.blank)
+
+
+#------------------------------------------------
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
@@ -0,0 +1,314 @@
+from __future__ import division, print_function, unicode_literals
+
+import unittest
+import itertools
+
+import context
+
+import board_manager
+import layout_manager
+import move_manager
+import snapshot_manager
+import trie_manager
+
+from board_manager import ACROSS, DOWN, IllegalMove
+
+
+#------------------------------------------------
+# Small board and dictionary, so every move can be found by brute force.
+
+words = ['ae', 'as', 'at', 'es', 'ta', 'ate', 'eat', 'eta', 'sat', 'sea', 'set', 'tae', 'tas',
+         'tat', 'tea', 'east', 'eats', 'seat', 'teas', 'teat']
+
+definition = {'name': 'Test', 'rack_size': 4, 'bingo_bonus': 35, 'start': [4, 4],
+              'grid': ['T..d..T',
+                       '.D...D.',
+                       '..t.t..',
+                       'd..S..d',
+                       '..t.t..',
+                       '.D...D.',
+                       'T..d..T']}
+
+letter_points = dict((L, 1) for L in board_manager.letters_mask)
+letter_points.update({'t': 2, 's': 3, '_': 0})
+
+eat = [((3, 4), 'e'), ((4, 4), 'a'), ((5, 4), 't')]
+
+_dawg = {}
+
+def small_dawg():
+    if not _dawg:
+        daggad = trie_manager.Daggad()
+        daggad.insert_words(list(words))
+        _dawg['daggad'] = daggad
+        _dawg['arrays'] = trie_manager.ArrayDawg(trie_manager.compile_arrays(daggad), cache_size=8)
+
+    return _dawg['daggad']
+
+
+
+def small_board(ij_letters=()):
+    board = board_manager.Board(layout_manager.Layout(definition), letter_points=letter_points)
+    board.set_game_letters(list(ij_letters))
+
+    return board
+
+
+
+def move_set(moves):
+    return set((score, frozenset((tuple(ij), L) for ij, L in ij_letters))
+               for score, ij_letters in moves)
+
+
+
+def brute_force_moves(board, dawg, letters_rack):
+    """
+    Every legal move, by trying all placements of rack letters on empty squares along each line.
+    """
+    moves = set()
+    n = board.width - 2
+    for direction in [ACROSS, DOWN]:
+        for f in range(1, n+1):
+            if direction == ACROSS:
+                square = lambda k: (k, f)
+            else:
+                square = lambda k: (f, k)
+
+            empty = [k for k in range(1, n+1) if board.letters[square(k)] == board.blank]
+
+            for size in range(1, len(letters_rack)+1):
+                for kk in itertools.combinations(empty, size):
+                    for rack in set(itertools.permutations(letters_rack, size)):
+                        choices = [board_manager.letters_mask.upper() if L == '_' else L
+                                   for L in rack]
+
+                        for letters in itertools.product(*choices):
+                            ij_letters = [(square(k), L) for k, L in zip(kk, letters)]
+                            try:
+                                score, words_formed = board.validate_move(ij_letters, dawg)
+                            except IllegalMove:
+                                continue
+
+                            moves.add( (score, frozenset(ij_letters)) )
+
+    return moves
+
+
+#------------------------------------------------
+
+class TestValidateMove(unittest.TestCase):
+    def setUp(self):
+        self.dawg = small_dawg()
+
+
+    def test_first_move(self):
+        board = small_board()
+
+        # Start square is a double word.
+        score, words_formed = board.validate_move(eat, self.dawg)
+        self.assertEqual(score, (1 + 1 + 2)*2)
+        self.assertEqual(words_formed, ['eat'])
+
+
+    def test_bingo(self):
+        board = small_board()
+
+        ij_letters = [((2, 4), 't'), ((3, 4), 'e'), ((4, 4), 'a'), ((5, 4), 't')]
+        score, words_formed = board.validate_move(ij_letters, self.dawg)
+        self.assertEqual(score, (2 + 1 + 1 + 2)*2 + 35)
+        self.assertEqual(words_formed, ['teat'])
+
+
+    def test_extend_word(self):
+        board = small_board(eat)
+
+        score, words_formed = board.validate_move([((6, 4), 's')], self.dawg)
+        self.assertEqual(score, 1 + 1 + 2 + 3)
+        self.assertEqual(words_formed, ['eats'])
+
+
+    def test_blank_scores_nothing(self):
+        board = small_board(eat)
+
+        score, words_formed = board.validate_move([((6, 4), 'S')], self.dawg)
+        self.assertEqual(score, 1 + 1 + 2)
+        self.assertEqual(words_formed, ['eats'])
+
+
+    def test_cross_words(self):
+        board = small_board(eat)
+
+        # Through the existing 'a', plain squares.
+        score, words_formed = board.validate_move([((4, 3), 's'), ((4, 5), 't')], self.dawg)
+        self.assertEqual(words_formed, ['sat'])
+        self.assertEqual(score, 3 + 1 + 2)
+
+        # 'as' across with 'a' on a triple letter square under the 't', forming 'ta' down.
+        score, words_formed = board.validate_move([((5, 5), 'a'), ((6, 5), 's')], self.dawg)
+        self.assertEqual(words_formed, ['as', 'ta'])
+        self.assertEqual(score, (1*3 + 3) + (2 + 1*3))
+
+
+    def test_reject(self):
+        board = small_board(eat)
+
+        cases = [([], 'No letters played'),
+                 ([((0, 4), 's')], 'off the board'),
+                 ([((8, 4), 's')], 'off the board'),
+                 ([((4, 4), 's')], 'occupied'),
+                 ([((6, 4), 's'), ((6, 4), 's')], 'same square'),
+                 ([((6, 4), 's'), ((2, 5), 'a')], 'single row or column'),
+                 ([((4, 3), 's'), ((4, 6), 't')], 'contiguous'),
+                 ([((1, 1), 'a'), ((2, 1), 't')], 'not connected'),
+                 ([((6, 4), 'a')], 'Not in dictionary: eata')]
+
+        for ij_letters, message in cases:
+            with self.assertRaises(IllegalMove) as raised:
+                board.validate_move(ij_letters, self.dawg)
+            self.assertIn(message, '%s' % raised.exception, ij_letters)
+
+
+    def test_reject_first_move(self):
+        board = small_board()
+
+        with self.assertRaises(IllegalMove) as raised:
+            board.validate_move([((1, 1), 'a'), ((2, 1), 't')], self.dawg)
+        self.assertIn('start square', '%s' % raised.exception)
+
+        with self.assertRaises(IllegalMove) as raised:
+            board.validate_move([((4, 4), 'a')], self.dawg)
+        self.assertIn('No word formed', '%s' % raised.exception)
+
+
+
+class TestGenerateMoves(unittest.TestCase):
+    def setUp(self):
+        self.dawg = small_dawg()
+
+
+    def check(self, ij_letters, letters_rack):
+        board = small_board(ij_letters)
+        board_arrays = small_board(ij_letters)
+
+        expected = brute_force_moves(board, self.dawg, letters_rack)
+        self.assertTrue(expected)
+
+        moves = move_manager.generate_moves(board, self.dawg, letters_rack)
+        self.assertEqual(move_set(moves), expected)
+
+        # Sorted by decreasing score, and each one valid with the score given.
+        self.assertEqual([m[0] for m in moves], sorted([m[0] for m in moves], reverse=True))
+        for score, ij_letters in moves:
+            self.assertEqual(board.validate_move(ij_letters, self.dawg)[0], score)
+
+        # Compiled arrays, with a node cache far smaller than the dictionary, find the same moves.
+        moves = move_manager.generate_moves(board_arrays, _dawg['arrays'], letters_rack)
+        self.assertEqual(move_set(moves), expected)
+
+
+    def test_empty_board(self):
+        self.check([], 'eat')
+
+
+    def test_extend(self):
+        self.check(eat, 'tase')
+
+
+    def test_blank(self):
+        self.check(eat, 's_')
+
+
+    def test_crossing(self):
+        self.check(eat + [((5, 5), 'a')], 'set')
+
+
+
+class TestLineSummary(unittest.TestCase):
+    def check(self, board):
+        fresh = small_board([((i, j), L) for i in range(board.width) for j in range(board.width)
+                             for L in [board.letters[i, j]] if L != board.blank])
+
+        for direction in [ACROSS, DOWN]:
+            for k in range(1, board.width-1):
+                a = board.line_summary(direction, k)
+                b = fresh.line_summary(direction, k)
+
+                self.assertEqual(a.letters.tolist(), b.letters.tolist())
+                self.assertEqual(a.anchors.tolist(), b.anchors.tolist(), (direction, k))
+                self.assertEqual(a.left_limits.tolist(), b.left_limits.tolist(), (direction, k))
+
+
+    def test_empty(self):
+        board = small_board()
+
+        # Only the start square is an anchor.
+        self.assertEqual(board.line_summary(ACROSS, 4).anchors.tolist(), [4])
+        self.assertEqual(board.line_summary(ACROSS, 3).anchors.tolist(), [])
+
+
+    def test_incremental(self):
+        board = small_board()
+        for direction in [ACROSS, DOWN]:
+            for k in range(1, board.width-1):
+                board.line_summary(direction, k)
+
+        # Summaries are refreshed as letters come and go.
+        board.set_game_letters(eat)
+        self.check(board)
+
+        board.play_letters([((5, 5), 'a'), ((5, 6), 's')])
+        self.check(board)
+
+        board.unplay_letters()
+        self.check(board)
+
+        self.assertEqual(board.line_summary(ACROSS, 4).anchors.tolist(), [2, 6])
+
+
+
+class TestSnapshot(unittest.TestCase):
+    def test_play(self):
+        root = snapshot_manager.BoardSnapshot.empty(layout_manager.Layout(definition))
+
+        a = root.play(eat)
+        self.assertEqual(a.num_tiles, 3)
+        self.assertEqual(root.num_tiles, 0)
+
+        board = small_board(eat)
+        self.assertEqual(snapshot_manager.BoardSnapshot.from_board(board).letters.tolist(),
+                         a.letters.tolist())
+
+
+    def test_reject(self):
+        a = snapshot_manager.BoardSnapshot.empty(layout_manager.Layout(definition)).play(eat)
+
+        for ij_letters in [[((6, 4), '.')], [((6, 4), 'st')], [((0, 4), 's')], [((8, 4), 's')],
+                           [((4, 4), 's')]]:
+            with self.assertRaises(IllegalMove):
+                a.play(ij_letters)
+
+        self.assertEqual(a.num_tiles, 3)
+
+
+    def test_shared_rows(self):
+        a = snapshot_manager.BoardSnapshot.empty(layout_manager.Layout(definition)).play(eat)
+        b = a.play([((6, 4), 's')])
+        c = a.play([((4, 5), 't')])
+
+        # Only rows played on are copied, and parents are unchanged.
+        self.assertIs(b.row(3), a.row(3))
+        self.assertIsNot(b.row(4), a.row(4))
+        self.assertIs(c.row(4), a.row(4))
+        self.assertEqual(a.tile(6, 4), 0)
+
+        self.assertEqual(b, a.play([((6, 4), 's')]))
+        self.assertEqual(hash(b), hash(a.play([((6, 4), 's')])))
+        self.assertNotEqual(b, a.play([((6, 4), 'S')]))
+
+        self.assertEqual(b.to_board(letter_points).letters.tolist(),
+                         small_board(eat + [((6, 4), 's')]).letters.tolist())
+
+
+#------------------------------------------------
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
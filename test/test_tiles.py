@@ -0,0 +1,570 @@
+from __future__ import division, print_function, unicode_literals
+
+import unittest
+import os
+import glob
+import shutil
+import tempfile
+
+import numpy as np
+
+import context
+
+import data_io as io
+
+import tiles
+
+_path_data = os.path.join(os.path.dirname(os.path.abspath(tiles.__file__)), 'data')
+
+
+#------------------------------------------------
+
+def baseline_match(tile, reference, info_config, thresh=10**2):
+    """
+    Original matcher: mean squared difference of the masked tile to each reference in turn.
+    """
+    tile = tiles.apply_mask(tile, info_config).astype(np.float64)
+
+    scores = [np.mean((tile - r.astype(np.float64))**2) for r in reference.tiles]
+
+    num = np.sum(np.asarray(scores) < thresh)
+    if num != 1:
+        raise Exception('Number of matching tiles is not unique: %d' % num)
+
+    return reference.letters[int(np.argmin(scores))]
+
+
+
+def baseline_letters(tiles_carved, reference, info_config):
+    return [baseline_match(t, reference, info_config)
+            for t in tiles_carved.reshape((-1,) + tiles_carved.shape[-3:])]
+
+
+
+def baseline_apply_mask(tile, info_config):
+    """
+    Original per-tile masking loop.
+    """
+    tile = np.asarray(tile).copy()
+    wid = tile.shape[0]
+
+    if wid == info_config['grid_parameters']['dx']:
+        info_mask = info_config['grid_tile_mask']
+        symmetric = False
+    else:
+        info_mask = info_config['rack_tile_mask']
+        symmetric = True
+
+    for i, j in info_mask:
+        tile[j, i:, :] = 0
+
+        if symmetric:
+            tile[j, :-i, :] = 0
+            tile[-j-1, i:, :] = 0
+            tile[-j-1, :-i, :] = 0
+
+    return tile
+
+
+
+_screenshots = {}
+
+def screenshots():
+    """
+    Screenshots of the size the config geometry is for.
+    """
+    if not _screenshots:
+        info_config = io.read(os.path.join(_path_data, 'config.yml'))
+        size = tuple(info_config['image_size'])
+
+        for fname in sorted(glob.glob(os.path.join(_path_data, '*.png')) +
+                            glob.glob(os.path.join(_path_data, 'games', '*.png'))):
+            img, meta = io.read(fname)
+            if (img.shape[1], img.shape[0]) == size:
+                _screenshots[fname] = img
+
+        _screenshots[None] = info_config
+
+    return _screenshots[None], [(f, img) for f, img in sorted(_screenshots.items()) if f]
+
+
+
+def rescale(img, scale):
+    """
+    Image resized by scale, linear interpolation between pixel centers.
+    """
+    result = img.astype(np.float64)
+    for axis in [0, 1]:
+        n = img.shape[axis]
+        x = np.clip((np.arange(int(round(n*scale))) + 0.5)/scale - 0.5, 0, n - 1)
+
+        k = np.minimum(x.astype(int), n - 2)
+        w = (x - k).reshape((-1, 1, 1) if axis == 0 else (-1, 1))
+
+        result = np.take(result, k, axis=axis)*(1 - w) + np.take(result, k + 1, axis=axis)*w
+
+    return np.clip(np.floor(result + 0.5), 0, 255).astype(np.uint8)
+
+
+
+#------------------------------------------------
+
+class TestMatchTiles(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        # Decoded from the tile images, leaving the compiled bundle alone.
+        path_tiles = os.path.join(_path_data, 'tiles')
+        cls.reference_grid, cls.reference_rack = tiles.read_reference_tiles(path_tiles)
+
+
+    def check(self, tiles_carved, reference, info_config, name):
+        mask = tiles.tile_mask(tiles_carved.shape[-2], info_config)
+
+        try:
+            expected = baseline_letters(tiles_carved, reference, info_config)
+        except Exception:
+            with self.assertRaises(Exception, msg=name):
+                tiles.match_tiles(tiles_carved, reference, mask)
+            return 0
+
+        self.assertEqual(tiles.match_tiles(tiles_carved, reference, mask), expected, name)
+
+        # Masked first gives the same letters.
+        masked = tiles.apply_mask(tiles_carved, info_config)
+        self.assertEqual(tiles.match_tiles(masked, reference, mask), expected, name)
+
+        return 1
+
+
+    def test_screenshots(self):
+        info_config, images = screenshots()
+        self.assertTrue(images)
+
+        num_matched = 0
+        for fname, img in images:
+            name = os.path.basename(fname)
+            num_matched += self.check(tiles.carve_grid(img, info_config), self.reference_grid,
+                                      info_config, name)
+            num_matched += self.check(tiles.carve_rack(img, info_config), self.reference_rack,
+                                      info_config, name)
+
+        self.assertGreater(num_matched, len(images))
+
+
+    def test_references(self):
+        # Each reference matches itself and nothing else.
+        for reference in [self.reference_grid, self.reference_rack]:
+            self.assertEqual(tiles.match_tiles(reference.tiles, reference), list(reference.letters))
+
+
+    def test_threshold(self):
+        # Eight by eight tiles: limit is 100*192 summed squared differences.
+        reference = tiles.Reference(['Ab', 'Bb'], ['a', 'b'],
+                                    np.stack([np.zeros((8, 8, 3), dtype=np.uint8),
+                                              np.full((8, 8, 3), 200, dtype=np.uint8)]))
+
+        tile = np.zeros((8, 8, 3), dtype=np.uint8)
+        tile.flat[:78] = [16]*74 + [15, 5, 2, 1]
+        self.assertEqual(np.sum(tile.astype(np.int64)**2), 19199)
+        self.assertEqual(tiles.match_tile_letter(tile, reference), 'a')
+
+        tile.flat[:78] = [16]*75 + [0, 0, 0]
+        self.assertEqual(np.sum(tile.astype(np.int64)**2), 19200)
+        with self.assertRaises(Exception):
+            tiles.match_tile_letter(tile, reference)
+
+
+    def test_cascade(self):
+        # Tiles near references, some just under and some just over the threshold.  The cascade
+        # must agree with comparing every pair in full, with and without a mask.
+        rng = np.random.RandomState(1234)
+        reference = tiles.Reference(['Ab', 'Bb', 'Cb', 'Db'], ['a', 'b', 'c', None],
+                                    rng.randint(0, 256, size=(4, 16, 16, 3)).astype(np.uint8))
+
+        mask = np.ones((16, 16), dtype=bool)
+        mask[:3, 10:] = False
+        mask.flags.writeable = False
+
+        masked = reference._replace(tiles=reference.tiles * mask[:, :, np.newaxis].astype(np.uint8))
+
+        for ref, m in [(reference, None), (masked, mask)]:
+            for k in range(200):
+                r = rng.randint(4)
+                noise = rng.randint(-15, 16, size=(16, 16, 3)) * (rng.rand() < 0.5)
+                noise += rng.randint(-10, 11, size=(16, 16, 3))
+                tile = np.clip(ref.tiles[r].astype(np.int64) + noise, 0, 255).astype(np.uint8)
+
+                if m is not None:
+                    tile[~m] = rng.randint(0, 256, size=(np.sum(~m), 3))
+
+                distances = tiles.tile_distances(tile, ref, m)[0]
+                if np.sum(distances < 10**2) == 1:
+                    self.assertEqual(tiles.match_tile_letter(tile, ref, m),
+                                     ref.letters[int(np.argmin(distances))])
+                else:
+                    with self.assertRaises(Exception):
+                        tiles.match_tile_letter(tile, ref, m)
+
+
+    def test_tile_shape(self):
+        with self.assertRaises(Exception):
+            tiles.match_tiles(np.zeros((1, 7, 7, 3), dtype=np.uint8), self.reference_grid)
+
+
+
+class TestCarveView(unittest.TestCase):
+    def setUp(self):
+        rng = np.random.RandomState(1234)
+        self.img = rng.randint(0, 256, size=(40, 50, 3)).astype(np.uint8)
+        self.info = {'dx': 6, 'i0': 3, 'j0': 2, 'num_x': 5, 'num_y': 4}
+
+
+    def test_slices(self):
+        img, info = self.img, self.info
+        view = tiles.carve_view(img, info)
+
+        self.assertEqual(view.shape, (4, 5, 6, 6, 3))
+        for jj in range(4):
+            for ii in range(5):
+                j, i = 2 + 6*jj, 3 + 6*ii
+                self.assertEqual(view[jj, ii].tolist(), img[j:j+6, i:i+6].tolist())
+
+        # A view of the image, not a copy, and not writeable.
+        self.assertTrue(np.may_share_memory(view, img))
+        with self.assertRaises(ValueError):
+            view[0, 0, 0, 0, 0] = 1
+
+        img[2, 3, 0] = 255 - img[2, 3, 0]
+        self.assertEqual(view[0, 0, 0, 0, 0], img[2, 3, 0])
+
+
+    def test_bounds(self):
+        img = self.img
+
+        # Tiles up to the last row and column.
+        view = tiles.carve_view(img, dict(self.info, i0=20, j0=16))
+        self.assertEqual(view[-1, -1].tolist(), img[-6:, -6:].tolist())
+
+        for change in [{'i0': 21, 'j0': 16}, {'i0': 20, 'j0': 17}, {'i0': -1}, {'j0': -1},
+                       {'dx': 0}, {'num_x': 0}, {'num_y': -1}]:
+            with self.assertRaises(Exception, msg=str(change)):
+                tiles.carve_view(img, dict(self.info, **change))
+
+        with self.assertRaises(Exception):
+            tiles.carve_view(img[:, :, 0], self.info)
+
+
+    def test_screenshot(self):
+        info_config, images = screenshots()
+        fname, img = images[0]
+
+        dx = info_config['grid_parameters']['dx']
+        self.assertEqual(tiles.carve_grid(img, info_config).shape, (15, 15, dx, dx, 3))
+
+        dx = info_config['rack_parameters']['dx']
+        self.assertEqual(tiles.carve_rack(img, info_config).shape, (1, 7, dx, dx, 3))
+
+
+    def test_pitch(self):
+        # Solid tiles 9 pixels apart, resampled to 6 pixels.  Away from the edges each keeps its
+        # colour.
+        rng = np.random.RandomState(1234)
+        colours = rng.randint(0, 256, size=(4, 5, 3)).astype(np.uint8)
+        img = np.zeros((40, 50, 3), dtype=np.uint8)
+        img[1:37, 2:47] = np.repeat(np.repeat(colours, 9, axis=0), 9, axis=1)
+
+        info = dict(self.info, i0=2, j0=1, pitch=9.)
+        view = tiles.carve_view(img, info)
+
+        self.assertEqual(view.shape, (4, 5, 6, 6, 3))
+        self.assertEqual(view[:, :, 1:-1, 1:-1].tolist(),
+                         np.tile(colours[:, :, np.newaxis, np.newaxis], (1, 1, 4, 4, 1)).tolist())
+
+        with self.assertRaises(ValueError):
+            view[0, 0, 0, 0, 0] = 1
+
+        # Pitch the same as dx is a plain view.
+        self.assertTrue(np.may_share_memory(tiles.carve_view(img, dict(info, pitch=6)), img))
+
+        for change in [{'i0': 6}, {'j0': 5}, {'pitch': 0}]:
+            with self.assertRaises(Exception, msg=str(change)):
+                tiles.carve_view(img, dict(info, **change))
+
+
+class TestCalibrate(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.reference_grid, cls.reference_rack = tiles.load_reference_tiles()
+
+
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+        self.fname_cache = os.path.join(self.path, 'geometry.json')
+
+        self.geometry = dict(tiles._geometry)
+        tiles._geometry.clear()
+
+
+    def tearDown(self):
+        tiles._geometry.clear()
+        tiles._geometry.update(self.geometry)
+
+        shutil.rmtree(self.path)
+
+
+    def parse(self, img, info_config):
+        return tiles.parse_game_letters(img, self.reference_grid, self.reference_rack, info_config)
+
+
+    def test_config_scale(self):
+        info_config, images = screenshots()
+        fname, img = images[0]
+
+        info = tiles.calibrate_geometry(img, info_config, self.reference_grid, self.reference_rack)
+        self.assertEqual(info['grid_parameters'], info_config['grid_parameters'])
+        self.assertEqual(info['rack_parameters'], info_config['rack_parameters'])
+
+
+    def test_other_scales(self):
+        info_config, images = screenshots()
+        fname, img = images[0]
+        expected = self.parse(img, info_config)
+
+        for scale in [0.75, 1.5]:
+            img_scaled = rescale(img, scale)
+            info = tiles.calibrate_geometry(img_scaled, info_config, self.reference_grid,
+                                            self.reference_rack)
+
+            # Tiles at the reference size, pitch at the screenshot's scale.
+            for key in ['grid_parameters', 'rack_parameters']:
+                self.assertEqual(info[key]['dx'], info_config[key]['dx'])
+                self.assertAlmostEqual(info[key]['pitch'] / info[key]['dx'], scale, places=2)
+
+            self.assertEqual(self.parse(img_scaled, info), expected, scale)
+
+
+    def test_scaled_reference(self):
+        info_config, images = screenshots()
+        mask = tiles.tile_mask(self.reference_grid.tiles.shape[1], info_config)
+        info = info_config['grid_parameters']
+
+        reference, m = tiles.scaled_reference(self.reference_grid, info, mask)
+        self.assertIs(reference, self.reference_grid)
+        self.assertIs(m, mask)
+
+        # Cached, edges masked out.
+        reference, m = tiles.scaled_reference(self.reference_grid, dict(info, pitch=36.), mask)
+        self.assertIs(tiles.scaled_reference(self.reference_grid, dict(info, pitch=36.), mask)[0],
+                      reference)
+        self.assertEqual(reference.tiles.shape, self.reference_grid.tiles.shape)
+        self.assertFalse(m[:, 0].any() or m[-1].any())
+        self.assertTrue(np.all(m <= mask))
+        self.assertFalse(reference.tiles[:, ~m].any())
+
+
+    def test_cache(self):
+        info_config, images = screenshots()
+        fname, img = images[0]
+
+        # Config size is used as is, not cached.
+        info = tiles.calibrated_config(img, info_config, self.reference_grid, self.reference_rack,
+                                       fname_cache=self.fname_cache)
+        self.assertEqual(info['grid_parameters'], info_config['grid_parameters'])
+        self.assertFalse(os.path.isfile(self.fname_cache))
+
+        # Another size is calibrated once and cached, next to what the file held.
+        tiles.write_geometry(self.fname_cache, {'1x1': {'grid_parameters': {}}, '2x2': None})
+        self.assertEqual(tiles.read_geometry(self.fname_cache), {'1x1': {'grid_parameters': {}}})
+
+        img_cropped = img[15:]
+        key = tiles.image_key(img_cropped.shape)
+        info = tiles.calibrated_config(img_cropped, info_config, self.reference_grid,
+                                       self.reference_rack, fname_cache=self.fname_cache)
+        self.assertEqual(info['grid_parameters']['j0'], info_config['grid_parameters']['j0'] - 15)
+
+        cache = tiles.read_geometry(self.fname_cache)
+        self.assertEqual(sorted(cache), ['1x1', key])
+        self.assertEqual(cache[key]['grid_parameters'], info['grid_parameters'])
+        self.assertEqual(os.listdir(self.path), ['geometry.json'])
+
+        # Later runs read the cache.
+        tiles._geometry.clear()
+        self.assertEqual(tiles.calibrated_config(img_cropped, {}, fname_cache=self.fname_cache),
+                         dict(cache[key]))
+
+        # Sizes failed elsewhere.
+        tiles.seed_geometry({'3x3': None})
+        with self.assertRaises(Exception):
+            tiles.calibrated_config(np.zeros((3, 3, 3), dtype=np.uint8), info_config)
+
+
+
+class TestReferenceBundle(unittest.TestCase):
+    def setUp(self):
+        # Package with a copy of the tile images.
+        self.path = tempfile.mkdtemp()
+        shutil.copytree(os.path.join(_path_data, 'tiles'), os.path.join(self.path, 'data', 'tiles'))
+
+        self.path_tiles = os.path.join(self.path, 'data', 'tiles')
+        self.fname_bundle = os.path.join(self.path, 'cache', 'tiles_reference.npy')
+
+        self.expected = tiles.read_reference_tiles(self.path_tiles)
+
+
+    def tearDown(self):
+        shutil.rmtree(self.path)
+
+
+    def check(self, references):
+        for reference, expected in zip(references, self.expected):
+            self.assertEqual(reference.labels, expected.labels)
+            self.assertEqual(reference.letters, expected.letters)
+            self.assertEqual(reference.tiles.tolist(), expected.tiles.tolist())
+
+
+    def load(self):
+        return tiles.load_reference_tiles(self.path, self.fname_bundle)
+
+
+    def test_round_trip(self):
+        data = tiles.compile_reference_tiles(*self.expected)
+        self.assertEqual(data.dtype, np.uint8)
+        self.check(tiles._split_reference(data))
+
+
+    def test_load(self):
+        self.check(self.load())
+        self.assertTrue(os.path.isfile(self.fname_bundle))
+        self.assertEqual(os.listdir(os.path.dirname(self.fname_bundle)), ['tiles_reference.npy'])
+
+        # Read back, not rebuilt.
+        os.utime(self.fname_bundle, (1, os.path.getmtime(self.fname_bundle) + 10))
+        time_bundle = os.path.getmtime(self.fname_bundle)
+        self.check(self.load())
+        self.assertEqual(os.path.getmtime(self.fname_bundle), time_bundle)
+
+        # Nothing written into the package.
+        self.assertEqual(sorted(os.listdir(self.path)), ['cache', 'data'])
+        self.assertFalse(glob.glob(os.path.join(self.path_tiles, '*.npy')))
+
+
+    def test_stale(self):
+        self.load()
+        time_bundle = os.path.getmtime(self.fname_bundle) - 100
+        os.utime(self.fname_bundle, (1, time_bundle))
+
+        # A tile image newer than the bundle.
+        fname = sorted(glob.glob(os.path.join(self.path_tiles, 'tile_grid_*.png')))[0]
+        os.utime(fname, (1, time_bundle + 10))
+        self.check(self.load())
+        self.assertGreater(os.path.getmtime(self.fname_bundle), time_bundle + 10)
+
+        # A bundle with a tile missing.
+        reference_grid, reference_rack = self.expected
+        fewer = tiles.Reference(reference_grid.labels[1:], reference_grid.letters[1:],
+                                reference_grid.tiles[1:])
+        np.save(self.fname_bundle, tiles.compile_reference_tiles(fewer, reference_rack))
+        os.utime(self.fname_bundle, (1, time_bundle + 20))
+
+        self.check(self.load())
+        self.check(tiles._split_reference(np.load(self.fname_bundle)))
+
+
+    def test_unwritable(self):
+        # Cache folder is a file.
+        with open(os.path.join(self.path, 'cache'), 'w') as fo:
+            fo.write('')
+
+        self.check(self.load())
+        self.assertFalse(os.path.isdir(os.path.join(self.path, 'cache')))
+
+
+
+class TestTileMask(unittest.TestCase):
+    def test_baseline(self):
+        info_config, images = screenshots()
+        fname, img = images[0]
+
+        for carved in [tiles.carve_grid(img, info_config), tiles.carve_rack(img, info_config)]:
+            expected = [[baseline_apply_mask(t, info_config) for t in row] for row in carved]
+
+            # Whole stack in one go, or a tile at a time.
+            self.assertEqual(tiles.apply_mask(carved, info_config).tolist(),
+                             np.asarray(expected).tolist())
+            self.assertEqual(tiles.apply_mask(carved[0, 1], info_config).tolist(),
+                             expected[0][1].tolist())
+
+
+    def test_cached(self):
+        info_config, images = screenshots()
+        dx = info_config['rack_parameters']['dx']
+
+        mask = tiles.tile_mask(dx, info_config)
+        self.assertIs(tiles.tile_mask(dx, info_config), mask)
+        with self.assertRaises(ValueError):
+            mask[0, 0] = True
+
+        # Symmetric about both axes.
+        self.assertEqual(mask.tolist(), mask[::-1, ::-1].tolist())
+
+        # Other mask entries compile another mask: two pixels in from each end of the top and
+        # bottom rows.
+        other = tiles.tile_mask(dx, dict(info_config, rack_tile_mask=[[dx-2, 0]]))
+        self.assertIsNot(other, mask)
+        self.assertEqual(np.flatnonzero(~other).tolist(),
+                         [0, 1, dx-2, dx-1] + [dx*(dx-1) + k for k in [0, 1, dx-2, dx-1]])
+
+
+    def test_invalid_size(self):
+        info_config, images = screenshots()
+
+        with self.assertRaises(Exception):
+            tiles.apply_mask(np.zeros((5, 5, 3), dtype=np.uint8), info_config)
+
+
+
+class TestSumSquaredDifferences(unittest.TestCase):
+    def check(self, size):
+        rng = np.random.RandomState(1234)
+        a = rng.randint(0, 256, size=(5, size)).astype(np.uint8)
+        b = rng.randint(0, 256, size=(5, size)).astype(np.uint8)
+
+        expected = np.sum((a.astype(np.int64) - b.astype(np.int64))**2, axis=1)
+        self.assertEqual(tiles.sum_squared_differences(a, b).tolist(), expected.tolist())
+
+
+    def test_small(self):
+        self.check(48*48*3)
+
+
+    def test_extremes(self):
+        a = np.zeros((1, 1000), dtype=np.uint8)
+        b = np.full((1, 1000), 255, dtype=np.uint8)
+        self.assertEqual(tiles.sum_squared_differences(a, b).tolist(), [1000*255**2])
+        self.assertEqual(tiles.sum_squared_differences(b, a).tolist(), [1000*255**2])
+
+
+    def test_overflow(self):
+        # Large enough that a full sum overflows int32.
+        size = tiles._max_int32 // 255**2 + 1
+        a = np.zeros((1, size), dtype=np.uint8)
+        b = np.full((1, size), 255, dtype=np.uint8)
+        self.assertEqual(tiles.sum_squared_differences(a, b).tolist(), [size*255**2])
+
+
+
+class TestTileDistances(unittest.TestCase):
+    def test_direct(self):
+        rng = np.random.RandomState(1234)
+        reference = tiles.Reference(['a', 'b', 'c'], ['a', 'b', 'c'],
+                                    rng.randint(0, 256, size=(3, 6, 6, 3)).astype(np.uint8))
+        tiles_test = rng.randint(0, 256, size=(4, 6, 6, 3)).astype(np.uint8)
+
+        expected = [[np.mean((t.astype(np.float64) - r)**2) for r in reference.tiles]
+                    for t in tiles_test]
+        self.assertTrue(np.allclose(tiles.tile_distances(tiles_test, reference), expected))
+
+
+#------------------------------------------------
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
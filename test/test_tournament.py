@@ -0,0 +1,133 @@
+from __future__ import division, print_function, unicode_literals
+
+import unittest
+import os
+import shutil
+import tempfile
+
+import numpy as np
+
+import context
+
+import selfplay_manager
+import tournament_manager
+
+from tournament_manager import ResultLog
+
+
+#------------------------------------------------
+
+def fake_result(game_id):
+    result = {'first': game_id % 2, 'score_0': 300 + game_id, 'score_1': 310 - game_id,
+              'bingos_0': game_id % 3, 'bingos_1': 1, 'turns': 20 + game_id}
+    for phase in selfplay_manager.phases:
+        result['time_%s' % phase] = 0.01
+
+    return result
+
+
+
+class TestResultLog(unittest.TestCase):
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+        self.names_policy = ['equity', 'score']
+
+
+    def tearDown(self):
+        shutil.rmtree(self.path)
+
+
+    def test_chunks(self):
+        log = ResultLog(self.path, self.names_policy, 1234, chunk_size=4, flush_interval=1000.)
+        for game_id in [5, 3, 0, 1, 2, 4, 6]:
+            log.append(game_id, fake_result(game_id))
+
+        # One full chunk written, three results buffered.
+        self.assertEqual(len(log._chunk_files()), 1)
+        self.assertEqual(log.completed_ids(), set(range(7)))
+
+        log.flush()
+        self.assertEqual(len(log._chunk_files()), 2)
+
+        results = log.read()
+        self.assertEqual(results['game_id'].tolist(), list(range(7)))
+        self.assertEqual(results['score_0'].tolist(), [300 + k for k in range(7)])
+
+
+    def test_interrupted(self):
+        # Killed before the chunk filled and without a final flush.
+        log = ResultLog(self.path, self.names_policy, 1234, chunk_size=1000, flush_interval=0.)
+        for game_id in range(3):
+            log.append(game_id, fake_result(game_id))
+        del log
+
+        log = ResultLog(self.path, self.names_policy)
+        self.assertEqual(log.seed, (1234,))
+        self.assertEqual(log.completed_ids(), set(range(3)))
+
+        for game_id in range(3, 5):
+            log.append(game_id, fake_result(game_id))
+        log.flush()
+
+        self.assertEqual(log.read()['game_id'].tolist(), list(range(5)))
+
+
+    def test_buffered_until_interval(self):
+        log = ResultLog(self.path, self.names_policy, 1234, chunk_size=1000, flush_interval=1000.)
+        log.append(0, fake_result(0))
+
+        self.assertEqual(log._chunk_files(), [])
+        self.assertEqual(len(ResultLog(self.path, self.names_policy, 1234).completed_ids()), 0)
+
+
+    def test_different_tournament(self):
+        log = ResultLog(self.path, self.names_policy, 1234, flush_interval=0.)
+        log.append(0, fake_result(0))
+
+        with self.assertRaises(Exception):
+            ResultLog(self.path, self.names_policy, 99)
+
+        with self.assertRaises(Exception):
+            ResultLog(self.path, ['score', 'score'], 1234)
+
+
+
+class TestTournament(unittest.TestCase):
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+
+
+    def tearDown(self):
+        shutil.rmtree(self.path)
+
+
+    def test_resume(self):
+        names_policy = ['score', 'score']
+        path_full = os.path.join(self.path, 'full')
+        path_resumed = os.path.join(self.path, 'resumed')
+
+        tournament_manager.run_tournament(path_full, names_policy, 4, seed=1234, processes=2)
+        full = ResultLog(path_full, names_policy).read()
+
+        # An interrupted run that logged games 0 and 1 only.
+        log = ResultLog(path_resumed, names_policy, 1234, flush_interval=0.)
+        for game_id in [0, 1]:
+            log.append(game_id, dict((name, full[name][game_id])
+                                     for name in tournament_manager.columns[1:]))
+        del log
+
+        summary = tournament_manager.run_tournament(path_resumed, names_policy, 4, processes=2,
+                                                   flush_interval=1000.)
+        resumed = ResultLog(path_resumed, names_policy).read()
+
+        self.assertEqual(summary['games'], 4)
+        for name in ['game_id', 'first', 'score_0', 'score_1', 'bingos_0', 'bingos_1', 'turns']:
+            self.assertEqual(resumed[name].tolist(), full[name].tolist(), name)
+
+        # Only games 2 and 3 were played again.
+        self.assertEqual(len(os.listdir(path_resumed)), 3)
+
+
+#------------------------------------------------
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
@@ -0,0 +1,164 @@
+from __future__ import division, print_function, unicode_literals
+
+import unittest
+
+import numpy as np
+
+import context
+
+import tiles
+import tracker_manager
+
+from test_tiles import screenshots
+
+
+#------------------------------------------------
+
+class TestGameTracker(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.reference_grid, cls.reference_rack = tiles.load_reference_tiles()
+        cls.info_config, images = screenshots()
+
+        # Screenshots that parse.
+        cls.images = []
+        for fname, img in images:
+            try:
+                cls.images.append( (img, cls.parse(img)) )
+            except Exception:
+                pass
+
+
+    @classmethod
+    def parse(cls, img):
+        return tiles.parse_game_letters(img, cls.reference_grid, cls.reference_rack, cls.info_config)
+
+
+    def setUp(self):
+        self.tracker = tracker_manager.GameTracker(self.reference_grid, self.reference_rack,
+                                                   self.info_config)
+        self.num_squares = self.info_config['grid_parameters']['num_x'] * \
+                           self.info_config['grid_parameters']['num_y']
+
+
+    def square(self, img, ii, jj):
+        """
+        Pixels of grid square ii across, jj down.
+        """
+        info = self.info_config['grid_parameters']
+        dx, i0, j0 = info['dx'], info['i0'], info['j0']
+
+        return img[j0 + jj*dx:j0 + (jj+1)*dx, i0 + ii*dx:i0 + (ii+1)*dx]
+
+
+    def play(self, img, letters_grid, letter):
+        """
+        Copy of the screenshot with a reference tile pasted onto an empty square.
+        """
+        played = set((i-1, j-1) for (i, j), L in letters_grid)
+        empty = [(ii, jj) for jj in range(15) for ii in range(15) if (ii, jj) not in played]
+        ii, jj = empty[len(empty) // 2]
+
+        img = np.array(img)
+        self.square(img, ii, jj)[...] = self.reference_grid.tiles[
+            self.reference_grid.letters.index(letter)]
+
+        return img
+
+
+    def test_first_update(self):
+        self.assertTrue(self.images)
+        self.assertEqual(self.tracker.letters_grid, [])
+
+        img, expected = self.images[0]
+        self.assertEqual(self.tracker.update(img), expected)
+        self.assertEqual(self.tracker.num_changed, self.num_squares)
+
+        # Same screenshot again, nothing to match.
+        self.assertEqual(self.tracker.update(np.array(img)), expected)
+        self.assertEqual(self.tracker.num_changed, 0)
+        self.assertEqual(self.tracker.letters_rack, expected[1])
+
+
+    def test_next_move(self):
+        img, expected = self.images[0]
+        self.tracker.update(img)
+
+        img_next = self.play(img, expected[0], 'q')
+        letters_grid, letters_rack = self.tracker.update(img_next)
+
+        self.assertEqual(self.tracker.num_changed, 1)
+        self.assertEqual(len(letters_grid), len(expected[0]) + 1)
+        self.assertEqual((letters_grid, letters_rack), self.parse(img_next))
+
+
+    def test_successive(self):
+        # Every screenshot in turn, as if one game.
+        for img, expected in self.images:
+            self.assertEqual(self.tracker.update(img), expected)
+
+
+    def test_masked_pixels(self):
+        img, expected = self.images[0]
+        self.tracker.update(img)
+
+        # Change only pixels the tile mask leaves out.
+        dx = self.info_config['grid_parameters']['dx']
+        mask = tiles.tile_mask(dx, self.info_config)
+        self.assertFalse(mask.all())
+
+        img_next = np.array(img)
+        square = self.square(img_next, 7, 7)
+        square[~mask] = 255 - square[~mask]
+
+        self.assertEqual(self.tracker.update(img_next), expected)
+        self.assertEqual(self.tracker.num_changed, 0)
+
+
+    def test_failed_update(self):
+        img, expected = self.images[0]
+        self.tracker.update(img)
+
+        # A square matching no reference tile, state is kept.
+        img_bad = np.array(img)
+        rng = np.random.RandomState(1234)
+        square = self.square(img_bad, 7, 7)
+        square[...] = rng.randint(0, 256, size=square.shape)
+
+        with self.assertRaises(Exception):
+            self.tracker.update(img_bad)
+
+        self.assertEqual(self.tracker.update(img), expected)
+        self.assertEqual(self.tracker.num_changed, 0)
+
+
+    def test_reset(self):
+        img, expected = self.images[0]
+        self.tracker.update(img)
+
+        self.tracker.reset()
+        self.assertEqual(self.tracker.letters_grid, [])
+        self.assertEqual(self.tracker.letters_rack, '')
+
+        self.assertEqual(self.tracker.update(img), expected)
+        self.assertEqual(self.tracker.num_changed, self.num_squares)
+
+
+    def test_grid_size(self):
+        # Fewer squares, e.g. another config: everything is parsed again.
+        img, expected = self.images[0]
+        self.tracker.update(img)
+
+        info_config = dict(self.info_config)
+        info_config['grid_parameters'] = dict(info_config['grid_parameters'], num_x=10, num_y=10)
+        self.tracker.info_config = info_config
+
+        letters_grid, letters_rack = self.tracker.update(img)
+        self.assertEqual(self.tracker.num_changed, 100)
+        self.assertEqual(letters_grid, [(ij, L) for ij, L in expected[0]
+                                        if ij[0] <= 10 and ij[1] <= 10])
+
+
+#------------------------------------------------
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
@@ -0,0 +1,158 @@
+from __future__ import division, print_function, unicode_literals
+
+import unittest
+
+import numpy as np
+
+import context
+
+import leave_manager
+import train_leaves
+
+from bag_manager import alphabet
+
+
+#------------------------------------------------
+
+rack_size = 7
+
+
+def random_leaves(rng, num):
+    """
+    Letter counts of num random leaves, 0 to 6 tiles each from a few letters.
+    """
+    letters = [alphabet.index(L) for L in 'aeqsu_']
+
+    counts = np.zeros((num, len(alphabet)), dtype=np.int32)
+    for row in counts:
+        for k in rng.randint(len(letters), size=rng.randint(rack_size)):
+            row[letters[k]] += 1
+
+    return counts
+
+
+
+def normal_equations(counts, y):
+    X = train_leaves.leave_features(counts, rack_size)
+    return np.dot(X.T, X), np.dot(X.T, y)
+
+
+
+class TestFitLeaves(unittest.TestCase):
+    def setUp(self):
+        rng = np.random.RandomState(1234)
+
+        self.values = np.zeros((len(alphabet), rack_size+1))
+        self.values[:, 1:] = rng.normal(0., 5., size=(len(alphabet), rack_size))
+        self.truth = leave_manager.LeaveTable(self.values, rack_size)
+
+        self.counts = random_leaves(rng, 2000)
+        self.y = 30. + self.truth.value_counts(self.counts)
+
+        self.table_prior = leave_manager.LeaveTable(np.zeros_like(self.values), rack_size)
+        self.seen = np.diag(normal_equations(self.counts, self.y)[0])[1:].reshape(-1, rack_size) > 0
+
+
+    def test_features(self):
+        X = train_leaves.leave_features(self.counts[:50], rack_size)
+
+        self.assertTrue(np.all(X[:, 0] == 1.))
+        self.assertEqual(X[:, 1:].sum(axis=1).tolist(), np.sum(self.counts[:50] > 0, axis=1).tolist())
+        self.assertTrue(np.allclose(np.dot(X[:, 1:], self.values[:, 1:].ravel()),
+                                    self.truth.value_counts(self.counts[:50])))
+
+
+    def test_exact(self):
+        # No pull at all: exact data is fitted exactly.
+        XtX, Xty = normal_equations(self.counts, self.y)
+        table, base = train_leaves.fit_leaves(XtX, Xty, self.table_prior, prior=0., ridge=0.)
+
+        self.assertAlmostEqual(base, 30.)
+        self.assertTrue(np.allclose(table.values[:, 1:][self.seen], self.values[:, 1:][self.seen]))
+
+        # Counts never seen keep their prior value.
+        self.assertTrue(np.allclose(table.values[:, 1:][~self.seen], 0.))
+
+
+    def test_penalized(self):
+        # Same as least squares with extra rows pulling each value towards the prior.
+        rng = np.random.RandomState(5)
+        y = self.y + rng.normal(0., 3., size=len(self.y))
+        XtX, Xty = normal_equations(self.counts, y)
+
+        prior_values = np.zeros_like(self.values)
+        prior_values[:, 1:] = rng.normal(0., 5., size=(len(alphabet), rack_size))
+        table_prior = leave_manager.LeaveTable(prior_values, rack_size)
+
+        for prior, ridge in [(1., 0.), (0.5, 1.), (3., 10.)]:
+            table, base = train_leaves.fit_leaves(XtX, Xty, table_prior, prior, ridge)
+
+            X = train_leaves.leave_features(self.counts, rack_size)
+            weight = np.sqrt(prior*np.diag(np.dot(X.T, X))[1:] + ridge)
+            A = np.vstack([X, np.hstack([np.zeros((len(weight), 1)), np.diag(weight)])])
+            b = np.concatenate([y, weight * prior_values[:, 1:].ravel()])
+
+            if ridge == 0.:
+                # Unseen values are pinned to the prior rather than left free.
+                keep = weight > 0
+                A = A[np.concatenate([np.ones(len(X), dtype=bool), keep])]
+                b = b[np.concatenate([np.ones(len(X), dtype=bool), keep])]
+
+            w = np.linalg.lstsq(A, b, rcond=None)[0]
+
+            self.assertAlmostEqual(base, w[0])
+            self.assertTrue(np.allclose(table.values[:, 1:][self.seen],
+                                        w[1:].reshape(-1, rack_size)[self.seen]))
+            self.assertTrue(np.allclose(table.values[:, 1:][~self.seen],
+                                        prior_values[:, 1:][~self.seen]))
+
+
+    def test_half_way(self):
+        # prior=1, ridge=0: each value is half way between its prior and its fit with the other
+        # values held at theirs.
+        rng = np.random.RandomState(6)
+        y = self.y + rng.normal(0., 3., size=len(self.y))
+        XtX, Xty = normal_equations(self.counts, y)
+
+        prior_values = np.zeros_like(self.values)
+        prior_values[:, 1:] = 10.
+        table, base = train_leaves.fit_leaves(XtX, Xty,
+                                              leave_manager.LeaveTable(prior_values, rack_size),
+                                              prior=1., ridge=0.)
+
+        w = np.concatenate([[base], table.values[:, 1:].ravel()])
+        for j in np.flatnonzero(np.diag(XtX))[1:]:
+            fit = (Xty[j] - np.dot(XtX[j], w) + XtX[j, j]*w[j]) / XtX[j, j]
+            self.assertAlmostEqual(w[j], (fit + 10.) / 2.)
+
+
+    def test_ridge_slows_rare_values(self):
+        XtX, Xty = normal_equations(self.counts, self.y)
+
+        table_a, base = train_leaves.fit_leaves(XtX, Xty, self.table_prior, prior=1., ridge=0.)
+        table_b, base = train_leaves.fit_leaves(XtX, Xty, self.table_prior, prior=1., ridge=100.)
+
+        # Pulled harder towards the prior of zero.
+        self.assertLess(np.abs(table_b.values[:, 1:][self.seen]).sum(),
+                        np.abs(table_a.values[:, 1:][self.seen]).sum())
+
+
+
+class TestGameSamples(unittest.TestCase):
+    def test_next_turn(self):
+        table = leave_manager.LeaveTable(np.zeros((len(alphabet), rack_size+1)), rack_size)
+
+        # (player, leave, score, tiles in bag)
+        record = [(0, 'aeq', 20, 80), (1, 'st', 30, 70), (0, 'q', 25, 60), (1, 'e', 40, 3),
+                  (0, '', 12, 0), (1, 'x', 8, 0)]
+
+        counts, targets = train_leaves.game_samples(record, table)
+
+        # Turn 3 cannot refill its rack, the last two have no next turn.
+        self.assertEqual(targets.tolist(), [25., 40., 12.])
+        self.assertEqual(counts.tolist(), [table.counts(L).tolist() for L in ['aeq', 'st', 'q']])
+
+
+#------------------------------------------------
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
@@ -0,0 +1,90 @@
+from __future__ import division, print_function, unicode_literals
+
+import unittest
+import os
+import shutil
+import tempfile
+
+import numpy as np
+
+import context
+
+import trie_manager
+
+
+#------------------------------------------------
+
+words = ['ae', 'as', 'at', 'es', 'ta', 'ate', 'eat', 'eta', 'sat', 'sea', 'set', 'tae', 'tas',
+         'tat', 'tea', 'east', 'eats', 'seat', 'teas', 'teat', 'tease', 'teases', 'zyzzyva']
+
+others = ['', 'a', 'e', 'aa', 'sea_', 'teat_', 'tease', 'teaser', 'zyzzyvas', 'seats', 'x']
+
+
+class TestArrayDawg(unittest.TestCase):
+    def setUp(self):
+        self.daggad = trie_manager.Daggad()
+        self.daggad.insert_words(list(words))
+
+        self.data = trie_manager.compile_arrays(self.daggad)
+
+
+    def test_search(self):
+        for cache_size in [1, 4, 100000]:
+            dawg = trie_manager.ArrayDawg(self.data, cache_size)
+
+            self.assertEqual(dawg.search_words(words), [])
+            for word in others:
+                self.assertEqual(dawg.search(word), self.daggad.search(word), word)
+
+
+    def test_same_graph(self):
+        dawg = trie_manager.ArrayDawg(self.data)
+
+        # Walk both graphs together.
+        stack = [(self.daggad.root, dawg.root)]
+        seen = set()
+        while stack:
+            a, b = stack.pop()
+            if b.id in seen:
+                continue
+            seen.add(b.id)
+
+            self.assertEqual(a.final, b.final)
+            self.assertEqual(sorted(a.edges.keys()), sorted(b.edges.keys()))
+            for L in a.edges:
+                stack.append( (a.edges[L], b.edges[L]) )
+
+        self.assertEqual(len(seen), dawg.node_count)
+
+
+    def test_cache_bound(self):
+        cache_size = 5
+        dawg = trie_manager.ArrayDawg(self.data, cache_size)
+
+        for k in range(3):
+            dawg.search_words(words)
+            self.assertLessEqual(len(dawg._nodes), cache_size)
+            self.assertLessEqual(len(dawg._nodes) + len(dawg._nodes_old), 2*cache_size)
+
+        # Recently used nodes are kept.
+        node = dawg.root.edges['t']
+        self.assertIs(dawg.root.edges['t'], node)
+
+
+    def test_memory_mapped(self):
+        path = tempfile.mkdtemp()
+        try:
+            fname = os.path.join(path, 'words.daggad.npy')
+            np.save(fname, self.data)
+
+            dawg = trie_manager.load_arrays(fname)
+            self.assertIsInstance(dawg.data, np.memmap)
+            self.assertEqual(dawg.search_words(words + ['teaser']), ['teaser'])
+            del dawg
+        finally:
+            shutil.rmtree(path)
+
+
+#------------------------------------------------
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
@@ -0,0 +1,134 @@
+from __future__ import division, print_function, unicode_literals
+
+import unittest
+import os
+import math
+
+import numpy as np
+
+import context
+
+import unseen_manager
+
+from bag_manager import alphabet
+
+_fname_letters = os.path.join(os.path.dirname(os.path.abspath(unseen_manager.__file__)),
+                              'data', 'words and letters', 'letters_zynga.yml')
+
+
+#------------------------------------------------
+
+def comb(n, k):
+    if k < 0 or k > n:
+        return 0
+    return math.factorial(n) // (math.factorial(k) * math.factorial(n - k))
+
+
+
+class TestHypergeometric(unittest.TestCase):
+    def test_pmf(self):
+        counts = [0, 1, 3, 10]
+        total, num_draw = 20, 7
+
+        pmf = unseen_manager.hypergeometric_pmf(counts, total, num_draw)
+        self.assertEqual(pmf.shape, (4, num_draw+1))
+        self.assertTrue(np.allclose(pmf.sum(axis=1), 1.))
+
+        for n, c in enumerate(counts):
+            for x in range(num_draw+1):
+                p = comb(c, x) * comb(total - c, num_draw - x) / comb(total, num_draw)
+                self.assertAlmostEqual(pmf[n, x], p)
+
+
+
+class TestUnseen(unittest.TestCase):
+    def setUp(self):
+        self.unseen = unseen_manager.Unseen(_fname_letters)
+        self.frequency = self.unseen.frequency.copy()
+        self.q = alphabet.index('q')
+
+
+    def expected(self, removed):
+        counts = self.frequency.copy()
+        for L in removed:
+            counts[alphabet.index('_' if L.isupper() else L)] -= 1
+        return counts.tolist()
+
+
+    def test_opponent_play(self):
+        self.unseen.set_rack('aeinrst')
+        self.unseen.observe_board([((8, 8), 'q'), ((9, 8), 'i'), ((10, 8), 'S')])
+
+        self.assertEqual(self.unseen.counts.tolist(), self.expected('aeinrst' + 'qiS'))
+        self.assertEqual(self.unseen.count, self.frequency.sum() - 10)
+        self.assertEqual(self.unseen.count_bag, self.unseen.count - 7)
+
+        # Every q is on the board.
+        self.assertEqual(self.unseen.prob_opponent_holds('q')[0], 0.)
+
+
+    def test_own_play(self):
+        self.unseen.set_rack('qaeinr_')
+
+        # Our singleton q and a blank go on the board, two tiles drawn.
+        self.unseen.observe_play([((8, 8), 'q'), ((9, 8), 'I'), ((10, 8), 'n')], 'aeirtt')
+
+        self.assertEqual(self.unseen.counts.tolist(), self.expected('qaeinr_' + 'tt'))
+        self.assertEqual(self.unseen.prob_opponent_holds('q')[0], 0.)
+
+        # Then an exchange puts them back.
+        self.unseen.set_rack('')
+        self.assertEqual(self.unseen.counts.tolist(), self.expected('qIn'))
+
+
+    def test_own_play_no_draw(self):
+        self.unseen.set_rack('aeq')
+        self.unseen.observe_play([((8, 8), 'q')])
+
+        self.assertEqual(self.unseen.counts.tolist(), self.expected('aeq'))
+        self.unseen.set_rack('ae')
+        self.assertEqual(self.unseen.counts.tolist(), self.expected('aeq'))
+
+
+    def test_reject(self):
+        self.unseen.set_rack('qaeinrs')
+        counts = self.unseen.counts.tolist()
+
+        # Our own q observed as though the opponent played it.
+        with self.assertRaises(Exception):
+            self.unseen.observe_board([((8, 8), 'q')])
+
+        # Letters played must be on our rack.
+        with self.assertRaises(Exception):
+            self.unseen.observe_play([((8, 8), 't')], 'qaeinrs')
+
+        # Tiles drawn must be unseen.
+        with self.assertRaises(Exception):
+            self.unseen.observe_play([((8, 8), 's')], 'qaeinrq')
+
+        self.assertEqual(self.unseen.counts.tolist(), counts)
+        self.unseen.observe_play([((8, 8), 's')], 'qaeinrs')
+        self.assertEqual(self.unseen.counts.tolist(), self.expected('qaeinrs' + 's'))
+
+
+    def test_probabilities(self):
+        self.unseen.set_rack('q')
+        self.unseen.observe_board([((8, 8), 'z')])
+
+        # Only one q and z, neither unseen.  One x of N unseen.
+        num = self.unseen.count
+        prob = self.unseen.prob_draw(3, 'qzx')
+        self.assertEqual(prob.tolist()[:2], [0., 0.])
+        self.assertAlmostEqual(prob[2], 3/num)
+
+        self.assertAlmostEqual(self.unseen.prob_opponent_holds('x')[0], 7/num)
+        self.assertAlmostEqual(self.unseen.expected_counts(7).sum(), 7.)
+
+        # Cached probabilities follow the counts.
+        self.unseen.set_rack('')
+        self.assertAlmostEqual(self.unseen.prob_draw(3, 'q')[0], 3/(num+1))
+
+
+#------------------------------------------------
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
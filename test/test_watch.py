@@ -0,0 +1,241 @@
+from __future__ import division, print_function, unicode_literals
+
+import unittest
+import os
+import json
+import shutil
+import tempfile
+
+import numpy as np
+
+import context
+
+import data_io as io
+
+import tiles
+import watch_manager
+
+from test_tiles import screenshots
+
+
+#------------------------------------------------
+# A small dictionary, so the watcher loads quickly.
+
+words = ['eat', 'tea', 'ate', 'seat', 'east', 'tease', 'rate', 'tear', 'star', 'rats', 'at', 'ta']
+
+
+
+class TestWatcher(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.reference_grid, cls.reference_rack = tiles.load_reference_tiles()
+        cls.info_config, images = screenshots()
+
+        # Screenshots that parse, and what they parse to.
+        cls.images = []
+        for fname, img in images:
+            try:
+                letters = tiles.parse_game_letters(img, cls.reference_grid, cls.reference_rack,
+                                                   cls.info_config)
+            except Exception:
+                continue
+
+            cls.images.append( (img, letters) )
+            if len(cls.images) == 2:
+                break
+
+
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+        self.path_games = os.path.join(self.path, 'games')
+        os.mkdir(self.path_games)
+
+        self.fname_words = os.path.join(self.path, 'words.txt')
+        with open(self.fname_words, 'w') as fo:
+            fo.write('\n'.join(words) + '\n')
+
+        self.fname_geometry = os.path.join(self.path, 'geometry.json')
+
+        self.geometry = dict(tiles._geometry)
+        tiles._geometry.clear()
+
+        self.watcher = self.new_watcher()
+
+
+    def tearDown(self):
+        tiles._geometry.clear()
+        tiles._geometry.update(self.geometry)
+
+        shutil.rmtree(self.path)
+
+
+    def new_watcher(self, **kwargs):
+        return watch_manager.Watcher(self.path_games, fname_words=self.fname_words,
+                                     fname_geometry=self.fname_geometry, **kwargs)
+
+
+    def drop(self, name, img, mtime=1000000000):
+        """
+        Write screenshot into the folder, with a given modification time.
+        """
+        fname = os.path.join(self.path_games, name)
+        io.write(fname, img)
+        os.utime(fname, (mtime, mtime))
+
+        return fname
+
+
+    def read_result(self, fname):
+        with open(watch_manager.Watcher.result_name(fname)) as fo:
+            return json.load(fo)
+
+
+    def check(self, record, letters):
+        letters_grid, letters_rack = letters
+        self.assertIsNone(record['error'])
+        self.assertEqual(record['board'], [[ij[0], ij[1], L] for ij, L in letters_grid])
+        self.assertEqual(record['rack'], letters_rack)
+
+
+    def test_pending(self):
+        img, letters = self.images[0]
+        fname = self.drop('game.png', img)
+        with open(os.path.join(self.path_games, 'notes.txt'), 'w') as fo:
+            fo.write('not a screenshot')
+
+        # Taken once unchanged for one poll.
+        self.assertEqual(self.watcher.poll(), [])
+
+        records = self.watcher.poll()
+        self.assertEqual([r['image'] for r in records], [fname])
+        self.assertEqual(self.watcher.poll(), [])
+
+        # Changed, again after one poll.
+        self.drop('game.png', img, mtime=1000000010)
+        self.assertEqual(self.watcher.poll(), [])
+        self.assertEqual(len(self.watcher.poll()), 1)
+
+
+    def test_result(self):
+        img, letters = self.images[0]
+        fname = self.drop('game.png', img)
+
+        self.watcher.poll()
+        record, = self.watcher.poll()
+
+        self.check(record, letters)
+        self.assertEqual(record['image_stat'], [os.path.getsize(fname), os.path.getmtime(fname)])
+        self.assertEqual(self.read_result(fname), record)
+
+        self.assertEqual(len(record['moves']), min(len(record['moves']), self.watcher.num_moves))
+        scores = [score for score, ij_letters in record['moves']]
+        self.assertEqual(scores, sorted(scores, reverse=True))
+
+        # Result replaced when the screenshot changes, and nothing else left in the folder.
+        img_next, letters_next = self.images[1]
+        self.drop('game.png', img_next, mtime=1000000010)
+
+        self.watcher.poll()
+        record, = self.watcher.poll()
+        self.check(record, letters_next)
+        self.assertEqual(self.read_result(fname), record)
+
+        self.assertEqual(sorted(os.listdir(self.path_games)), ['game.json', 'game.png'])
+
+
+    def test_restart(self):
+        img, letters = self.images[0]
+        fname = self.drop('game.png', img)
+
+        self.watcher.poll()
+        self.watcher.poll()
+
+        # Picks up where the last one left off.
+        watcher = self.new_watcher()
+        self.assertEqual(watcher.poll() + watcher.poll(), [])
+
+        self.drop('game.png', img, mtime=1000000010)
+        watcher.poll()
+        record, = watcher.poll()
+        self.check(record, letters)
+
+
+    def test_errors(self):
+        fname = os.path.join(self.path_games, 'bad.png')
+        with open(fname, 'wb') as fo:
+            fo.write(b'not an image')
+
+        self.watcher.poll()
+        record, = self.watcher.poll()
+        self.assertIsNotNone(record['error'])
+        self.assertEqual(self.read_result(fname), record)
+
+        # Not tried again until it changes.
+        self.assertEqual(self.watcher.poll(), [])
+
+
+    def test_unwritable(self):
+        img, letters = self.images[0]
+        fname = self.drop('game.png', img)
+        fname_other = self.drop('other.png', img)
+
+        # Result name taken by a folder.
+        os.mkdir(os.path.join(self.path_games, 'game.json'))
+
+        self.watcher.poll()
+        records = self.watcher.poll()
+        self.assertEqual([r['image'] for r in records], [fname_other])
+
+        self.assertEqual(self.watcher.poll(), [])
+        self.assertEqual(sorted(os.listdir(self.path_games)),
+                         ['game.json', 'game.png', 'other.json', 'other.png'])
+
+
+    def test_trackers(self):
+        img, letters = self.images[0]
+        img_other, letters_other = self.images[1]
+
+        watcher = self.new_watcher(num_trackers=2)
+
+        fname = self.drop('game.png', img)
+        fname_other = self.drop('other.png', img_other)
+        watcher.poll()
+        watcher.poll()
+
+        key = (fname, img.shape)
+        self.assertEqual(sorted(watcher._trackers), sorted([key, (fname_other, img_other.shape)]))
+
+        # Next move of one game, only its changed square is matched.
+        info = self.info_config['grid_parameters']
+        dx, i0, j0 = info['dx'], info['i0'], info['j0']
+
+        played = set((i-1, j-1) for (i, j), L in letters[0])
+        ii, jj = [(ii, jj) for jj in range(15) for ii in range(15) if (ii, jj) not in played][0]
+
+        img_next = np.array(img)
+        img_next[j0 + jj*dx:j0 + (jj+1)*dx, i0 + ii*dx:i0 + (ii+1)*dx] = \
+            self.reference_grid.tiles[self.reference_grid.letters.index('q')]
+
+        self.drop('game.png', img_next, mtime=1000000010)
+        watcher.poll()
+        record, = watcher.poll()
+
+        self.assertEqual(watcher._trackers[key].num_changed, 1)
+        self.check(record, tiles.parse_game_letters(img_next, self.reference_grid,
+                                                    self.reference_rack, self.info_config))
+
+        # Least recently used dropped, and those of removed files.
+        self.drop('third.png', img)
+        watcher.poll()
+        watcher.poll()
+        self.assertEqual(list(watcher._trackers)[0], key)
+        self.assertEqual(len(watcher._trackers), 2)
+
+        os.remove(fname)
+        watcher.poll()
+        self.assertNotIn(key, watcher._trackers)
+
+
+#------------------------------------------------
+if __name__ == '__main__':
+    unittest.main(verbosity=2)